@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.contrib.gis.admin import GISModelAdmin
-from .models import FuelPriceUpload, FuelStation
+from .models import FuelPriceUpload, FuelStation, RouteJob
 
 @admin.register(FuelPriceUpload)
 class FuelPriceUploadAdmin(admin.ModelAdmin):
@@ -97,4 +97,12 @@ class FuelStationAdmin(GISModelAdmin):
             'padding:4px 8px;border-radius:6px;">NO</span>'
         )
 
-    geocoded_status.short_description = "Geocoded"
\ No newline at end of file
+    geocoded_status.short_description = "Geocoded"
+
+
+@admin.register(RouteJob)
+class RouteJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "status", "completed_pairs", "total_pairs", "created_at", "finished_at")
+    list_filter = ("status", "created_at")
+    readonly_fields = ("created_at", "started_at", "finished_at", "completed_pairs", "total_pairs", "error_message")
+    ordering = ("-created_at",)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from app.helper import install_queue_logging
+
+        # File writes happen on a background thread instead of the request thread.
+        install_queue_logging()
@@ -0,0 +1,228 @@
+import asyncio
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from .constants import (
+    ASYNC_HTTP_MAX_CONNECTIONS,
+    CACHE_TTL,
+    FUEL_STRATEGY,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_API_KEY,
+    GEOCODE_TIMEOUT,
+    GEOCODE_URL,
+)
+from .cache_keys import snap_route_endpoints
+from .deadlines import DeadlineExceeded, raise_if_expired, stage_timeout
+from .metrics import count_upstream, timed
+from .gazetteer import gazetteer_geocode
+from .routing import RoutingUnavailable, get_routing_backend
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .services import (
+    UPSTREAM_UNAVAILABLE_ERROR,
+    GeocodingUnavailable,
+    _cache_key,
+    _plan_cache_ttls,
+    _plan_key,
+    _schedule_plan_refresh,
+    build_route_plan,
+    normalize_address,
+    with_simplified_polyline,
+)
+from .single_flight import asingle_flight
+from .tiered_cache import MISS, geocode_cache, plan_cache, route_cache
+
+# One pooled keep-alive client per event loop; httpx clients cannot be shared across loops.
+_clients = weakref.WeakKeyDictionary()
+
+
+def _client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_clients():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def ageocode_address(address: str):
+    """Async geocode_address: same cache keys, single-flight and errors."""
+    if not address:
+        return None
+
+    local = gazetteer_geocode(address)
+    if local:
+        return local
+
+    cache_key = f"geo:{normalize_address(address)}"
+    cached = await geocode_cache.aget(cache_key)
+    if cached is not MISS:
+        return cached
+
+    return await asingle_flight(
+        cache_key,
+        compute=lambda: _ageocode_remote(address, cache_key),
+        read=lambda: geocode_cache.aget(cache_key),
+    )
+
+
+async def _ageocode_remote(address: str, cache_key: str):
+    try:
+        response = await _client().get(
+            GEOCODE_URL,
+            params={
+                "q": f"{address}, USA",
+                "api_key": GEOCODE_API_KEY,
+                "limit": 1,
+            },
+            timeout=stage_timeout(GEOCODE_TIMEOUT, "geocode")
+        )
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GeocodingUnavailable(f"Geocoder returned HTTP {response.status_code}")
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            handle_error_log(e, view_name="ageocode_address", app_name=APP_NAME, extra_values={"response": response.text[:500]})
+            data = None
+
+        if not data:
+            count_upstream("geocode", "empty")
+            await geocode_cache.aset_negative(cache_key)
+            return None
+
+        count_upstream("geocode", "ok")
+        lat = float(data[0]["lat"])
+        lng = float(data[0]["lon"])
+        handle_info_log(f"Geocode API called for: {address} lat={lat}, lng={lng}", view_name="ageocode_address", app_name=APP_NAME)
+
+        await geocode_cache.aset(cache_key, (lat, lng), GEOCODE_CACHE_TTL)
+        return lat, lng
+
+    except Exception as e:
+        count_upstream("geocode", "timeout" if isinstance(e, (DeadlineExceeded, httpx.TimeoutException)) else "error")
+        raise_if_expired("geocode")
+        handle_error_log(e, view_name="ageocode_address", app_name=APP_NAME)
+        if isinstance(e, GeocodingUnavailable):
+            raise
+        raise GeocodingUnavailable(str(e)) from e
+
+
+async def afetch_route(start_lat, start_lng, end_lat, end_lng):
+    """Async fetch_route: same cache keys, single-flight and errors."""
+    start_lat, start_lng, end_lat, end_lng = snap_route_endpoints(start_lat, start_lng, end_lat, end_lng)
+    key = _cache_key("route", start_lat, start_lng, end_lat, end_lng)
+    cached = await route_cache.aget(key)
+    if cached is not MISS:
+        return cached
+
+    return await asingle_flight(
+        key,
+        compute=lambda: _afetch_route_remote(key, start_lat, start_lng, end_lat, end_lng),
+        read=lambda: route_cache.aget(key),
+    )
+
+
+async def _afetch_route_remote(key, start_lat, start_lng, end_lat, end_lng):
+    try:
+        result = await get_routing_backend().aroute(start_lat, start_lng, end_lat, end_lng, client=_client())
+        if result is None:
+            await route_cache.aset_negative(key)
+            return None
+
+        result = await sync_to_async(with_simplified_polyline)(result)
+        await route_cache.aset(key, result, CACHE_TTL)
+        return result
+    except Exception as e:
+        raise_if_expired("route")
+        handle_error_log(e, view_name="afetch_route", app_name=APP_NAME)
+        if isinstance(e, RoutingUnavailable):
+            raise
+        raise RoutingUnavailable(str(e)) from e
+
+
+async def acompute_route_plan(start_address, end_address, strategy, vehicle, response_format, key):
+    """Async compute_route_plan: caches the same results under the same TTLs."""
+    try:
+        with timed("geocode"):
+            start_geo, end_geo = await asyncio.gather(
+                ageocode_address(start_address),
+                ageocode_address(end_address),
+            )
+
+        route = None
+        if start_geo and end_geo:
+            with timed("route"):
+                route = await afetch_route(start_geo[0], start_geo[1], end_geo[0], end_geo[1])
+    except (GeocodingUnavailable, RoutingUnavailable):
+        return {"error": UPSTREAM_UNAVAILABLE_ERROR}, 503
+
+    if not start_geo:
+        result = ({"error": f"Could not geocode: {start_address}"}, 400)
+    elif not end_geo:
+        result = ({"error": f"Could not geocode: {end_address}"}, 400)
+    elif not route:
+        result = ({"error": "Route not found"}, 404)
+    else:
+        raise_if_expired("stations")
+        payload = await sync_to_async(build_route_plan)(
+            route,
+            start_geo,
+            end_geo,
+            start_address,
+            end_address,
+            strategy=strategy,
+            vehicle=vehicle,
+            response_format=response_format,
+        )
+        result = (payload, 200)
+
+    await plan_cache.aset_with_soft_ttl(key, result, *_plan_cache_ttls(result))
+    return result
+
+
+async def _afresh_plan(key):
+    cached = await plan_cache.aget_with_staleness(key)
+    return cached if cached is MISS else cached[0]
+
+
+async def aoptimize_route(
+        start_address: str,
+        end_address: str,
+        strategy: str = FUEL_STRATEGY,
+        vehicle: dict = None,
+        response_format: str = "geojson",
+    ):
+    """
+    Async counterpart of services.optimize_route, sharing its plan cache,
+    stale-while-revalidate refresh and single-flight lock. Upstream calls
+    run on the event loop; the corridor query and planning run in a worker
+    thread so the database never blocks the loop. Returns (payload, status).
+    """
+    vehicle = vehicle or {}
+    key = await sync_to_async(_plan_key)(start_address, end_address, strategy, vehicle, response_format)
+
+    cached = await plan_cache.aget_with_staleness(key)
+    if cached is not MISS:
+        result, stale = cached
+        if stale:
+            await sync_to_async(_schedule_plan_refresh)(key, start_address, end_address, strategy, vehicle, response_format)
+        return result
+
+    return await asingle_flight(
+        key,
+        compute=lambda: acompute_route_plan(start_address, end_address, strategy, vehicle, response_format, key),
+        read=lambda: _afresh_plan(key),
+    )
@@ -0,0 +1,147 @@
+import concurrent.futures
+
+from django.db import InterfaceError, OperationalError
+
+from .constants import BATCH_MAX_WORKERS, VEHICLE_FIELDS
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .routing import RoutingUnavailable
+from .services import (
+    UPSTREAM_UNAVAILABLE_ERROR,
+    GeocodingUnavailable,
+    build_route_line,
+    build_route_plan,
+    fetch_route,
+    geocode_address,
+    get_stations_near_route,
+    normalize_address,
+    simplified_polyline,
+)
+
+
+# Marks a geocode or route the upstream could not answer; its pairs fail with a 503.
+_UNAVAILABLE = object()
+# Marks a corridor lookup that failed for that route alone; its pairs fail with a 500.
+_FAILED = object()
+
+# Losing the database is not a per-pair problem: these propagate and fail the whole batch.
+_INFRASTRUCTURE_ERRORS = (InterfaceError, OperationalError)
+
+_PAIR_ERROR = "An error occurred while processing this pair."
+
+
+def _error(index, pair, message, status):
+    return {"index": index, "start": pair["start"], "end": pair["end"], "error": message, "status": status}
+
+
+def _lookup(fn, *args):
+    try:
+        return fn(*args)
+    except (GeocodingUnavailable, RoutingUnavailable):
+        return _UNAVAILABLE
+
+
+def _found(value):
+    return bool(value) and value is not _UNAVAILABLE
+
+
+def optimize_route_batch(pairs: list, max_workers: int = BATCH_MAX_WORKERS, on_result=None) -> list:
+    """
+    Plans many origin/destination pairs in one pass.
+
+    Addresses are geocoded once per distinct normalized address and routes
+    fetched once per distinct coordinate pair, both on a bounded thread
+    pool. Corridor stations are looked up once per distinct route. Returns
+    one entry per input pair, in order, with either "result" or "error".
+    on_result, when given, is called with each entry as soon as it is ready.
+    A failure that belongs to one pair or route becomes an error entry;
+    losing the database, or an error raised by on_result, propagates.
+    """
+    addresses = {}
+    for pair in pairs:
+        for address in (pair["start"], pair["end"]):
+            addresses.setdefault(normalize_address(address), address)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        geos = dict(zip(addresses, executor.map(lambda a: _lookup(geocode_address, a), addresses.values())))
+
+        route_keys = list({
+            geos[normalize_address(p["start"])] + geos[normalize_address(p["end"])]
+            for p in pairs
+            if _found(geos[normalize_address(p["start"])]) and _found(geos[normalize_address(p["end"])])
+        })
+        routes = dict(zip(route_keys, executor.map(lambda k: _lookup(fetch_route, *k), route_keys)))
+
+    # Station lookups hit the database, so they stay on this thread.
+    stations = {}
+    for key, route in routes.items():
+        if not _found(route):
+            continue
+        try:
+            stations[key] = get_stations_near_route(
+                build_route_line(simplified_polyline(route), simplified=True), route["distance_miles"], polyline=route["polyline"]
+            )
+        except _INFRASTRUCTURE_ERRORS:
+            raise
+        except Exception as e:
+            handle_error_log(e, view_name="optimize_route_batch", app_name=APP_NAME, extra_values={"route": list(key)})
+            stations[key] = _FAILED
+
+    handle_info_log(
+        f"Batch of {len(pairs)} pairs: {len(addresses)} addresses, {len(route_keys)} routes",
+        view_name="optimize_route_batch",
+        app_name=APP_NAME,
+    )
+
+    results = []
+
+    def emit(entry):
+        results.append(entry)
+        if on_result is not None:
+            on_result(entry)
+
+    for index, pair in enumerate(pairs):
+        start_geo = geos[normalize_address(pair["start"])]
+        end_geo = geos[normalize_address(pair["end"])]
+        if start_geo is _UNAVAILABLE or end_geo is _UNAVAILABLE:
+            emit(_error(index, pair, UPSTREAM_UNAVAILABLE_ERROR, 503))
+            continue
+        if not start_geo:
+            emit(_error(index, pair, f"Could not geocode: {pair['start']}", 400))
+            continue
+        if not end_geo:
+            emit(_error(index, pair, f"Could not geocode: {pair['end']}", 400))
+            continue
+
+        key = start_geo + end_geo
+        route = routes.get(key)
+        if route is _UNAVAILABLE:
+            emit(_error(index, pair, UPSTREAM_UNAVAILABLE_ERROR, 503))
+            continue
+        if not route:
+            emit(_error(index, pair, "Route not found", 404))
+            continue
+        if stations[key] is _FAILED:
+            emit(_error(index, pair, _PAIR_ERROR, 500))
+            continue
+
+        try:
+            result = build_route_plan(
+                route,
+                start_geo,
+                end_geo,
+                pair["start"],
+                pair["end"],
+                strategy=pair["strategy"],
+                vehicle={k: pair[k] for k in VEHICLE_FIELDS if k in pair},
+                stations=stations[key],
+                response_format=pair["response_format"],
+            )
+        except _INFRASTRUCTURE_ERRORS:
+            raise
+        except Exception as e:
+            handle_error_log(e, view_name="optimize_route_batch", app_name=APP_NAME, extra_values={"index": index})
+            emit(_error(index, pair, _PAIR_ERROR, 500))
+            continue
+        emit({"index": index, "result": result})
+
+    return results
@@ -0,0 +1,329 @@
+"""
+Timing harness for the route-optimization hot path.
+
+Synthetic station sets and OSRM-like polylines are generated from a seed,
+so two runs on the same machine measure the same work. Results are
+{"meta": {...}, "results": {"<stage>@<stations>": {"median_ms", "p95_ms", "min_ms"}}}
+and can be saved as a JSON baseline and compared against it later
+(see the run_benchmarks management command).
+"""
+import inspect
+import json
+import logging
+import logging.handlers
+import math
+import os
+import platform
+import queue
+import tempfile
+import time
+
+import numpy as np
+from django.db import connection
+
+from .constants import FUEL_STRATEGY, MPG
+from .geo import EARTH_RADIUS_M, METERS_PER_MILE
+from .helper import JsonFormatter, _DroppingQueueHandler, _get_caller_info, handle_info_log
+from .planner import plan_optimal_fuel_stops
+from .services import (
+    build_geojson,
+    build_route_line,
+    build_route_plan,
+    calculate_fuel_cost,
+    get_stations_near_route,
+    locate_stations,
+    optimize_fuel_stops,
+    simplify_route,
+)
+from .station_data import bump_station_data_generation
+from .station_index import StationIndex
+
+# Continental US bounding box (lat_min, lat_max, lng_min, lng_max).
+_CONUS = (25.0, 49.0, -124.0, -67.0)
+
+# Share of synthetic stations placed along corridors rather than scattered
+# uniformly; real truck stops cluster on interstates. The benchmark route is
+# one of _CORRIDORS such "interstates".
+_CORRIDOR_SHARE = 0.8
+_CORRIDORS = 20
+
+STAGES = (
+    "build_route_line",
+    "get_stations_near_route",
+    "locate_stations",
+    "optimize_fuel_stops",
+    "plan_optimal_fuel_stops",
+    "calculate_fuel_cost",
+    "build_geojson",
+    "end_to_end",
+)
+
+
+def synthetic_route(seed=0, miles=1500.0, step_m=80.0):
+    """
+    OSRM-like polyline: a vertex every step_m metres (OSRM's full overview
+    is about that dense) along a path that wanders with a slowly drifting
+    heading, clamped to the continental US. Returns (coords, distance_miles).
+    """
+    rng = np.random.default_rng(seed)
+    steps = int(miles * METERS_PER_MILE / step_m)
+
+    # Smooth heading noise: random-walk turn rate, so curves span many vertices.
+    turn = np.cumsum(rng.normal(0, 0.002, steps))
+    turn -= np.linspace(0, turn[-1], steps)
+    heading = rng.uniform(0, 2 * math.pi) + np.cumsum(turn)
+
+    lat_min, lat_max, lng_min, lng_max = _CONUS
+    lat = float(rng.uniform(lat_min + 5, lat_max - 5))
+    lng = float(rng.uniform(lng_min + 10, lng_max - 10))
+    coords = [[round(lng, 6), round(lat, 6)]]
+
+    step_deg = math.degrees(step_m / EARTH_RADIUS_M)
+    for h in heading.tolist():
+        lng = min(lng_max, max(lng_min, lng + step_deg * math.sin(h) / math.cos(math.radians(lat))))
+        lat = min(lat_max, max(lat_min, lat + step_deg * math.cos(h)))
+        coords.append([round(lng, 6), round(lat, 6)])
+
+    return coords, steps * step_m / METERS_PER_MILE
+
+
+def synthetic_stations(n, seed=0, routes=None):
+    """
+    n priced stations as parallel lists (ids, names, prices, lats, lngs).
+    Most sit within a few miles of one of the given routes, the rest are
+    spread over the continental US.
+    """
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max, lng_min, lng_max = _CONUS
+    on_corridor = int(n * _CORRIDOR_SHARE) if routes else 0
+
+    lats = rng.uniform(lat_min, lat_max, n)
+    lngs = rng.uniform(lng_min, lng_max, n)
+    if on_corridor:
+        # Pick a corridor first so short and long routes get the same share.
+        which = rng.integers(0, len(routes), on_corridor)
+        picks = np.empty((on_corridor, 2))
+        for k, route in enumerate(routes):
+            mask = which == k
+            vertices = np.asarray(route, dtype=np.float64)
+            picks[mask] = vertices[rng.integers(0, len(vertices), int(mask.sum()))]
+        # ~0.05 deg is about 3 miles; most fall inside the corridor radius, some just outside.
+        lngs[:on_corridor] = picks[:, 0] + rng.normal(0, 0.05, on_corridor)
+        lats[:on_corridor] = picks[:, 1] + rng.normal(0, 0.05, on_corridor)
+
+    prices = np.clip(rng.normal(3.6, 0.35, n), 2.5, 6.0).round(3)
+    ids = list(range(1, n + 1))
+    names = [f"Synthetic Stop {i}" for i in ids]
+    return ids, names, prices.tolist(), lats.round(6).tolist(), lngs.round(6).tolist()
+
+
+def time_call(fn, repeat=5, warmup=1):
+    """Runs fn warmup + repeat times; returns (timings summary in ms, last result)."""
+    result = None
+    for _ in range(warmup):
+        result = fn()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples = np.array(samples)
+    summary = {
+        "median_ms": round(float(np.median(samples)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "min_ms": round(float(samples.min()), 3),
+    }
+    return summary, result
+
+
+def load_stations_into_db(stations, batch_size=5000):
+    """Replaces fuel_stations with the synthetic set. Only call this against a throwaway database."""
+    ids, names, prices, lats, lngs = stations
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE fuel_stations")
+        for start in range(0, len(ids), batch_size):
+            rows = [
+                (i, names[k], "Synthetic Rd", "Synthetic", "TX", prices[k], f"SRID=4326;POINT({lngs[k]} {lats[k]})")
+                for k, i in enumerate(ids[start:start + batch_size], start)
+            ]
+            cursor.executemany("""
+                INSERT INTO fuel_stations
+                    (opis_id, truckstop_name, address, city, state, retail_price, location, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, ST_GeogFromText(%s), now(), now())
+            """, rows)
+        cursor.execute("ANALYZE fuel_stations")
+
+
+def run_benchmarks(sizes=(1_000, 10_000, 100_000), repeat=5, seed=0, miles=1500.0, postgis=False):
+    """
+    Times each hot-path stage for every station-set size.
+
+    Without postgis the corridor lookup runs on an in-process StationIndex
+    over the synthetic set. With postgis the set is written to fuel_stations
+    and get_stations_near_route is timed as deployed (the caller must point
+    the default database at a throwaway PostGIS and use a non-shared cache).
+    """
+    coords, distance_miles = synthetic_route(seed, miles)
+    corridors = [coords] + [synthetic_route(seed + k, miles)[0] for k in range(1, _CORRIDORS)]
+    route = {"polyline": coords, "distance_miles": distance_miles}
+    start_geo = (coords[0][1], coords[0][0])
+    end_geo = (coords[-1][1], coords[-1][0])
+
+    polyline = simplify_route(coords)
+    line = build_route_line(polyline, simplified=True)
+
+    results = {}
+    for n in sizes:
+        stations_data = synthetic_stations(n, seed, routes=corridors)
+
+        if postgis:
+            load_stations_into_db(stations_data)
+
+            def lookup():
+                # A new generation makes every call a cold corridor lookup.
+                bump_station_data_generation()
+                return get_stations_near_route(line, distance_miles, track=False, polyline=coords)
+        else:
+            index = StationIndex(*stations_data)
+
+            def lookup():
+                return locate_stations(index.near_route(line.coords, distance_miles), coords, distance_miles)
+
+        timings = {}
+        timings["build_route_line"], _ = time_call(lambda: build_route_line(coords), repeat)
+        timings["get_stations_near_route"], stations = time_call(lookup, repeat)
+        timings["locate_stations"], _ = time_call(lambda: locate_stations(stations, coords, distance_miles), repeat)
+        timings["optimize_fuel_stops"], stops = time_call(lambda: optimize_fuel_stops(stations, distance_miles), repeat)
+        timings["plan_optimal_fuel_stops"], _ = time_call(lambda: plan_optimal_fuel_stops(stations, distance_miles), repeat)
+        timings["calculate_fuel_cost"], _ = time_call(lambda: calculate_fuel_cost(stops, distance_miles), repeat)
+        timings["build_geojson"], _ = time_call(
+            lambda: build_geojson(polyline, stops, start_geo, end_geo, "Start", "End"), repeat
+        )
+        timings["end_to_end"], _ = time_call(
+            lambda: build_route_plan(route, start_geo, end_geo, "Start", "End", stations=lookup()), repeat
+        )
+
+        for stage in STAGES:
+            results[f"{stage}@{n}"] = timings[stage]
+        results[f"stations_found@{n}"] = {"count": len(stations), "stops": len(stops)}
+
+    meta = {
+        "seed": seed,
+        "route_miles": round(distance_miles, 1),
+        "route_points": len(coords),
+        "repeat": repeat,
+        "station_lookup": "postgis" if postgis else "in-process StationIndex",
+        "fuel_strategy": FUEL_STRATEGY,
+        "mpg": MPG,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare_to_baseline(current, baseline, threshold=0.25, floor_ms=0.05):
+    """
+    Stages whose median got slower than baseline by more than threshold
+    (a fraction: 0.25 = 25%). Stages under floor_ms in both runs are
+    skipped because timer noise dominates there. Returns a list of
+    (name, baseline_ms, current_ms) sorted by the worst ratio first.
+    """
+    regressions = []
+    for name, timing in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "median_ms" not in timing or "median_ms" not in before:
+            continue
+        old, new = before["median_ms"], timing["median_ms"]
+        if max(old, new) < floor_ms:
+            continue
+        if new > old * (1 + threshold):
+            regressions.append((name, old, new))
+    return sorted(regressions, key=lambda r: r[2] / max(r[1], 1e-9), reverse=True)
+
+
+def save_results(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _legacy_caller_info(skip=2):
+    # What helper._get_caller_info did before: a FrameInfo, with source context, for every frame.
+    frame = inspect.stack()[skip]
+    return os.path.abspath(frame.filename), frame.lineno
+
+
+def _at_depth(depth, fn):
+    """Calls fn with `depth` extra frames on the stack (a Django request is ~40 deep)."""
+    return fn() if depth <= 0 else _at_depth(depth - 1, fn)
+
+
+def _per_call_us(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return round((time.perf_counter() - start) / calls * 1e6, 2)
+
+
+def logging_call_cost(calls=2000, depth=40):
+    """
+    Per-call cost in microseconds of the old and new info-log paths, measured
+    `depth` frames deep:
+
+    - caller lookup alone: inspect.stack() vs sys._getframe;
+    - a whole info log: the old text record written synchronously to a
+      RotatingFileHandler, vs handle_info_log enqueueing a JSON record for a
+      background writer, and vs handle_info_log sampled out.
+    """
+    results = {}
+    results["caller_lookup.inspect_stack"] = _at_depth(depth, lambda: _per_call_us(lambda: _legacy_caller_info(1), calls))
+    results["caller_lookup.getframe"] = _at_depth(depth, lambda: _per_call_us(lambda: _get_caller_info(1), calls))
+
+    log = logging.getLogger(__name__)
+    saved = (log.handlers[:], log.propagate, log.level)
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_handler = logging.handlers.RotatingFileHandler(os.path.join(tmp, "sync.log"), maxBytes=1 << 30)
+        sync_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s] [%(AppName)s] %(message)s"))
+        queued_handler = logging.handlers.RotatingFileHandler(os.path.join(tmp, "queued.log"), maxBytes=1 << 30)
+        queued_handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(maxsize=calls * 2)
+        listener = logging.handlers.QueueListener(log_queue, queued_handler)
+
+        def legacy_info():
+            full_path, line = _legacy_caller_info(2)
+            log.info(
+                f"Info | File: {full_path} | Line: {line} | View: benchmark | Message: stations found | Extra: None",
+                extra={"AppName": "app"},
+            )
+
+        try:
+            log.propagate = False
+            log.setLevel(logging.INFO)
+
+            log.handlers = [sync_handler]
+            results["info_log.legacy_sync"] = _at_depth(depth, lambda: _per_call_us(legacy_info, calls))
+
+            log.handlers = [_DroppingQueueHandler(log_queue)]
+            listener.start()
+            results["info_log.queued_json"] = _at_depth(
+                depth, lambda: _per_call_us(lambda: handle_info_log("stations found", "benchmark", "app"), calls)
+            )
+            listener.stop()
+
+            log.setLevel(logging.WARNING)
+            results["info_log.disabled"] = _at_depth(
+                depth, lambda: _per_call_us(lambda: handle_info_log("stations found", "benchmark", "app"), calls)
+            )
+        finally:
+            log.handlers, log.propagate = saved[0], saved[1]
+            log.setLevel(saved[2])
+            sync_handler.close()
+            queued_handler.close()
+
+    return results
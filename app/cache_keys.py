@@ -0,0 +1,48 @@
+import hashlib
+
+import numpy as np
+
+from .constants import CORRIDOR_KEY_GRID_DEG, CORRIDOR_KEY_VERSION, CORRIDOR_RADIUS_METERS, ROUTE_SNAP_GRID_DEG
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover - xxhash is optional
+    xxhash = None
+
+
+def fast_digest(data: bytes) -> str:
+    """128-bit hex digest: xxh3 when available, otherwise blake2b (also C speed, just slower)."""
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def quantize_coords(coords, grid_deg: float = CORRIDOR_KEY_GRID_DEG) -> np.ndarray:
+    """Snaps [lng, lat] pairs to integer multiples of grid_deg."""
+    return np.rint(np.asarray(coords, dtype=np.float64) / grid_deg).astype(np.int64)
+
+
+def corridor_fingerprint(coords, distance_miles: float, grid_deg: float = CORRIDOR_KEY_GRID_DEG) -> str:
+    """
+    Canonical key for a corridor lookup.
+
+    The whole geometry is quantized to grid_deg (default about 11 m), so
+    float noise in the same route maps to one key. Any route that differs
+    anywhere along its length by more than a grid cell gets a different
+    key. The distance, corridor radius and CORRIDOR_KEY_VERSION are hashed
+    in too, so changing the lookup parameters can never reuse old entries.
+    """
+    header = f"v{CORRIDOR_KEY_VERSION}:{grid_deg!r}:{CORRIDOR_RADIUS_METERS}:{round(distance_miles, 1)}:".encode()
+    return fast_digest(header + quantize_coords(coords, grid_deg).tobytes())
+
+
+def snap_route_endpoints(start_lat, start_lng, end_lat, end_lng, grid_deg=None):
+    """
+    Snaps both endpoints to ROUTE_SNAP_GRID_DEG (or grid_deg). The snapped
+    points are sent to OSRM as well as used for the cache key, so a cached
+    route always matches the key it is stored under.
+    """
+    grid_deg = ROUTE_SNAP_GRID_DEG if grid_deg is None else grid_deg
+    if grid_deg <= 0:
+        return start_lat, start_lng, end_lat, end_lng
+    return tuple(round(round(v / grid_deg) * grid_deg, 6) for v in (start_lat, start_lng, end_lat, end_lng))
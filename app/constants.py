@@ -1,5 +1,5 @@
 from django.db import models
-from decouple import config
+from decouple import Csv, config
 import os
 
 class FuelImportStatus(models.TextChoices):
@@ -18,14 +18,179 @@ APP_NAME = "app"
 
 GEOCODE_URL = config("GEOCODE_URL", default="https://geocode.maps.co/search")
 GEOCODE_API_KEY = config("GEOCODE_API_KEY")
+# City-level queries are answered from this Census Gazetteer places file before calling GEOCODE_URL.
+# `manage.py fetch_gazetteer` downloads the national file (~32k places) from GAZETTEER_URL to
+# GAZETTEER_NATIONAL_PATH; until it exists, the bundled list of major cities is used.
+GAZETTEER_ENABLED = config("GAZETTEER_ENABLED", default=True, cast=bool)
+GAZETTEER_BUNDLED_PATH = os.path.join(os.path.dirname(__file__), "data", "us_places.tsv")
+GAZETTEER_NATIONAL_PATH = os.path.join(os.path.dirname(__file__), "data", "us_places_national.zip")
+GAZETTEER_PATH = config(
+    "GAZETTEER_PATH",
+    default=GAZETTEER_NATIONAL_PATH if os.path.exists(GAZETTEER_NATIONAL_PATH) else GAZETTEER_BUNDLED_PATH,
+)
+GAZETTEER_URL = config(
+    "GAZETTEER_URL",
+    default="https://www2.census.gov/geo/docs/maps-data/data/gazetteer/2023_Gazetteer/2023_Gaz_place_national.zip",
+)
+# Misspelling matches; only safe with the full Census places file, where real towns match exactly.
+GAZETTEER_FUZZY = config("GAZETTEER_FUZZY", default=False, cast=bool)
 TRUCK_RANGE_MILES = 500
 MPG = 10
+TANK_CAPACITY_GALLONS = TRUCK_RANGE_MILES / MPG
+RESERVE_GALLONS = 0
+# Start fuel when a request gives no start_fuel_gallons, as a fraction of the tank.
+# The part the trip burns is charged at the cheapest price reachable on it, the
+# price greedy charges for its first leg, so total_fuel_cost_usd covers the whole trip.
+DEFAULT_START_FUEL_FRACTION = config("DEFAULT_START_FUEL_FRACTION", default=1.0, cast=float)
+# Price for the whole-trip estimate (total_miles / mpg * price) quoted when no feasible plan exists.
+ESTIMATE_PRICE_PER_GALLON = config("ESTIMATE_PRICE_PER_GALLON", default=3.5, cast=float)
+# "optimal" (partial fills, minimum cost) or "greedy" (cheapest stop per 500-mile window)
+FUEL_STRATEGY = config("FUEL_STRATEGY", default="optimal")
+VEHICLE_FIELDS = ("start_fuel_gallons", "tank_capacity_gallons", "reserve_gallons", "mpg")
 CACHE_TTL = 60 * 60 * 24  # 24 hours
 
 OSRM_BASE_URL = os.environ.get("OSRM_BASE_URL", "http://router.project-osrm.org")
 OSRM_TIMEOUT = 30
+
+# "osrm" calls OSRM_BASE_URL; "stub" answers with deterministic straight-line
+# routes in-process (load tests, CI, no network); "graph" runs shortest paths
+# in-process over ROAD_GRAPH_PATH and falls back to OSRM when it cannot answer.
+ROUTING_BACKEND = config("ROUTING_BACKEND", default="osrm")
+ROUTING_POOL_SIZE = config("ROUTING_POOL_SIZE", default=32, cast=int)
+ROUTING_MAX_RETRIES = config("ROUTING_MAX_RETRIES", default=2, cast=int)
+ROUTING_RETRY_BACKOFF = 0.1  # seconds; doubled per attempt, full jitter
+ROUTING_BREAKER_FAILURES = config("ROUTING_BREAKER_FAILURES", default=5, cast=int)
+ROUTING_BREAKER_RESET_SECONDS = config("ROUTING_BREAKER_RESET_SECONDS", default=30, cast=int)
+# Road network for the "graph" backend: a .npz built by `manage.py build_road_graph`
+# (a .geojson is also accepted but parsed on every worker start).
+ROAD_GRAPH_PATH = config("ROAD_GRAPH_PATH", default=os.path.join(os.path.dirname(__file__), "data", "road_graph.npz"))
+ROAD_GRAPH_MAX_SNAP_M = config("ROAD_GRAPH_MAX_SNAP_M", default=5000, cast=float)
+# `manage.py run_benchmarks` compares against this baseline and fails when a
+# stage's median is more than BENCHMARK_REGRESSION_THRESHOLD (fraction) slower.
+BENCHMARK_BASELINE_PATH = config("BENCHMARK_BASELINE_PATH", default=os.path.join(os.path.dirname(__file__), "data", "benchmark_baseline.json"))
+BENCHMARK_REGRESSION_THRESHOLD = config("BENCHMARK_REGRESSION_THRESHOLD", default=0.25, cast=float)
+# Adds X-DB-Queries / X-Cache-Hits / X-Cache-Misses to every response so the
+# load-test harness can report them. Leave off in production.
+LOADTEST_STATS = config("LOADTEST_STATS", default=False, cast=bool)
+
+# Info logs per module logger are kept with this probability, e.g.
+# "app.services=0.1,app.ingest=0.01"; unlisted loggers and errors are never sampled.
+LOG_SAMPLE_RATES = config("LOG_SAMPLE_RATES", default="")
+# Records waiting for the background log writer; beyond this they are dropped.
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+
+# Stage timers, cache/upstream counters, the Server-Timing header and /metrics.
+# Each worker adds its counts to the METRICS_KEY Redis hash every
+# METRICS_FLUSH_SECONDS, so /metrics shows totals across all workers.
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+METRICS_FLUSH_SECONDS = config("METRICS_FLUSH_SECONDS", default=5.0, cast=float)
+METRICS_KEY = "metrics:v1"
+# /metrics answers only clients in these networks, or requests carrying
+# "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="127.0.0.1/32,::1/128", cast=Csv())
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
 ROUTE_CACHE_TTL = 60 * 60 * 24 
 
+GEOCODE_MAX_WORKERS = config("GEOCODE_MAX_WORKERS", default=16, cast=int)
+ASYNC_HTTP_MAX_CONNECTIONS = config("ASYNC_HTTP_MAX_CONNECTIONS", default=200, cast=int)
+
+CORRIDOR_RADIUS_METERS = 8046  # 5 miles either side of the route
+# Corridor cache keys hash the full route quantized to this grid (~11 m).
+# Bump CORRIDOR_KEY_VERSION whenever the corridor query or payload changes.
+CORRIDOR_KEY_GRID_DEG = config("CORRIDOR_KEY_GRID_DEG", default=1e-4, cast=float)
+CORRIDOR_KEY_VERSION = 1
+
+# Route endpoints are snapped to this grid before OSRM is called and the route
+# cache is keyed. 0.001 deg is ~110 m: slightly different geocodes of one place
+# share a route, and the route starts at most ~80 m from the exact point.
+# Set to 0 to disable snapping.
+ROUTE_SNAP_GRID_DEG = config("ROUTE_SNAP_GRID_DEG", default=0.001, cast=float)
+
+# "rdp" keeps the OSRM geometry within ROUTE_SIMPLIFY_TOLERANCE_M metres of the
+# original; "sample" keeps ROUTE_SAMPLE_POINTS evenly spaced vertices.
+ROUTE_SIMPLIFY_MODE = config("ROUTE_SIMPLIFY_MODE", default="rdp")
+ROUTE_SIMPLIFY_TOLERANCE_M = config("ROUTE_SIMPLIFY_TOLERANCE_M", default=50.0, cast=float)
+ROUTE_SAMPLE_POINTS = 200
+
+# "postgis" runs the corridor query in the database; "memory" answers it from
+# a per-process station index; "h3" caches stations per H3 cell so overlapping
+# routes share lookups. "memory" and "h3" fall back to PostGIS on failure.
+STATION_LOOKUP_ENGINE = config("STATION_LOOKUP_ENGINE", default="postgis")
+H3_CORRIDOR_RESOLUTION = config("H3_CORRIDOR_RESOLUTION", default=5, cast=int)
+STATION_INDEX_CELL_DEG = 0.25
+STATION_INDEX_CHECK_SECONDS = config("STATION_INDEX_CHECK_SECONDS", default=30, cast=int)
+
+# Bumped whenever ingestion or geocoding commits; part of every corridor
+# cache key so a price change can never be answered from an older entry.
+STATION_DATA_GENERATION_KEY = "stations:generation"
+# Corridors are ranked by lookups (decayed on each warm-up); the top
+# HOT_CORRIDOR_WARM_COUNT are recomputed right after a generation bump.
+HOT_CORRIDORS_KEY = "spotter:stations:hot"
+HOT_CORRIDOR_ROUTES_KEY = "spotter:stations:hot_routes"
+HOT_CORRIDOR_WARM_COUNT = config("HOT_CORRIDOR_WARM_COUNT", default=50, cast=int)
+HOT_CORRIDOR_TRACK_MAX = 1000
+
+# Per-process tier in front of Redis for geocode, route and station lookups.
+LOCAL_CACHE_MAX_ENTRIES = config("LOCAL_CACHE_MAX_ENTRIES", default=2048, cast=int)
+LOCAL_CACHE_MAX_BYTES = config("LOCAL_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+LOCAL_CACHE_TTL = config("LOCAL_CACHE_TTL", default=300, cast=int)
+NEGATIVE_CACHE_TTL = config("NEGATIVE_CACHE_TTL", default=300, cast=int)
+GEOCODE_CACHE_TTL = 60 * 60 * 24 * 7
+
+# Full route plans, keyed on the request and the station data generation.
+ROUTE_PLAN_CACHE_TTL = config("ROUTE_PLAN_CACHE_TTL", default=600, cast=int)
+
+# Plans older than ROUTE_PLAN_CACHE_TTL are served stale (and refreshed by a
+# Celery task) until ROUTE_PLAN_STALE_TTL; only then is a request recomputed inline.
+ROUTE_PLAN_STALE_TTL = config("ROUTE_PLAN_STALE_TTL", default=60 * 60 * 24, cast=int)
+
+# End-to-end budget for one route request. Geocode, OSRM and PostGIS each get
+# their own cap clipped to what is left; running out returns 504.
+ROUTE_REQUEST_BUDGET_SECONDS = config("ROUTE_REQUEST_BUDGET_SECONDS", default=12.0, cast=float)
+GEOCODE_TIMEOUT = 10
+# Send a second identical upstream request when the first has not answered
+# after this many seconds (0 disables hedging).
+HEDGE_AFTER_SECONDS = config("HEDGE_AFTER_SECONDS", default=0.0, cast=float)
+HEDGE_MAX_WORKERS = 32
+
+# Cross-process single-flight: the lock outlives the slowest upstream call
+# (OSRM_TIMEOUT); waiters give up and compute themselves after the wait.
+SINGLE_FLIGHT_LOCK_TTL = config("SINGLE_FLIGHT_LOCK_TTL", default=45, cast=int)
+SINGLE_FLIGHT_WAIT_SECONDS = config("SINGLE_FLIGHT_WAIT_SECONDS", default=20.0, cast=float)
+
+BATCH_MAX_PAIRS = 500
+# Larger batches are queued as a RouteJob instead of being planned inside the request.
+BATCH_SYNC_MAX_PAIRS = config("BATCH_SYNC_MAX_PAIRS", default=25, cast=int)
+BATCH_MAX_WORKERS = config("BATCH_MAX_WORKERS", default=8, cast=int)
+SWEEP_MAX_PROFILES = 100
+# Station geocoding pipeline: concurrent lookups under one token bucket shared
+# by every worker. A run stops after GEOCODE_PIPELINE_MAX_SECONDS and
+# re-queues itself; the lock outlives a run so two never overlap.
+GEOCODE_PIPELINE_WORKERS = config("GEOCODE_PIPELINE_WORKERS", default=8, cast=int)
+GEOCODE_RATE_PER_SECOND = config("GEOCODE_RATE_PER_SECOND", default=2.0, cast=float)
+GEOCODE_RATE_BURST = config("GEOCODE_RATE_BURST", default=2, cast=int)
+GEOCODE_PIPELINE_BATCH = config("GEOCODE_PIPELINE_BATCH", default=200, cast=int)
+GEOCODE_PIPELINE_MAX_SECONDS = config("GEOCODE_PIPELINE_MAX_SECONDS", default=240.0, cast=float)
+GEOCODE_PIPELINE_LOCK_TTL = 600
+# A city the geocoder has no match for is not asked again for this long. It
+# must outlast the beat interval, or every pass would retry every miss.
+STATION_GEOCODE_NEGATIVE_TTL = config("STATION_GEOCODE_NEGATIVE_TTL", default=60 * 60 * 24, cast=int)
+GEOCODE_BUCKET_KEY = "spotter:geocode:bucket"
+GEOCODE_CHECKPOINT_KEY = "spotter:geocode:checkpoint"
+GEOCODE_PIPELINE_LOCK_KEY = "spotter:geocode:lock"
+# Route jobs write partial results to their row at most this often; WebSocket progress is per pair.
+ROUTE_JOB_SAVE_SECONDS = config("ROUTE_JOB_SAVE_SECONDS", default=1.0, cast=float)
+
+# 0-11; 5 is close to gzip -6 on CPU and still ~15-20% smaller on route JSON.
+BROTLI_QUALITY = config("BROTLI_QUALITY", default=5, cast=int)
+# Only JSON responses under these paths are compressed, and never one that sets
+# a cookie or carries a CSRF token: compressing secrets next to reflected input
+# leaks them through the response size (BREACH).
+COMPRESSION_PATH_PREFIXES = config("COMPRESSION_PATH_PREFIXES", default="/api/", cast=Csv(post_process=tuple))
+
+# Rows per COPY chunk when ingesting an OPIS upload.
+INGEST_CHUNK_ROWS = config("INGEST_CHUNK_ROWS", default=5000, cast=int)
+
 REQUIRED_COLUMNS = [
     "OPIS Truckstop ID",
     "Truckstop Name",
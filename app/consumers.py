@@ -0,0 +1,41 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.urls import path
+
+from .jobs import FINAL_STATUSES, job_group, load_job_snapshot
+
+
+class RouteJobConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/route-jobs/<id>/: sends the job's current snapshot, then one message
+    per finished pair, and closes once the job completes or fails.
+    """
+
+    async def connect(self):
+        self.job_id = str(self.scope["url_route"]["kwargs"]["job_id"])
+        self.group = job_group(self.job_id)
+        # Join before reading the snapshot so no update falls between the two.
+        await self.channel_layer.group_add(self.group, self.channel_name)
+
+        snapshot = await database_sync_to_async(load_job_snapshot)(self.job_id)
+        if snapshot is None:
+            await self.close(code=4404)
+            return
+
+        await self.accept()
+        await self.send_json({"event": "snapshot", **snapshot})
+        if snapshot["status"] in FINAL_STATUSES:
+            await self.close()
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def job_update(self, event):
+        await self.send_json({"event": "progress", **{k: v for k, v in event.items() if k != "type"}})
+        if event["status"] in FINAL_STATUSES:
+            await self.close()
+
+
+websocket_urlpatterns = [
+    path("ws/route-jobs/<uuid:job_id>/", RouteJobConsumer.as_asgi()),
+]
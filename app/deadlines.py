@@ -0,0 +1,93 @@
+import concurrent.futures
+import contextlib
+import contextvars
+import time
+
+from .constants import HEDGE_AFTER_SECONDS, HEDGE_MAX_WORKERS
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """A request's remaining time budget, shared by every stage it passes through."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str = ""):
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded{f' before {stage}' if stage else ''}")
+
+    def timeout(self, cap: float, stage: str = "") -> float:
+        """Timeout for one upstream call: the stage's own cap, cut to what is left of the budget."""
+        self.check(stage)
+        return min(cap, self.remaining())
+
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float):
+    """Sets the deadline for everything called inside the block (including sync_to_async threads)."""
+    token = _current.set(Deadline(seconds))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def stage_timeout(cap: float, stage: str = "") -> float:
+    """cap when no deadline is active, otherwise cap clipped to the remaining budget."""
+    deadline = current_deadline()
+    return cap if deadline is None else deadline.timeout(cap, stage)
+
+
+def raise_if_expired(stage: str = ""):
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS)
+
+
+def hedged(call, timeout: float, hedge_after: float = HEDGE_AFTER_SECONDS):
+    """
+    Runs call(timeout). If it has not returned within hedge_after seconds,
+    a second identical call is started and whichever succeeds first wins.
+    Hedging is off when hedge_after is 0 or does not leave room inside
+    timeout. Use it only for idempotent reads.
+    """
+    if hedge_after <= 0 or hedge_after >= timeout:
+        return call(timeout)
+
+    primary = _hedge_executor.submit(call, timeout)
+    try:
+        return primary.result(timeout=hedge_after)
+    except concurrent.futures.TimeoutError:
+        pass
+
+    backup = _hedge_executor.submit(call, timeout - hedge_after)
+    error = None
+    try:
+        for future in concurrent.futures.as_completed((primary, backup), timeout=timeout - hedge_after):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+    except concurrent.futures.TimeoutError:
+        raise DeadlineExceeded("Hedged call timed out")
+    raise error
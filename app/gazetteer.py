@@ -0,0 +1,262 @@
+import contextlib
+import csv
+import io
+import re
+import threading
+import zipfile
+
+from .constants import GAZETTEER_BUNDLED_PATH, GAZETTEER_ENABLED, GAZETTEER_FUZZY, GAZETTEER_PATH
+from .helper import APP_NAME, handle_error_log, handle_info_log
+
+STATE_ABBREVIATIONS = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+    "puerto rico": "PR",
+}
+STATE_CODES = set(STATE_ABBREVIATIONS.values())
+
+_WORD_ALIASES = {"saint": "st", "sainte": "ste", "fort": "ft", "mount": "mt"}
+_STREET_ALIASES = {
+    "street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "highway": "hwy",
+    "drive": "dr", "lane": "ln", "parkway": "pkwy", "freeway": "fwy", "court": "ct",
+    "place": "pl", "suite": "ste", "north": "n", "south": "s", "east": "e", "west": "w",
+    "interstate": "i",
+}
+_COUNTRY_SUFFIXES = ("usa", "us", "united states", "united states of america")
+_PLACE_SUFFIX = re.compile(
+    r"\s+(city and borough|metropolitan government|consolidated government|unified government"
+    r"|urban county|city|town|village|borough|municipality|cdp)\s*$"
+)
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+_ZIP = re.compile(r"\b\d{5}(-\d{4})?\b")
+
+
+def normalize_place(name: str) -> str:
+    """Lowercase, drop punctuation and fold Saint/Fort/Mount so spelling variants share a key."""
+    text = _NON_ALNUM.sub(" ", name.lower())
+    return " ".join(_WORD_ALIASES.get(w, w) for w in text.split())
+
+
+def _census_place_name(name: str) -> str:
+    # Census NAME carries a place-type descriptor: "Dallas city", "Nashville-Davidson
+    # metropolitan government (balance)".
+    name = name.strip()
+    if name.endswith("(balance)"):
+        name = name[: -len("(balance)")].split("-")[0]
+    return _PLACE_SUFFIX.sub("", name.lower()).strip()
+
+
+def normalize_state(text: str):
+    text = " ".join(_NON_ALNUM.sub(" ", text.lower()).split())
+    if text.upper() in STATE_CODES:
+        return text.upper()
+    return STATE_ABBREVIATIONS.get(text)
+
+
+def parse_city_state(address: str):
+    """
+    Splits a city-level query into (city_key, state_code).
+
+    Accepts "City, ST", "City, State Name", "City ST" and a bare "City"
+    (state None). Street addresses return None so they go to the HTTP
+    geocoder instead of resolving to a city centroid.
+    """
+    text = _ZIP.sub("", address).strip().strip(",")
+    parts = [p.strip() for p in text.split(",") if p.strip()]
+    if parts and parts[-1].lower() in ("usa", "us", "united states"):
+        parts = parts[:-1]
+    if not parts or len(parts) > 2 or any(ch.isdigit() for ch in parts[0]):
+        return None
+
+    if len(parts) == 2:
+        state = normalize_state(parts[1])
+        return (normalize_place(parts[0]), state) if state else None
+
+    words = parts[0].split()
+    for take in (3, 2, 1):
+        if len(words) > take:
+            state = normalize_state(" ".join(words[-take:]))
+            if state:
+                return normalize_place(" ".join(words[:-take])), state
+    return normalize_place(parts[0]), None
+
+
+def normalize_address(address: str) -> str:
+    """
+    Canonical text for geocode cache keys and batch de-duplication.
+
+    City-level queries collapse to "city, st" ("Dallas, TX", "dallas tx"
+    and "Dallas, Texas, USA" are one key). Other addresses are lowercased,
+    stripped of punctuation and a trailing country, and have USPS street
+    suffixes and directions abbreviated.
+    """
+    parsed = parse_city_state(address)
+    if parsed and parsed[1]:
+        return f"{parsed[0]}, {parsed[1].lower()}"
+
+    text = " ".join(_NON_ALNUM.sub(" ", address.lower()).split())
+    for suffix in _COUNTRY_SUFFIXES:
+        if text.endswith(" " + suffix):
+            text = text[: -len(suffix) - 1]
+            break
+    return " ".join(_STREET_ALIASES.get(w, w) for w in text.split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "places")
+
+    def __init__(self):
+        self.children = {}
+        self.places = None
+
+
+class Gazetteer:
+    """
+    City centroids keyed by normalized name, stored in a character trie so
+    misspellings can be matched with a bounded edit distance.
+
+    Only exact city + state matches are answered unless fuzzy is set. A
+    small places list would otherwise resolve a real town it lacks to a
+    similarly spelled city ("Justin, TX" to Austin). Fuzzy matches must be
+    unique within the state.
+    """
+
+    def __init__(self, fuzzy: bool = False):
+        self.root = _TrieNode()
+        self.size = 0
+        self.fuzzy = fuzzy
+
+    def add(self, name: str, state: str, lat: float, lng: float):
+        node = self.root
+        for ch in normalize_place(name):
+            node = node.children.setdefault(ch, _TrieNode())
+        if node.places is None:
+            node.places = {}
+        if state not in node.places:
+            node.places[state] = (lat, lng)
+            self.size += 1
+
+    @classmethod
+    def from_file(cls, path, fuzzy: bool = False):
+        """
+        Loads a Census Gazetteer places file (USPS, NAME, INTPTLAT, INTPTLONG
+        columns), either the tab-separated text or the .zip Census ships it in.
+        """
+        gazetteer = cls(fuzzy=fuzzy)
+        with _open_places(path) as f:
+            reader = csv.reader(f, delimiter="\t")
+            header = [h.strip() for h in next(reader)]
+            usps, name, lat, lng = (header.index(c) for c in ("USPS", "NAME", "INTPTLAT", "INTPTLONG"))
+            for row in reader:
+                if len(row) > max(usps, name, lat, lng):
+                    gazetteer.add(
+                        _census_place_name(row[name]),
+                        row[usps].strip(),
+                        float(row[lat]),
+                        float(row[lng].strip()),
+                    )
+        return gazetteer
+
+    def _exact(self, key):
+        node = self.root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node.places
+
+    def _fuzzy(self, key, max_edits):
+        """Yields (distance, places) for names within max_edits of key (Levenshtein over the trie)."""
+        first_row = list(range(len(key) + 1))
+        stack = [(child, ch, first_row) for ch, child in self.root.children.items()]
+        while stack:
+            node, ch, prev_row = stack.pop()
+            row = [prev_row[0] + 1]
+            for i in range(1, len(key) + 1):
+                row.append(min(
+                    row[i - 1] + 1,
+                    prev_row[i] + 1,
+                    prev_row[i - 1] + (key[i - 1] != ch),
+                ))
+            if node.places and row[-1] <= max_edits:
+                yield row[-1], node.places
+            if min(row) <= max_edits:
+                stack.extend((child, c, row) for c, child in node.children.items())
+
+    def lookup(self, city_key: str, state: str = None):
+        if not city_key:
+            return None
+
+        places = self._exact(city_key)
+        if places:
+            if state:
+                return places.get(state)
+            return next(iter(places.values())) if len(places) == 1 else None
+
+        if not state or not self.fuzzy:
+            return None
+
+        max_edits = 1 if len(city_key) < 8 else 2
+        matches = [candidates[state] for _, candidates in self._fuzzy(city_key, max_edits) if state in candidates]
+        return matches[0] if len(matches) == 1 else None
+
+
+@contextlib.contextmanager
+def _open_places(path):
+    if not zipfile.is_zipfile(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield f
+        return
+    with zipfile.ZipFile(path) as archive:
+        members = [n for n in archive.namelist() if n.endswith((".txt", ".tsv"))]
+        if not members:
+            raise ValueError(f"{path} has no places file")
+        with archive.open(members[0]) as raw:
+            yield io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                try:
+                    _gazetteer = Gazetteer.from_file(GAZETTEER_PATH, fuzzy=GAZETTEER_FUZZY)
+                    handle_info_log(f"Gazetteer loaded: {_gazetteer.size} places", view_name="get_gazetteer", app_name=APP_NAME)
+                except Exception as e:
+                    handle_error_log(e, view_name="get_gazetteer", app_name=APP_NAME)
+                    _gazetteer = _load_bundled()
+    return _gazetteer
+
+
+def _load_bundled():
+    # A missing or corrupt GAZETTEER_PATH still leaves the major cities answered locally.
+    if GAZETTEER_PATH != GAZETTEER_BUNDLED_PATH:
+        try:
+            return Gazetteer.from_file(GAZETTEER_BUNDLED_PATH, fuzzy=False)
+        except Exception as e:
+            handle_error_log(e, view_name="get_gazetteer", app_name=APP_NAME)
+    return Gazetteer(fuzzy=False)
+
+
+def gazetteer_geocode(address: str):
+    """Returns (lat, lng) for a city-level query, or None when the HTTP geocoder should be asked."""
+    if not GAZETTEER_ENABLED or not address:
+        return None
+    parsed = parse_city_state(address)
+    if not parsed:
+        return None
+    return get_gazetteer().lookup(*parsed)
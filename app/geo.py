@@ -0,0 +1,255 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.34
+
+# Caps the size of the point x segment matrices built by project_points.
+_PROJECTION_CHUNK = 2_000_000
+
+
+def project_points(line_coords, lats, lngs):
+    """
+    Projects points onto a [lng, lat] polyline.
+
+    Returns (along_m, offset_m, total_m): distance along the line to the
+    nearest point, distance from the point to the line, and the line length.
+    Each segment is measured in its own equirectangular frame, which is
+    accurate to well under a percent at corridor scale.
+    """
+    line = np.radians(np.asarray(line_coords, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+
+    ax, ay = line[:-1, 0], line[:-1, 1]
+    k = np.cos((line[:-1, 1] + line[1:, 1]) / 2)
+    sx = (line[1:, 0] - ax) * k
+    sy = line[1:, 1] - ay
+    seg_len2 = sx * sx + sy * sy
+    safe_len2 = np.where(seg_len2 > 0, seg_len2, 1.0)
+
+    seg_len_m = np.sqrt(seg_len2) * EARTH_RADIUS_M
+    cum_m = np.concatenate(([0.0], np.cumsum(seg_len_m)))
+
+    along_m = np.empty(len(lats))
+    offset_m = np.empty(len(lats))
+    step = max(1, _PROJECTION_CHUNK // max(1, len(sx)))
+
+    for start in range(0, len(lats), step):
+        end = start + step
+        px = (lngs[start:end, None] - ax) * k
+        py = lats[start:end, None] - ay
+        t = np.clip((px * sx + py * sy) / safe_len2, 0.0, 1.0)
+        dx = px - t * sx
+        dy = py - t * sy
+        d2 = dx * dx + dy * dy
+
+        rows = np.arange(d2.shape[0])
+        best = np.argmin(d2, axis=1)
+        offset_m[start:end] = np.sqrt(d2[rows, best]) * EARTH_RADIUS_M
+        along_m[start:end] = cum_m[best] + t[rows, best] * seg_len_m[best]
+
+    return along_m, offset_m, cum_m[-1]
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres; accepts scalars or numpy arrays (degrees)."""
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dp, dl = p2 - p1, np.radians(np.asarray(lng2) - lng1)
+    a = np.sin(dp / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+class RouteProjector:
+    """
+    Projects many points onto one long [lng, lat] polyline, e.g. a full
+    OSRM geometry with tens of thousands of vertices.
+
+    Cumulative haversine distances are computed once per route. Segments
+    are grouped into blocks of `block` consecutive segments, each bounded
+    by a circle. A block whose circle is farther from a point than the far
+    edge of the point's nearest circle cannot hold its nearest segment, so
+    each point is solved against a handful of blocks instead of every
+    segment, in one vectorized pass over all (point, block) pairs. The
+    pruning is conservative: results match projecting onto every segment.
+    """
+
+    def __init__(self, line_coords, block=32):
+        line = np.asarray(line_coords, dtype=np.float64)
+        self.line = line
+        self.block = block
+        lng, lat = line[:, 0], line[:, 1]
+
+        self.seg_len_m = haversine_m(lat[:-1], lng[:-1], lat[1:], lng[1:])
+        self.cum_m = np.concatenate(([0.0], np.cumsum(self.seg_len_m)))
+        self.total_m = float(self.cum_m[-1])
+
+        rad = np.radians(line)
+        ax, ay = rad[:-1, 0], rad[:-1, 1]
+        k = np.cos((rad[:-1, 1] + rad[1:, 1]) / 2)
+        sx = (rad[1:, 0] - ax) * k
+        sy = rad[1:, 1] - ay
+        seg_len2 = sx * sx + sy * sy
+        segs = np.stack([ax, ay, k, sx, sy, np.where(seg_len2 > 0, seg_len2, 1.0)])
+        self.n_segs = segs.shape[1]
+
+        # Block b holds segments [b * block, (b + 1) * block), i.e. vertices b * block ... (b + 1) * block.
+        # The last block is padded by repeating the final segment, which cannot change any nearest result.
+        n_blocks = max(1, -(-self.n_segs // block))
+        padded = np.minimum(np.arange(n_blocks * block), max(0, self.n_segs - 1))
+        # Field-major (6, n_blocks, block): a candidate block is one contiguous row per field.
+        self._seg_idx = padded.reshape(n_blocks, block)
+        self._blocks = segs[:, padded].reshape(6, n_blocks, block) if self.n_segs else segs
+        vertices = np.minimum(np.arange(n_blocks)[:, None] * block + np.arange(block + 1), len(line) - 1)
+        blk_lng, blk_lat = lng[vertices], lat[vertices]
+        self._centre_lng = (blk_lng.min(axis=1) + blk_lng.max(axis=1)) / 2
+        self._centre_lat = (blk_lat.min(axis=1) + blk_lat.max(axis=1)) / 2
+        self._radius_m = haversine_m(self._centre_lat[:, None], self._centre_lng[:, None], blk_lat, blk_lng).max(axis=1)
+
+    def project(self, lats, lngs):
+        """Returns (along_m, offset_m) per point: haversine metres along the line to the nearest point, and metres off it."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        along_m = np.full(len(lats), np.nan)
+        offset_m = np.full(len(lats), np.inf)
+        if not len(lats) or not self.n_segs:
+            return along_m, offset_m
+
+        step = max(1, _PROJECTION_CHUNK // len(self._radius_m))
+        for start in range(0, len(lats), step):
+            end = start + step
+            points, blocks = self._candidate_blocks(lats[start:end], lngs[start:end])
+            self._solve(lats, lngs, points + start, blocks, along_m, offset_m)
+        return along_m, offset_m
+
+    def _candidate_blocks(self, lats, lngs):
+        # Equirectangular distance from each point to each block centre, in its own frame.
+        k = np.cos(np.radians(lats))[:, None]
+        dx = np.radians(self._centre_lng - lngs[:, None]) * k
+        dy = np.radians(self._centre_lat - lats[:, None])
+        d = np.sqrt(dx * dx + dy * dy) * EARTH_RADIUS_M
+
+        upper = (d + self._radius_m).min(axis=1)
+        # A 1% + 10 m margin absorbs the gap between the per-point and per-segment frames.
+        lower = d - self._radius_m
+        return np.nonzero(lower <= upper[:, None] * 1.01 + 10.0)
+
+    def _solve(self, lats, lngs, points, blocks, along_m, offset_m):
+        # Pairs come out grouped by point; a point's pairs may span two batches, so keep the running minimum.
+        per_batch = max(1, _PROJECTION_CHUNK // self.block)
+        for start in range(0, len(points), per_batch):
+            pts = points[start:start + per_batch]
+            blk = blocks[start:start + per_batch]
+            ax, ay, k, sx, sy, len2 = self._blocks[:, blk]
+
+            px = (np.radians(lngs[pts])[:, None] - ax) * k
+            py = np.radians(lats[pts])[:, None] - ay
+            t = np.clip((px * sx + py * sy) / len2, 0.0, 1.0)
+            dx = px - t * sx
+            dy = py - t * sy
+            d2 = dx * dx + dy * dy
+
+            rows = np.arange(len(pts))
+            col = np.argmin(d2, axis=1)
+            pair_m = np.sqrt(d2[rows, col]) * EARTH_RADIUS_M
+            best_seg = self._seg_idx[blk, col]
+            pair_along = self.cum_m[best_seg] + t[rows, col] * self.seg_len_m[best_seg]
+
+            # Nearest pair per point: order by (point, distance) and keep each point's first pair.
+            order = np.lexsort((pair_m, pts))
+            uniq, first = np.unique(pts[order], return_index=True)
+            pick = order[first]
+            better = pair_m[pick] < offset_m[uniq]
+            offset_m[uniq[better]] = pair_m[pick[better]]
+            along_m[uniq[better]] = pair_along[pick[better]]
+
+
+def _offsets_to_chord(pts, a, b):
+    """
+    Distance in metres from each point to the segment a-b, measured in each
+    point's local frame. a and b are one [lng, lat] pair or one per point.
+    """
+    k = np.cos(pts[:, 1])
+    ax = (a[..., 0] - pts[:, 0]) * k
+    ay = a[..., 1] - pts[:, 1]
+    bx = (b[..., 0] - pts[:, 0]) * k
+    by = b[..., 1] - pts[:, 1]
+    sx, sy = bx - ax, by - ay
+    len2 = sx * sx + sy * sy
+    t = np.clip(-(ax * sx + ay * sy) / np.where(len2 > 0, len2, 1.0), 0.0, 1.0)
+    dx = ax + t * sx
+    dy = ay + t * sy
+    return np.sqrt(dx * dx + dy * dy) * EARTH_RADIUS_M
+
+
+def simplify_polyline(coords, tolerance_m):
+    """
+    Ramer-Douglas-Peucker simplification of a [lng, lat] polyline.
+
+    Every dropped vertex lies within tolerance_m of the simplified line.
+    Offsets are measured around each vertex's own latitude, so the bound
+    holds across the whole country rather than only near one reference
+    latitude. Returns the kept coordinates as a list of [lng, lat].
+
+    All open spans of one recursion level are split in a single numpy pass,
+    so the Python loop runs once per level (about log2 of the kept
+    vertices) instead of once per split.
+    """
+    pts = np.asarray(coords, dtype=np.float64)
+    if len(pts) < 3:
+        return pts.tolist()
+
+    rad = np.radians(pts)
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    starts = np.array([0])
+    ends = np.array([len(pts) - 1])
+    while len(starts):
+        inner = ends - starts - 1
+        open_ = inner > 0
+        starts, ends, inner = starts[open_], ends[open_], inner[open_]
+        if not len(starts):
+            break
+
+        # Every interior vertex of every open span, tagged with its span.
+        first = np.cumsum(inner) - inner
+        span = np.repeat(np.arange(len(starts)), inner)
+        idx = starts[span] + 1 + np.arange(len(span)) - first[span]
+        offsets = _offsets_to_chord(rad[idx], rad[starts[span]], rad[ends[span]])
+
+        # Worst vertex per span; ties go to the earliest, as np.argmax does.
+        worst_offset = np.maximum.reduceat(offsets, first)
+        split = worst_offset > tolerance_m
+        at_max = np.flatnonzero((offsets == worst_offset[span]) & split[span])
+        at_max = at_max[np.diff(span[at_max], prepend=-1) != 0]
+        mid = idx[at_max]
+        keep[mid] = True
+        starts, ends = np.concatenate((starts[split], mid)), np.concatenate((mid, ends[split]))
+
+    return pts[keep].tolist()
+
+
+def densify_polyline(coords, max_step_deg):
+    """Inserts vertices so no segment spans more than max_step_deg in lng or lat."""
+    line = np.asarray(coords, dtype=np.float64)
+    seg = np.diff(line, axis=0)
+    parts = np.maximum(1, np.ceil(np.abs(seg).max(axis=1) / max_step_deg).astype(np.int64))
+    seg_idx = np.repeat(np.arange(len(seg)), parts)
+    within = np.arange(len(seg_idx)) - np.repeat(np.cumsum(parts) - parts, parts) + 1
+    t = (within / np.repeat(parts, parts))[:, None]
+    return np.concatenate((line[:1], line[seg_idx] + t * seg[seg_idx]))
+
+
+def encode_polyline(coords, precision=5):
+    """Google encoded polyline for [lng, lat] coordinates (the format stores lat first)."""
+    pts = np.round(np.asarray(coords, dtype=np.float64)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(pts, axis=0, prepend=[[0, 0]]).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
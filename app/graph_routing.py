@@ -0,0 +1,251 @@
+"""
+In-process shortest paths over a preprocessed road network.
+
+The graph is stored as two CSR adjacency structures (forward and reverse)
+over int32/float64 numpy arrays. Every vertex of the source geometry is a
+node, so a path's node sequence is already the route polyline. Queries
+use bidirectional A* with average potentials: both searches run
+Dijkstra over the same reduced edge costs, so the usual bidirectional
+stopping rule (top_f + top_r >= best path) stays exact.
+"""
+import heapq
+import json
+import math
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M, METERS_PER_MILE
+
+_NODE_PRECISION = 6  # decimal places used to merge shared vertices between features
+_GRID_DEG = 0.05
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _haversine_np(lat1, lng1, lat2, lng2):
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dp, dl = p2 - p1, np.radians(lng2 - lng1)
+    a = np.sin(dp / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _csr(n, src, dst, weight):
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32), weight[order]
+
+
+class RoadGraph:
+
+    def __init__(self, lats, lngs, src, dst, weights):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        n = len(self.lats)
+        self.fwd = _csr(n, src, dst, weights)
+        self.rev = _csr(n, dst, src, weights)
+
+        cells = self._cells(self.lats, self.lngs)
+        self._node_order = np.argsort(cells, kind="stable")
+        self._cells_sorted = cells[self._node_order]
+
+    def __len__(self):
+        return len(self.lats)
+
+    @property
+    def edge_count(self):
+        return len(self.fwd[1])
+
+    @staticmethod
+    def _cells(lats, lngs):
+        iy = np.floor((np.asarray(lats) + 90.0) / _GRID_DEG).astype(np.int64)
+        ix = np.floor((np.asarray(lngs) + 180.0) / _GRID_DEG).astype(np.int64)
+        return iy * 10_000 + ix
+
+    @classmethod
+    def from_geojson(cls, path):
+        """
+        Builds a graph from LineString/MultiLineString features. Vertices
+        shared between features (to 1e-6 deg) become one node. A feature
+        property oneway of "yes"/"true"/"1" keeps only the drawn direction,
+        and "-1" keeps only the reverse.
+        """
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f).get("features", [])
+
+        node_ids = {}
+        lats, lngs, src, dst = [], [], [], []
+
+        def node(lng, lat):
+            key = (round(lng, _NODE_PRECISION), round(lat, _NODE_PRECISION))
+            idx = node_ids.get(key)
+            if idx is None:
+                idx = node_ids[key] = len(lats)
+                lats.append(key[1])
+                lngs.append(key[0])
+            return idx
+
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "LineString":
+                parts = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiLineString":
+                parts = geometry["coordinates"]
+            else:
+                continue
+
+            oneway = str((feature.get("properties") or {}).get("oneway", "no")).lower()
+            for part in parts:
+                ids = [node(c[0], c[1]) for c in part]
+                for a, b in zip(ids, ids[1:]):
+                    if a == b:
+                        continue
+                    if oneway != "-1":
+                        src.append(a)
+                        dst.append(b)
+                    if oneway not in ("yes", "true", "1"):
+                        src.append(b)
+                        dst.append(a)
+
+        lats_arr, lngs_arr = np.array(lats), np.array(lngs)
+        src_arr, dst_arr = np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+        weights = _haversine_np(lats_arr[src_arr], lngs_arr[src_arr], lats_arr[dst_arr], lngs_arr[dst_arr])
+        return cls(lats_arr, lngs_arr, src_arr, dst_arr, weights)
+
+    def save(self, path):
+        indptr, indices, weights = self.fwd
+        src = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(indptr))
+        np.savez_compressed(path, lats=self.lats, lngs=self.lngs, src=src, dst=indices, weights=weights)
+
+    @classmethod
+    def load(cls, path):
+        if str(path).endswith((".geojson", ".json")):
+            return cls.from_geojson(path)
+        with np.load(path) as data:
+            return cls(data["lats"], data["lngs"], data["src"], data["dst"], data["weights"])
+
+    def nearest_node(self, lat, lng, max_distance_m):
+        """Closest node within max_distance_m, searching grid rings outward; (node, meters) or None."""
+        base_iy = int(math.floor((lat + 90.0) / _GRID_DEG))
+        base_ix = int(math.floor((lng + 180.0) / _GRID_DEG))
+        cell_m = _GRID_DEG * 111320.0 * max(0.1, math.cos(math.radians(lat)))
+        max_ring = int(math.ceil(max_distance_m / cell_m)) + 1
+
+        best = None
+        for ring in range(max_ring + 1):
+            wanted = [
+                (base_iy + dy) * 10_000 + base_ix + dx
+                for dy in range(-ring, ring + 1)
+                for dx in range(-ring, ring + 1)
+                if max(abs(dy), abs(dx)) == ring
+            ]
+            for cell in wanted:
+                lo = np.searchsorted(self._cells_sorted, cell, side="left")
+                hi = np.searchsorted(self._cells_sorted, cell, side="right")
+                if lo == hi:
+                    continue
+                nodes = self._node_order[lo:hi]
+                dist = _haversine_np(lat, lng, self.lats[nodes], self.lngs[nodes])
+                i = int(np.argmin(dist))
+                if best is None or dist[i] < best[1]:
+                    best = (int(nodes[i]), float(dist[i]))
+            # Anything in the next ring is at least ring * cell_m away.
+            if best is not None and best[1] <= ring * cell_m:
+                break
+
+        if best is None or best[1] > max_distance_m:
+            return None
+        return best
+
+    def shortest_path(self, source: int, target: int):
+        """Bidirectional A* with average potentials; returns (meters, [node, ...]) or None."""
+        if source == target:
+            return 0.0, [source]
+
+        lats, lngs = self.lats, self.lngs
+        s_lat, s_lng, t_lat, t_lng = lats[source], lngs[source], lats[target], lngs[target]
+        potentials = {}
+
+        def potential(v):
+            # p_f(v) = (h_t(v) - h_s(v)) / 2; the reverse search uses -p_f.
+            p = potentials.get(v)
+            if p is None:
+                lat, lng = lats[v], lngs[v]
+                p = potentials[v] = (_haversine_m(lat, lng, t_lat, t_lng) - _haversine_m(lat, lng, s_lat, s_lng)) / 2
+            return p
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        settled = (set(), set())
+        heaps = ([(potential(source), source)], [(-potential(target), target)])
+        graphs = (self.fwd, self.rev)
+        signs = (1.0, -1.0)
+
+        best, meet = math.inf, -1
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            other = 1 - side
+            key, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            indptr, indices, weights = graphs[side]
+            lo, hi = indptr[u], indptr[u + 1]
+            d_u = dist[side][u]
+            for v, w in zip(indices[lo:hi].tolist(), weights[lo:hi].tolist()):
+                d_v = d_u + w
+                if d_v < dist[side].get(v, math.inf):
+                    dist[side][v] = d_v
+                    parent[side][v] = u
+                    heapq.heappush(heaps[side], (d_v + signs[side] * potential(v), v))
+                    if v in dist[other] and d_v + dist[other][v] < best:
+                        best, meet = d_v + dist[other][v], v
+
+        if meet < 0:
+            return None
+
+        path = []
+        v = meet
+        while v != -1:
+            path.append(v)
+            v = parent[0][v]
+        path.reverse()
+        v = parent[1][meet]
+        while v != -1:
+            path.append(v)
+            v = parent[1][v]
+        return best, path
+
+    def route(self, start_lat, start_lng, end_lat, end_lng, max_snap_m):
+        """
+        Same shape as fetch_route: {"polyline", "distance_miles"}. Returns None
+        when either end is farther than max_snap_m from the network or the
+        ends are not connected.
+        """
+        start = self.nearest_node(start_lat, start_lng, max_snap_m)
+        end = self.nearest_node(end_lat, end_lng, max_snap_m)
+        if start is None or end is None:
+            return None
+
+        found = self.shortest_path(start[0], end[0])
+        if found is None:
+            return None
+
+        meters, nodes = found
+        return {
+            "polyline": np.column_stack([self.lngs[nodes], self.lats[nodes]]).tolist(),
+            "distance_miles": meters / METERS_PER_MILE,
+        }
@@ -0,0 +1,107 @@
+import json
+import math
+
+import h3
+from django.db import connection
+
+from .constants import CACHE_TTL, CORRIDOR_RADIUS_METERS, H3_CORRIDOR_RESOLUTION
+from .geo import densify_polyline
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .station_data import get_station_data_generation
+from .station_index import StationIndex
+from .tiered_cache import stations_cache
+
+# Fudge for H3 cell-size variation across the globe (cells can be ~25% smaller than average).
+_EDGE_MARGIN = 0.75
+
+
+def corridor_cells(coords, radius_m=CORRIDOR_RADIUS_METERS, resolution=H3_CORRIDOR_RESOLUTION) -> set:
+    """
+    H3 cells guaranteed to contain every point within radius_m of the route.
+
+    The route is densified to half an edge length, and each vertex's cell
+    is expanded by enough rings to cover radius_m plus the worst-case
+    offset of a point inside its own cell.
+    """
+    edge_m = h3.average_hexagon_edge_length(resolution, unit="m")
+    step_m = edge_m / 2
+    dense = densify_polyline(coords, step_m / 111320.0)
+
+    reach_m = radius_m + step_m / 2 + 2 * edge_m
+    rings = int(math.ceil(reach_m / (1.5 * edge_m * _EDGE_MARGIN)))
+
+    base = {h3.latlng_to_cell(lat, lng, resolution) for lng, lat in dense.tolist()}
+    cells = set()
+    for cell in base:
+        cells.update(h3.grid_disk(cell, rings))
+    return cells
+
+
+def _cell_key(generation, cell):
+    return f"stations:h3:{generation}:{cell}"
+
+
+def _fetch_cells(cells, resolution=H3_CORRIDOR_RESOLUTION) -> dict:
+    """Loads priced, geocoded stations for the given cells from PostGIS, bucketed by cell."""
+    shape = h3.cells_to_h3shape(list(cells))
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                fs.id,
+                fs.truckstop_name,
+                fs.retail_price,
+                ST_Y(fs.location::geometry) AS lat,
+                ST_X(fs.location::geometry) AS lng
+            FROM fuel_stations fs
+            WHERE
+                fs.location IS NOT NULL
+                AND fs.retail_price > 0
+                AND ST_DWithin(fs.location, ST_GeomFromGeoJSON(%s)::geography, 200)
+        """, [json.dumps(shape.__geo_interface__)])
+        rows = cursor.fetchall()
+
+    buckets = {cell: [] for cell in cells}
+    for station_id, name, price, lat, lng in rows:
+        cell = h3.latlng_to_cell(lat, lng, resolution)
+        if cell in buckets:
+            buckets[cell].append((station_id, name, float(price), float(lat), float(lng)))
+    return buckets
+
+
+def stations_near_route_h3(coords, distance_miles, radius_m=CORRIDOR_RADIUS_METERS):
+    """
+    Corridor lookup assembled from per-cell station lists.
+
+    Each H3 cell's stations are cached on their own, keyed by the station
+    data generation. A route that overlaps earlier routes therefore only
+    queries PostGIS for the cells nobody has asked about yet. Mile markers
+    are then projected in-process. Returns None when the caller should use
+    the per-route PostGIS path instead.
+    """
+    try:
+        cells = corridor_cells(coords, radius_m)
+        generation = get_station_data_generation()
+        keys = {_cell_key(generation, cell): cell for cell in cells}
+
+        cached = stations_cache.get_many(keys)
+        missing = [cell for key, cell in keys.items() if key not in cached]
+        if missing:
+            fetched = _fetch_cells(missing)
+            stations_cache.set_many({_cell_key(generation, cell): fetched[cell] for cell in missing}, CACHE_TTL)
+            cached.update({_cell_key(generation, cell): fetched[cell] for cell in missing})
+
+        handle_info_log(
+            f"H3 corridor: {len(cells)} cells, {len(missing)} fetched",
+            view_name="stations_near_route_h3",
+            app_name=APP_NAME,
+        )
+
+        rows = [row for key in keys for row in cached[key] or ()]
+        if not rows:
+            return []
+
+        ids, names, prices, lats, lngs = zip(*rows)
+        return StationIndex(ids, names, prices, lats, lngs).near_route(coords, distance_miles, radius_m)
+    except Exception as e:
+        handle_error_log(e, view_name="stations_near_route_h3", app_name=APP_NAME)
+        return None
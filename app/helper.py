@@ -1,14 +1,52 @@
-import inspect
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 import sys
 import re
 
+from .constants import LOG_QUEUE_SIZE, LOG_SAMPLE_RATES
+
 logger = logging.getLogger(__name__)
 
 ERROR_MSG = "Something went wrong, please try again later!"
 APP_NAME = "app"
 
+# Attributes every LogRecord has; anything else on a record came from `extra`.
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _parse_sample_rates(raw):
+    """"app.services=0.1,app.ingest=0.01" -> {"app.services": 0.1, "app.ingest": 0.01}"""
+    rates = {}
+    for item in raw.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+_rate_cache = {}
+
+
+def _sample_rate(name):
+    """Rate of the most specific configured ancestor of logger `name` (1.0 when none is)."""
+    rate = _rate_cache.get(name)
+    if rate is None:
+        rate, probe = 1.0, name
+        while probe:
+            if probe in _sample_rates:
+                rate = _sample_rates[probe]
+                break
+            probe = probe.rpartition(".")[0]
+        _rate_cache[name] = rate
+    return rate
+
 
 def _get_caller_info(skip=2):
     """
@@ -17,15 +55,22 @@ def _get_caller_info(skip=2):
         0 = this function
         1 = log wrapper
         2 = actual caller
+
+    sys._getframe only walks frame pointers; inspect.stack() would build a
+    FrameInfo with source context for every frame on the stack.
     """
     try:
-        frame = inspect.stack()[skip]
-        full_path = os.path.abspath(frame.filename)
-        line = frame.lineno
-        return full_path, line
+        frame = sys._getframe(skip)
+        return os.path.abspath(frame.f_code.co_filename), frame.f_lineno
     except Exception:
         return "unknown", "unknown"
-    
+
+
+def _caller_logger(frame):
+    # One logger per calling module, so levels and sampling can be set per module.
+    return logging.getLogger(frame.f_globals.get("__name__", __name__))
+
+
 def handle_error_log(e, view_name, app_name, extra_values=None):
     try:
         # Try to extract traceback info first
@@ -38,14 +83,16 @@ def handle_error_log(e, view_name, app_name, extra_values=None):
             # No traceback (can happen in signal handlers)
             full_path, line = _get_caller_info(skip=2)
 
-        logger.error(
-            f"Error | File: {full_path} | "
-            f"Line: {line} | "
-            f"View: {view_name} | "
-            f"Error: {str(e)} | "
-            f"Extra: {extra_values}",
-            extra={"AppName": app_name},
-            exc_info=True,   # Proper stacktrace logging
+        _caller_logger(sys._getframe(1)).error(
+            str(e),
+            extra={
+                "AppName": app_name,
+                "view": view_name,
+                "caller_file": full_path,
+                "caller_line": line,
+                "extra_values": extra_values,
+            },
+            exc_info=exc_tb is not None,
         )
 
     except Exception as log_error:
@@ -54,16 +101,107 @@ def handle_error_log(e, view_name, app_name, extra_values=None):
 
 def handle_info_log(msg, view_name, app_name, extra_values=None):
     try:
-        full_path, line = _get_caller_info(skip=2)
-
-        logger.info(
-            f"Info | File: {full_path} | "
-            f"Line: {line} | "
-            f"View: {view_name} | "
-            f"Message: {msg} | "
-            f"Extra: {extra_values}",
-            extra={"AppName": app_name},
+        frame = sys._getframe(1)
+        log = _caller_logger(frame)
+        # Level and sampling are decided before any formatting or caller lookup.
+        if not log.isEnabledFor(logging.INFO):
+            return
+        rate = _sample_rate(log.name)
+        if rate < 1.0 and random.random() >= rate:
+            return
+
+        log.info(
+            msg,
+            extra={
+                "AppName": app_name,
+                "view": view_name,
+                "caller_file": os.path.abspath(frame.f_code.co_filename),
+                "caller_line": frame.f_lineno,
+                "extra_values": extra_values,
+            },
         )
 
     except Exception as log_error:
-        print("LOGGER FAILURE:", log_error)
\ No newline at end of file
+        print("LOGGER FAILURE:", log_error)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, caller and any extra fields."""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "file": getattr(record, "caller_file", record.pathname),
+            "line": getattr(record, "caller_line", record.lineno),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in ("caller_file", "caller_line") and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues without blocking: when the writer falls behind, records are dropped."""
+
+    def prepare(self, record):
+        # The stock prepare() pre-formats with a plain Formatter and drops
+        # exc_info; merge the args only and let the file handlers format.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_listener = None
+
+
+def install_queue_logging(logger_name=APP_NAME):
+    """
+    Moves the handlers configured for `logger_name` (the RotatingFileHandlers
+    from settings.LOGGING) behind a bounded queue drained by a background
+    thread, so callers only pay for an enqueue. Idempotent. The listener is
+    restarted in forked children (Celery prefork, gunicorn --preload)
+    because threads do not survive fork.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    target = logging.getLogger(logger_name)
+    handlers = [h for h in target.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    if not handlers:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(_DroppingQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener_in_child)
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_listener_in_child():
+    # The parent's drain thread is gone in the child; start a fresh one on the same queue.
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
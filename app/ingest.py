@@ -0,0 +1,161 @@
+import io
+
+import pandas as pd
+from django.db import connection, transaction
+
+from .constants import INGEST_CHUNK_ROWS, REQUIRED_COLUMNS
+
+# Staging column order; matches the column order written by _chunk_to_csv.
+STAGING_COLUMNS = ("opis_id", "truckstop_name", "address", "city", "state", "rack_id", "retail_price")
+_SOURCE_COLUMNS = dict(zip(REQUIRED_COLUMNS, STAGING_COLUMNS))
+
+
+def _check_columns(columns):
+    for col in REQUIRED_COLUMNS:
+        if col not in columns:
+            raise ValueError(f"Missing column: {col}")
+
+
+def _excel_chunks(path, chunksize):
+    # pandas cannot stream .xlsx, so walk the sheet with openpyxl in read-only mode.
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        _check_columns(header)
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_upload_chunks(path: str, chunksize: int = INGEST_CHUNK_ROWS):
+    """
+    Yields the upload as DataFrames of at most chunksize rows holding only
+    REQUIRED_COLUMNS, so memory stays flat however large the daily file is.
+    """
+    if path.endswith(".csv"):
+        header = pd.read_csv(path, nrows=0).columns.str.strip()
+        _check_columns(header)
+        reader = pd.read_csv(path, chunksize=chunksize, skipinitialspace=True)
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk[REQUIRED_COLUMNS]
+    else:
+        for chunk in _excel_chunks(path, chunksize):
+            yield chunk[REQUIRED_COLUMNS]
+
+
+def _chunk_to_csv(chunk: pd.DataFrame) -> tuple:
+    """Normalizes a chunk into COPY-ready CSV text. Returns (buffer, rows_read, rows_written)."""
+    df = chunk.rename(columns=_SOURCE_COLUMNS)
+    df["opis_id"] = pd.to_numeric(df["opis_id"], errors="coerce").astype("Int64")
+    df["rack_id"] = pd.to_numeric(df["rack_id"], errors="coerce").astype("Int64")
+    df["retail_price"] = pd.to_numeric(df["retail_price"], errors="coerce").round(4)
+    for col in _TEXT_COLUMNS:
+        df[col] = df[col].fillna("").astype(str).str.strip()
+
+    valid = df.dropna(subset=["opis_id", "retail_price"])
+
+    buffer = io.StringIO()
+    valid.to_csv(buffer, columns=list(STAGING_COLUMNS), header=False, index=False)
+    buffer.seek(0)
+    return buffer, len(df), len(valid)
+
+
+_CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE fuel_stations_staging (
+        seq BIGSERIAL,
+        opis_id INTEGER NOT NULL,
+        truckstop_name VARCHAR(255) NOT NULL,
+        address VARCHAR(255) NOT NULL,
+        city VARCHAR(100) NOT NULL,
+        state VARCHAR(2) NOT NULL,
+        rack_id INTEGER,
+        retail_price NUMERIC(6, 4) NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# CSV COPY reads an unquoted empty field as NULL; blank names, addresses and
+# cities are stored as "", as the old bulk_create did.
+_TEXT_COLUMNS = ("truckstop_name", "address", "city", "state")
+_COPY_SQL = (
+    f"COPY fuel_stations_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN "
+    f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(_TEXT_COLUMNS)}))"
+)
+
+# The first row per opis_id wins, as with the old ignore_conflicts insert.
+# The WHERE on DO UPDATE skips rows whose name and price did not change, so
+# RETURNING only sees real writes; xmax = 0 marks a freshly inserted tuple.
+_MERGE_SQL = """
+    WITH src AS (
+        SELECT DISTINCT ON (opis_id)
+            opis_id, truckstop_name, address, city, state, rack_id, retail_price
+        FROM fuel_stations_staging
+        ORDER BY opis_id, seq
+    ),
+    merged AS (
+        INSERT INTO fuel_stations (
+            opis_id, truckstop_name, address, city, state, rack_id, retail_price, created_at, updated_at
+        )
+        SELECT opis_id, truckstop_name, address, city, state, rack_id, retail_price, now(), now()
+        FROM src
+        ON CONFLICT (opis_id) DO UPDATE SET
+            truckstop_name = EXCLUDED.truckstop_name,
+            retail_price = EXCLUDED.retail_price,
+            updated_at = now()
+        WHERE (fuel_stations.truckstop_name, fuel_stations.retail_price)
+            IS DISTINCT FROM (EXCLUDED.truckstop_name, EXCLUDED.retail_price)
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT
+        (SELECT count(*) FROM src),
+        count(*) FILTER (WHERE inserted),
+        count(*) FILTER (WHERE NOT inserted)
+    FROM merged
+"""
+
+
+def ingest_fuel_prices(path: str, chunksize: int = INGEST_CHUNK_ROWS) -> dict:
+    """
+    Streams an OPIS price file into fuel_stations.
+
+    Every chunk is COPY'd into one transaction-local staging table. Once
+    the whole file is staged, a single INSERT ... ON CONFLICT (opis_id)
+    DO UPDATE merges it, so price and name changes land in place and the
+    upload commits all at once. Returns exact counts: total (rows read),
+    skipped (rows without an id or price), duplicates (repeated opis_ids),
+    inserted, updated and unchanged.
+    """
+    total = written = 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_CREATE_STAGING_SQL)
+
+        for chunk in iter_upload_chunks(path, chunksize):
+            buffer, rows_read, rows_written = _chunk_to_csv(chunk)
+            total += rows_read
+            written += rows_written
+            if rows_written:
+                cursor.copy_expert(_COPY_SQL, buffer)
+
+        cursor.execute(_MERGE_SQL)
+        distinct, inserted, updated = cursor.fetchone()
+
+    return {
+        "total": total,
+        "skipped": total - written,
+        "duplicates": written - distinct,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": distinct - inserted - updated,
+    }
@@ -0,0 +1,136 @@
+"""
+Route-planning jobs: large or batch plans computed by the route_processing
+Celery workers instead of a request thread.
+
+A job row holds the pairs, status and progress. Workers push an
+update per finished pair to the job's channel-layer group, which
+RouteJobConsumer relays to WebSocket clients. For clients that poll the
+status endpoint instead, finished pairs are appended as RouteJobResult
+rows at most every ROUTE_JOB_SAVE_SECONDS; each save writes only the
+entries since the previous one.
+
+A pair that cannot be planned is recorded as an error entry and the job
+still completes; the job fails only when the batch itself cannot run
+(see optimize_route_batch).
+"""
+import functools
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+
+from .batch import optimize_route_batch
+from .constants import ROUTE_JOB_SAVE_SECONDS
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .models import RouteJob, RouteJobResult
+
+FINAL_STATUSES = (RouteJob.Status.COMPLETED, RouteJob.Status.FAILED)
+
+
+def job_group(job_id) -> str:
+    return f"route_job_{job_id}"
+
+
+def publish(job_id, message: dict):
+    """Sends an update to the job's WebSocket subscribers; progress is best effort and never fails the job."""
+    try:
+        layer = get_channel_layer()
+        if layer is not None:
+            async_to_sync(layer.group_send)(job_group(job_id), {"type": "job.update", "job_id": str(job_id), **message})
+    except Exception as e:
+        handle_error_log(e, view_name="publish", app_name=APP_NAME, extra_values={"job_id": str(job_id)})
+
+
+def load_job_snapshot(job_id):
+    job = RouteJob.objects.filter(id=job_id).first()
+    return job.snapshot() if job is not None else None
+
+
+class JobProgress:
+    """
+    on_result callback for optimize_route_batch: publishes every entry and,
+    once save_seconds have passed since the last save, passes the entries
+    finished since then to save(completed, new_entries). Call flush() when
+    the batch ends to save the rest; `saved` counts the entries saved so far.
+    """
+
+    def __init__(self, job_id, total, save, save_seconds=ROUTE_JOB_SAVE_SECONDS):
+        self.job_id = job_id
+        self.total = total
+        self.save = save
+        self.save_seconds = save_seconds
+        self.completed = 0
+        self.saved = 0
+        self.failed = 0
+        self._pending = []
+        self._saved_at = time.monotonic()
+
+    def __call__(self, entry):
+        self.completed += 1
+        self.failed += "error" in entry
+        self._pending.append(entry)
+        publish(self.job_id, {
+            "status": RouteJob.Status.RUNNING,
+            "completed": self.completed,
+            "total": self.total,
+            "entry": entry,
+        })
+        if time.monotonic() - self._saved_at >= self.save_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.save(self.completed, pending)
+            self.saved = self.completed
+        self._saved_at = time.monotonic()
+
+
+def _append_results(job_id, completed, entries):
+    with transaction.atomic():
+        RouteJobResult.objects.bulk_create(
+            [RouteJobResult(job_id=job_id, index=entry["index"], entry=entry) for entry in entries]
+        )
+        RouteJob.objects.filter(id=job_id).update(completed_pairs=completed)
+
+
+def run_route_job(job_id):
+    job = RouteJob.objects.get(id=job_id)
+    if job.status in FINAL_STATUSES:
+        # A redelivered message (acks_late) for a job that already finished.
+        return job.status
+
+    job.status = RouteJob.Status.RUNNING
+    job.started_at = timezone.now()
+    job.completed_pairs = 0
+    job.save(update_fields=["status", "started_at", "completed_pairs"])
+    # A worker lost mid-run leaves rows behind; the redelivered run starts over.
+    RouteJobResult.objects.filter(job_id=job_id).delete()
+    publish(job_id, {"status": job.status, "completed": 0, "total": job.total_pairs})
+
+    progress = JobProgress(job_id, job.total_pairs, functools.partial(_append_results, job_id))
+    try:
+        try:
+            optimize_route_batch(job.pairs, on_result=progress)
+        finally:
+            # Pairs finished before a failure are kept, so the job shows how far it got.
+            progress.flush()
+        job.status = RouteJob.Status.COMPLETED
+    except Exception as e:
+        job.status = RouteJob.Status.FAILED
+        job.error_message = str(e)
+        handle_error_log(e, view_name="run_route_job", app_name=APP_NAME, extra_values={"job_id": str(job_id)})
+
+    job.completed_pairs = progress.saved
+    job.finished_at = timezone.now()
+    job.save()
+    publish(job_id, {"status": job.status, "completed": job.completed_pairs, "total": job.total_pairs, "error": job.error_message})
+
+    handle_info_log(
+        f"Route job {job_id}: {job.status}, {job.completed_pairs}/{job.total_pairs} pairs, {progress.failed} failed",
+        view_name="run_route_job",
+        app_name=APP_NAME,
+    )
+    return job.status
@@ -0,0 +1,221 @@
+"""
+Open-loop load generator for the route and upload endpoints.
+
+Requests are fired on a fixed schedule (request i at t0 + i / rps) whether
+or not earlier ones have finished, and latency is measured from the
+scheduled send time. A server that falls behind therefore shows up as
+queueing in the percentiles instead of quietly lowering the offered load.
+Per-request DB query and cache counts come from the X-DB-Queries /
+X-Cache-* headers that RequestStatsMiddleware adds when LOADTEST_STATS is on.
+"""
+import asyncio
+import contextlib
+import csv
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from .constants import REQUIRED_COLUMNS
+
+ROUTE_PATH = "/api/route-optimize/"
+UPLOAD_PATH = "/api/upload-fuel-data/"
+
+# Histogram bucket upper bounds in milliseconds.
+HISTOGRAM_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Synthetic upload rows use opis_id LOADTEST_OPIS_ID_BASE + i and a "LOADTEST STOP i" name.
+LOADTEST_OPIS_ID_BASE = 100000
+
+
+def load_traffic(path):
+    """
+    O/D pairs to replay, from a CSV with start,end[,strategy] columns or a
+    JSON-lines file of request bodies. Returns a list of request bodies.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            return [json.loads(line) for line in f if line.strip()]
+        return [
+            {k: v for k, v in row.items() if v not in (None, "")}
+            for row in csv.DictReader(f)
+        ]
+
+
+def synthetic_traffic(pairs=200, distinct_addresses=50, seed=0):
+    """
+    Route request bodies over a fixed pool of street addresses. Street
+    addresses skip the gazetteer, so they exercise the geocoder, and
+    repeated pairs exercise the caches.
+    """
+    rng = np.random.default_rng(seed)
+    addresses = [f"{100 + i} Loadtest Ave, Springfield" for i in range(distinct_addresses)]
+    picks = rng.integers(0, distinct_addresses, size=(pairs, 2))
+    return [{"start": addresses[a], "end": addresses[b]} for a, b in picks.tolist() if a != b]
+
+
+def synthetic_fuel_csv(rows=1000, seed=0) -> bytes:
+    """
+    A valid OPIS price file of `rows` stations, for exercising the upload
+    endpoint. Uploading it upserts real FuelStation rows, so only send it to
+    a disposable database.
+    """
+    rng = np.random.default_rng(seed)
+    prices = np.clip(rng.normal(3.6, 0.35, rows), 2.5, 6.0).round(4)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(REQUIRED_COLUMNS)
+    for i in range(rows):
+        writer.writerow([LOADTEST_OPIS_ID_BASE + i, f"LOADTEST STOP {i}", f"I-{i % 90} EXIT {i % 300}", "Dallas", "TX", i % 500, prices[i]])
+    return out.getvalue().encode()
+
+
+async def _send(client, scenario, body, upload_csv):
+    if scenario == "upload":
+        return await client.post(UPLOAD_PATH, files={"file": ("loadtest.csv", upload_csv, "text/csv")})
+    # RouteOptimizeAPI reads a JSON body on GET.
+    return await client.request("GET", ROUTE_PATH, json=body)
+
+
+async def replay(base_url, bodies, rps, duration, scenario="route", timeout=30.0, max_in_flight=1000, upload_rows=1000):
+    """
+    Sends rps * duration requests at a constant rate, cycling through bodies.
+    Returns (records, elapsed seconds). A record is a dict with latency_ms,
+    status (None on a transport error), error and the server stat headers.
+    """
+    total = max(1, int(rps * duration))
+    upload_csv = synthetic_fuel_csv(upload_rows) if scenario == "upload" else None
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    in_flight = asyncio.Semaphore(max_in_flight)
+    records = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def fire(i, scheduled):
+            async with in_flight:
+                record = {"status": None, "error": None}
+                try:
+                    resp = await _send(client, scenario, bodies[i % len(bodies)], upload_csv)
+                    record["status"] = resp.status_code
+                    for header in ("X-DB-Queries", "X-Cache-Hits", "X-Cache-Misses"):
+                        if header in resp.headers:
+                            record[header] = int(resp.headers[header])
+                except httpx.HTTPError as e:
+                    record["error"] = type(e).__name__
+                record["latency_ms"] = (time.perf_counter() - scheduled) * 1000
+                records.append(record)
+
+        start = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(i, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return records, elapsed
+
+
+def summarize(records, elapsed, bounds_ms=HISTOGRAM_BOUNDS_MS) -> dict:
+    latencies = np.array([r["latency_ms"] for r in records]) if records else np.zeros(0)
+    ok = [r for r in records if r["status"] is not None and r["status"] < 400]
+
+    statuses = {}
+    for r in records:
+        key = str(r["status"]) if r["status"] is not None else (r["error"] or "error")
+        statuses[key] = statuses.get(key, 0) + 1
+
+    edges = np.array((0,) + tuple(bounds_ms) + (np.inf,))
+    counts, _ = np.histogram(latencies, bins=edges)
+    histogram = [
+        {"le_ms": None if np.isinf(hi) else float(hi), "count": int(c)}
+        for hi, c in zip(edges[1:], counts)
+    ]
+
+    def pct(q):
+        return round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+
+    with_stats = [r for r in records if "X-DB-Queries" in r]
+    hits = sum(r.get("X-Cache-Hits", 0) for r in with_stats)
+    misses = sum(r.get("X-Cache-Misses", 0) for r in with_stats)
+
+    return {
+        "requests": len(records),
+        "succeeded": len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+        "ok_throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {"p50": pct(50), "p90": pct(90), "p99": pct(99), "max": pct(100)},
+        "statuses": statuses,
+        "histogram": histogram,
+        "cache_hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "db_queries_per_request": round(sum(r["X-DB-Queries"] for r in with_stats) / len(with_stats), 2) if with_stats else None,
+    }
+
+
+def format_report(summary, width=40) -> str:
+    lat = summary["latency_ms"]
+    lines = [
+        f"requests: {summary['requests']}  ok: {summary['succeeded']}  "
+        f"elapsed: {summary['elapsed_s']}s  throughput: {summary['throughput_rps']} rps "
+        f"({summary['ok_throughput_rps']} ok rps)",
+        f"latency ms: p50 {lat['p50']}  p90 {lat['p90']}  p99 {lat['p99']}  max {lat['max']}",
+        f"statuses: {summary['statuses']}",
+        f"cache hit rate: {summary['cache_hit_rate']}  db queries/request: {summary['db_queries_per_request']}",
+    ]
+    peak = max((b["count"] for b in summary["histogram"]), default=0) or 1
+    for bucket in summary["histogram"]:
+        label = f"<= {bucket['le_ms']:g} ms" if bucket["le_ms"] is not None else "> max bound"
+        bar = "#" * round(bucket["count"] / peak * width)
+        lines.append(f"{label:>14} {bucket['count']:>7} {bar}")
+    return "\n".join(lines)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"gunicorn did not listen on port {port} within {timeout}s")
+
+
+@contextlib.contextmanager
+def gunicorn_server(env, workers=4, asgi=False, port=None):
+    """
+    Starts gunicorn for this project with the given extra environment and
+    yields its base URL. The server is terminated on exit.
+    """
+    port = port or _free_port()
+    app = "spotter.asgi:application" if asgi else "spotter.wsgi:application"
+    cmd = [sys.executable, "-m", "gunicorn", app, "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    if asgi:
+        cmd += ["-k", "uvicorn_worker.UvicornWorker"]
+
+    process = subprocess.Popen(cmd, env={**os.environ, **env})
+    try:
+        _wait_for_port(port, process)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
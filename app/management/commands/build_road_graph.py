@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.constants import ROAD_GRAPH_PATH
+from app.graph_routing import RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Preprocesses a GeoJSON road extract into the compact graph used by ROUTING_BACKEND=graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="GeoJSON FeatureCollection of LineString/MultiLineString roads")
+        parser.add_argument("--output", default=ROAD_GRAPH_PATH, help="Destination .npz (default: ROAD_GRAPH_PATH)")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        graph = RoadGraph.from_geojson(options["source"])
+        graph.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(graph)} nodes, {graph.edge_count} edges -> {options['output']} "
+            f"({time.perf_counter() - start:.1f}s)"
+        ))
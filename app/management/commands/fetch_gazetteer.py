@@ -0,0 +1,44 @@
+import os
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from app.constants import GAZETTEER_NATIONAL_PATH, GAZETTEER_URL
+from app.gazetteer import Gazetteer
+
+
+class Command(BaseCommand):
+    help = "Downloads the Census Gazetteer national places file used to answer city-level queries locally."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default=GAZETTEER_URL, help="Places file to download (default: GAZETTEER_URL)")
+        parser.add_argument("--output", default=GAZETTEER_NATIONAL_PATH, help="Destination (default: GAZETTEER_NATIONAL_PATH)")
+        parser.add_argument("--if-missing", action="store_true", help="Do nothing when the destination already exists")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if options["if_missing"] and os.path.exists(output):
+            self.stdout.write(f"{output} already exists")
+            return
+
+        start = time.perf_counter()
+        partial = f"{output}.part"
+        try:
+            with requests.get(options["url"], stream=True, timeout=60) as resp:
+                resp.raise_for_status()
+                with open(partial, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+            # Only a file that loads replaces the current one.
+            places = Gazetteer.from_file(partial).size
+        except (requests.RequestException, OSError, ValueError) as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise CommandError(f"Could not fetch the gazetteer from {options['url']}: {e}") from e
+
+        os.replace(partial, output)
+        self.stdout.write(self.style.SUCCESS(
+            f"{places} places -> {output} ({time.perf_counter() - start:.1f}s); "
+            "restart the workers to load it"
+        ))
@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app.loadtest import format_report, gunicorn_server, load_traffic, replay, summarize, synthetic_traffic
+from app.stubs import StubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays O/D traffic at a target rate against gunicorn, with local stand-ins for "
+        "the geocoder and OSRM, and reports latency, cache hit rate and DB queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", choices=("route", "upload"), default="route")
+        parser.add_argument("--traffic", help="CSV (start,end[,strategy]) or JSON-lines of request bodies; synthetic pairs if omitted")
+        parser.add_argument("--rps", type=float, default=20.0)
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic to send")
+        parser.add_argument("--target", help="Base URL of an already running server; skips starting gunicorn and the stubs")
+        parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+        parser.add_argument("--asgi", action="store_true", help="Run gunicorn with uvicorn workers")
+        parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+        parser.add_argument("--stub-jitter-ms", type=float, default=50.0)
+        parser.add_argument("--stub-failure-rate", type=float, default=0.0)
+        parser.add_argument("--max-in-flight", type=int, default=1000)
+        parser.add_argument("--output", help="Write the summary as JSON to this path")
+        parser.add_argument(
+            "--allow-writes",
+            action="store_true",
+            help="Required for --scenario upload with --target: the run upserts LOADTEST stations into that server's database, "
+                 "so the target must be disposable. Without --target the upload scenario always uses a throwaway database.",
+        )
+
+    def handle(self, *args, **options):
+        bodies = load_traffic(options["traffic"]) if options["traffic"] else synthetic_traffic()
+        if not bodies:
+            raise CommandError("No requests in the traffic file")
+        upload = options["scenario"] == "upload"
+        if upload and options["target"] and not options["allow_writes"]:
+            raise CommandError(
+                "--scenario upload writes synthetic stations into the target's database; "
+                "pass --allow-writes only if that database is disposable"
+            )
+
+        def run(base_url):
+            records, elapsed = asyncio.run(replay(
+                base_url,
+                bodies,
+                rps=options["rps"],
+                duration=options["duration"],
+                scenario=options["scenario"],
+                max_in_flight=options["max_in_flight"],
+            ))
+            return summarize(records, elapsed)
+
+        if options["target"]:
+            summary = run(options["target"])
+        else:
+            stub = StubServer(
+                latency=options["stub_latency_ms"] / 1000,
+                jitter=options["stub_jitter_ms"] / 1000,
+                failure_rate=options["stub_failure_rate"],
+                seed=0,
+            )
+            env = {
+                "GEOCODE_URL": f"{stub.url}/search",
+                "OSRM_BASE_URL": stub.url,
+                "ROUTING_BACKEND": "osrm",
+                "LOADTEST_STATS": "True",
+            }
+            if upload:
+                # Uploads go to a throwaway database and an in-process broker, so the
+                # real stations table and the real workers never see them.
+                old_name = connection.settings_dict["NAME"]
+                env["DATABASE_NAME"] = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                env["CELERY_BROKER_URL"] = "memory://"
+                env["CELERY_RESULT_BACKEND"] = "cache+memory://"
+            try:
+                with stub, gunicorn_server(env, workers=options["workers"], asgi=options["asgi"]) as base_url:
+                    self.stdout.write(f"gunicorn at {base_url}, stubs at {stub.url}")
+                    summary = run(base_url)
+            finally:
+                if upload:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+            summary["upstream"] = {"requests": stub.requests, "injected_failures": stub.failures}
+
+        self.stdout.write(format_report(summary))
+        if "upstream" in summary:
+            self.stdout.write(f"upstream calls: {summary['upstream']}")
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
@@ -0,0 +1,90 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from app.benchmarks import STAGES, compare_to_baseline, load_results, logging_call_cost, run_benchmarks, save_results
+from app.constants import BENCHMARK_BASELINE_PATH, BENCHMARK_REGRESSION_THRESHOLD
+
+_LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class Command(BaseCommand):
+    help = "Times the route-optimization hot path on synthetic data and checks it against a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated station counts (up to 1000000)")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--miles", type=float, default=1500.0, help="Length of the synthetic route")
+        parser.add_argument(
+            "--postgis",
+            action="store_true",
+            help="Time get_stations_near_route against PostGIS. Creates and drops a test database; never touches the real one.",
+        )
+        parser.add_argument("--baseline", default=BENCHMARK_BASELINE_PATH)
+        parser.add_argument("--threshold", type=float, default=BENCHMARK_REGRESSION_THRESHOLD)
+        parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+        parser.add_argument("--output", help="Also write this run's results to the given path")
+        parser.add_argument("--logging", action="store_true", help="Only measure the per-call cost of info logging, old path vs new")
+
+    def handle(self, *args, **options):
+        if options["logging"]:
+            for name, micros in logging_call_cost().items():
+                self.stdout.write(f"{name:<32}{micros:>10.2f} us/call")
+            return
+
+        sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+        kwargs = {"sizes": sizes, "repeat": options["repeat"], "seed": options["seed"], "miles": options["miles"]}
+
+        if options["postgis"]:
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                # Keep generation bumps and corridor caching out of the shared Redis.
+                with override_settings(CACHES=_LOCMEM_CACHE):
+                    current = run_benchmarks(postgis=True, **kwargs)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        else:
+            current = run_benchmarks(**kwargs)
+
+        self._print(current, sizes)
+
+        if options["output"]:
+            save_results(current, options["output"])
+
+        baseline_path = options["baseline"]
+        if options["save_baseline"]:
+            save_results(current, baseline_path)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        if not os.path.exists(baseline_path):
+            self.stdout.write(f"No baseline at {baseline_path}; run with --save-baseline to create one.")
+            return
+
+        baseline = load_results(baseline_path)
+        if baseline.get("meta", {}).get("station_lookup") != current["meta"]["station_lookup"]:
+            self.stdout.write(self.style.WARNING("Baseline used a different station lookup; lookup timings are not comparable."))
+
+        regressions = compare_to_baseline(current, baseline, options["threshold"])
+        if regressions:
+            for name, old, new in regressions:
+                self.stdout.write(self.style.ERROR(f"{name}: {old:.3f} ms -> {new:.3f} ms ({new / old - 1:+.0%})"))
+            raise CommandError(f"{len(regressions)} stage(s) regressed by more than {options['threshold']:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['threshold']:.0%}"))
+
+    def _print(self, current, sizes):
+        meta = current["meta"]
+        self.stdout.write(
+            f"Route: {meta['route_miles']} mi, {meta['route_points']} points; "
+            f"lookup: {meta['station_lookup']}; repeat: {meta['repeat']}"
+        )
+        self.stdout.write(f"{'stage':<26}" + "".join(f"{n:>14,}" for n in sizes))
+        for stage in STAGES:
+            row = "".join(f"{current['results'][f'{stage}@{n}']['median_ms']:>12.2f}ms" for n in sizes)
+            self.stdout.write(f"{stage:<26}{row}")
+        row = "".join(f"{current['results'][f'stations_found@{n}']['count']:>14,}" for n in sizes)
+        self.stdout.write(f"{'stations in corridor':<26}{row}")
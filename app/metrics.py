@@ -0,0 +1,284 @@
+"""
+Per-stage timers, cache and upstream counters, Server-Timing and /metrics.
+
+Each process accumulates counter increments locally and, every
+METRICS_FLUSH_SECONDS, adds them to one Redis hash with HINCRBYFLOAT. The
+hash therefore holds totals across every gunicorn and Celery worker.
+/metrics renders it in the Prometheus text format. Without Redis (tests,
+locmem cache) /metrics shows this process's own totals.
+
+When METRICS_ENABLED is off, timed() and the count helpers return right
+away and the middleware uninstalls itself.
+"""
+import contextvars
+import hmac
+import ipaddress
+import threading
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from .constants import METRICS_ALLOWED_IPS, METRICS_ENABLED, METRICS_FLUSH_SECONDS, METRICS_KEY, METRICS_TOKEN
+from .helper import APP_NAME, handle_error_log
+
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_LE_ORDER = {str(b): i for i, b in enumerate(BUCKETS)}
+_LE_ORDER["+Inf"] = len(BUCKETS)
+
+_ALLOWED_NETWORKS = tuple(ipaddress.ip_network(net, strict=False) for net in METRICS_ALLOWED_IPS)
+
+_HELP = {
+    "spotter_stage_duration_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "spotter_request_duration_seconds": ("histogram", "Time to serve an HTTP request, by URL route"),
+    "spotter_cache_lookups_total": ("counter", "Tiered cache lookups by cache, tier and result"),
+    "spotter_upstream_requests_total": ("counter", "Calls to the geocoder and routing engine by outcome"),
+    "spotter_station_geocodes_total": ("counter", "City/state pairs handled by the station geocoding pipeline by outcome"),
+}
+
+_request_timings = contextvars.ContextVar("server_timing", default=None)
+
+
+def _redis():
+    # Cross-worker totals need HINCRBYFLOAT; other cache backends keep them per process.
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+def _field(name, labels):
+    return name + "|" + ",".join(f"{k}={v}" for k, v in labels)
+
+
+def _parse_field(field):
+    name, _, raw = field.partition("|")
+    labels = tuple(tuple(pair.split("=", 1)) for pair in raw.split(",") if pair)
+    return name, labels
+
+
+class MetricsRegistry:
+
+    def __init__(self, key=METRICS_KEY, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.key = key
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._local_totals = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def inc(self, name, value=1.0, **labels):
+        field = _field(name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._pending[field] = self._pending.get(field, 0.0) + value
+
+    def observe(self, name, seconds, **labels):
+        base = tuple(sorted(labels.items()))
+        le = next((str(b) for b in BUCKETS if seconds <= b), "+Inf")
+        with self._lock:
+            pending = self._pending
+            for field, value in (
+                (_field(name + "_bucket", base + (("le", le),)), 1.0),
+                (_field(name + "_sum", base), seconds),
+                (_field(name + "_count", base), 1.0),
+            ):
+                pending[field] = pending.get(field, 0.0) + value
+
+    def flush(self, force=False):
+        """Adds pending increments to the shared Redis hash (at most every flush_seconds unless forced)."""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < self.flush_seconds:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = now
+        if not pending:
+            return
+
+        conn = _redis()
+        try:
+            if conn is None:
+                raise ConnectionError("no redis connection")
+            pipe = conn.pipeline(transaction=False)
+            for field, value in pending.items():
+                pipe.hincrbyfloat(self.key, field, value)
+            pipe.execute()
+        except Exception as e:
+            if conn is not None:
+                handle_error_log(e, view_name="MetricsRegistry.flush", app_name=APP_NAME)
+            with self._lock:
+                for field, value in pending.items():
+                    self._local_totals[field] = self._local_totals.get(field, 0.0) + value
+
+    def totals(self) -> dict:
+        self.flush(force=True)
+        conn = _redis()
+        if conn is not None:
+            try:
+                raw = conn.hgetall(self.key)
+                return {k.decode(): float(v) for k, v in raw.items()}
+            except Exception as e:
+                handle_error_log(e, view_name="MetricsRegistry.totals", app_name=APP_NAME)
+        with self._lock:
+            return dict(self._local_totals)
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._local_totals.clear()
+
+
+registry = MetricsRegistry()
+
+
+class timed:
+    """
+    with timed("stations"): ...
+
+    Records the block's wall time in spotter_stage_duration_seconds and, inside
+    a request, as a Server-Timing entry.
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not METRICS_ENABLED:
+            return False
+        elapsed = time.perf_counter() - self.start
+        registry.observe("spotter_stage_duration_seconds", elapsed, stage=self.stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, elapsed))
+        return False
+
+
+def count_cache(cache, tier, result):
+    if METRICS_ENABLED:
+        registry.inc("spotter_cache_lookups_total", cache=cache, tier=tier, result=result)
+
+
+def count_upstream(upstream, outcome):
+    """outcome: "ok", "empty" (answered, nothing found), "error", "timeout" or "rejected" (breaker open)."""
+    if METRICS_ENABLED:
+        registry.inc("spotter_upstream_requests_total", upstream=upstream, outcome=outcome)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render_prometheus(totals) -> str:
+    """Prometheus text exposition for {field: value} totals."""
+    by_family = {}
+    for field, value in totals.items():
+        name, labels = _parse_field(field)
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[:-len(suffix)] in _HELP:
+                family = name[:-len(suffix)]
+        by_family.setdefault(family, []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(by_family):
+        kind, help_text = _HELP.get(family, ("untyped", family))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+
+        samples = by_family[family]
+        if kind == "histogram":
+            samples = _cumulative_buckets(samples)
+        for name, labels, value in sorted(samples, key=_sample_order):
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample):
+    # One series at a time, and its buckets in BUCKETS order: as strings, "10.0" sorts before "2.5".
+    name, labels, _ = sample
+    base = tuple(kv for kv in labels if kv[0] != "le")
+    return base, name, _LE_ORDER.get(dict(labels).get("le"), -1)
+
+
+def _cumulative_buckets(samples):
+    # Buckets are stored per bucket; Prometheus wants running totals over le.
+    counts, others = {}, []
+    for name, labels, value in samples:
+        if not name.endswith("_bucket"):
+            others.append((name, labels, value))
+            continue
+        base = tuple(kv for kv in labels if kv[0] != "le")
+        le = dict(labels)["le"]
+        counts.setdefault((name, base), [0.0] * (len(BUCKETS) + 1))[_LE_ORDER[le]] += value
+
+    out = []
+    for (name, base), per_bucket in counts.items():
+        running = 0.0
+        for i, count in enumerate(per_bucket):
+            running += count
+            le = "+Inf" if i == len(BUCKETS) else str(BUCKETS[i])
+            out.append((name, base + (("le", le),), running))
+    return others + out
+
+
+def _metrics_allowed(request) -> bool:
+    if METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "")
+        if hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return True
+    try:
+        client = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(client in network for network in _ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; only for METRICS_ALLOWED_IPS or the METRICS_TOKEN bearer."""
+    if not _metrics_allowed(request):
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(render_prometheus(registry.totals()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the timed() stages run while serving a request and reports
+    them, plus the total, in a Server-Timing header. It also records the
+    request duration by URL route.
+    """
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        total = time.perf_counter() - start
+
+        entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "unmatched"
+        registry.observe("spotter_request_duration_seconds", total, route=route or "/")
+        registry.flush()
+        return response
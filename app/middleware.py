@@ -0,0 +1,103 @@
+import re
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .constants import BROTLI_QUALITY, COMPRESSION_PATH_PREFIXES, LOADTEST_STATS
+from .tiered_cache import cache_stats
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+_ACCEPTS_BR = re.compile(r"\bbr\b")
+
+
+def _compressible(request, response) -> bool:
+    return (
+        request.path.startswith(COMPRESSION_PATH_PREFIXES)
+        and response.get("Content-Type", "").startswith("application/json")
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Negotiates Brotli or gzip for API JSON responses. Brotli is used when
+    the client accepts it and the brotli package is installed; everything
+    else, including streaming responses, goes through Django's gzip path.
+    Other responses (admin pages, anything with a cookie or CSRF token)
+    are left uncompressed; see COMPRESSION_PATH_PREFIXES.
+    """
+
+    def process_response(self, request, response):
+        if not _compressible(request, response):
+            return response
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < 200
+            or not _ACCEPTS_BR.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        response.headers["Content-Encoding"] = "br"
+        return response
+
+
+def _cache_counts():
+    hits = misses = 0
+    for stats in cache_stats().values():
+        hits += stats["local_hits"] + stats["redis_hits"]
+        misses += stats["redis_misses"]
+    return hits, misses
+
+
+class RequestStatsMiddleware:
+    """
+    Reports per-request DB query and cache lookup counts in X-DB-Queries,
+    X-Cache-Hits and X-Cache-Misses. Only installed when LOADTEST_STATS is
+    on. Cache counts are per-process deltas, so they are exact with sync
+    workers and approximate when one process serves requests concurrently.
+    """
+
+    def __init__(self, get_response):
+        if not LOADTEST_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        hits_before, misses_before = _cache_counts()
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        hits_after, misses_after = _cache_counts()
+
+        response.headers["X-DB-Queries"] = str(queries)
+        response.headers["X-Cache-Hits"] = str(hits_after - hits_before)
+        response.headers["X-Cache-Misses"] = str(misses_after - misses_before)
+        return response
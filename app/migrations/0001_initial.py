@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-17 07:13
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuelPriceUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='fuel_uploads/')),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], db_index=True, default='PENDING', max_length=20)),
+                ('total_records', models.IntegerField(default=0)),
+                ('inserted_records', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'fuel_price_uploads',
+            },
+        ),
+        migrations.CreateModel(
+            name='FuelStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opis_id', models.IntegerField(db_index=True, unique=True)),
+                ('truckstop_name', models.CharField(max_length=255)),
+                ('address', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(db_index=True, max_length=2)),
+                ('rack_id', models.IntegerField(blank=True, null=True)),
+                ('retail_price', models.DecimalField(decimal_places=4, max_digits=6)),
+                ('location', django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, srid=4326)),
+                ('geocoded_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'fuel_stations',
+                'indexes': [models.Index(fields=['retail_price'], name='fuel_statio_retail__463e8c_idx'), models.Index(fields=['state', 'retail_price'], name='fuel_statio_state_7fd986_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-17 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fuelpriceupload',
+            name='updated_records',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fuelpriceupload',
+            name='unchanged_records',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fuelpriceupload',
+            name='skipped_records',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -24,6 +24,9 @@ class FuelPriceUpload(models.Model):
 
     total_records = models.IntegerField(default=0)
     inserted_records = models.IntegerField(default=0)
+    updated_records = models.IntegerField(default=0)
+    unchanged_records = models.IntegerField(default=0)
+    skipped_records = models.IntegerField(default=0)
     error_message = models.TextField(null=True, blank=True)
 
     class Meta:
@@ -55,3 +58,55 @@ class FuelStation(models.Model):
 
     def __str__(self):
         return f"{self.truckstop_name} - {self.city}, {self.state} (${self.retail_price})"
+
+
+class RouteJob(models.Model):
+    """A queued route plan: one or many origin/destination pairs, computed by the route_processing workers."""
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING"
+        RUNNING = "RUNNING"
+        COMPLETED = "COMPLETED"
+        FAILED = "FAILED"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    pairs = models.JSONField()
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        db_index=True
+    )
+
+    total_pairs = models.IntegerField(default=0)
+    completed_pairs = models.IntegerField(default=0)
+    error_message = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "route_jobs"
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": str(self.id),
+            "status": self.status,
+            "completed": self.completed_pairs,
+            "total": self.total_pairs,
+            "results": list(self.result_rows.order_by("index").values_list("entry", flat=True)),
+            "error": self.error_message,
+        }
+
+
+class RouteJobResult(models.Model):
+    """One finished pair of a RouteJob. Rows are appended as pairs finish, so a save never rewrites earlier results."""
+
+    job = models.ForeignKey(RouteJob, on_delete=models.CASCADE, related_name="result_rows")
+    index = models.IntegerField()
+    entry = models.JSONField()
+
+    class Meta:
+        db_table = "route_job_results"
+        unique_together = ("job", "index")
@@ -0,0 +1,146 @@
+import bisect
+from collections import deque
+
+from .constants import DEFAULT_START_FUEL_FRACTION, ESTIMATE_PRICE_PER_GALLON, MPG, RESERVE_GALLONS, TANK_CAPACITY_GALLONS
+
+
+def next_cheaper_indices(prices):
+    """For each position, the index of the first later position with a lower price (monotonic stack)."""
+    result = [len(prices)] * len(prices)
+    stack = []
+    for i, price in enumerate(prices):
+        while stack and prices[stack[-1]] > price:
+            result[stack.pop()] = i
+        stack.append(i)
+    return result
+
+
+class FuelCorridor:
+    """
+    The vehicle-independent part of plan_optimal_fuel_stops for one trip:
+    stations on the trip sorted by mile marker, their positions and prices
+    with the destination appended (priced below every station) and the
+    next-cheaper index. Build it once to plan many vehicles over it.
+    """
+
+    def __init__(self, stations: list, total_miles: float):
+        self.stations = [s for s in stations if 0 <= s["mile_marker"] <= total_miles]
+        self.total_miles = total_miles
+        self.positions = [s["mile_marker"] for s in self.stations] + [total_miles]
+        self.prices = [s["retail_price"] for s in self.stations] + [float("-inf")]
+        self.next_cheaper = next_cheaper_indices(self.prices)
+
+
+def plan_optimal_fuel_stops(
+        stations: list,
+        total_miles: float,
+        start_fuel_gallons: float = None,
+        tank_capacity_gallons: float = TANK_CAPACITY_GALLONS,
+        reserve_gallons: float = RESERVE_GALLONS,
+        mpg: float = MPG,
+        corridor: FuelCorridor = None,
+    ) -> dict:
+    """
+    Minimum-cost refuelling plan for stations sorted by mile marker.
+
+    At each stop: if a cheaper station is reachable, buy just enough to get
+    there; otherwise fill up and drive to the cheapest station in range.
+    The destination counts as the cheapest "station" so the truck never
+    buys fuel it does not need, and the tank never drops below
+    reserve_gallons. Start fuel is DEFAULT_START_FUEL_FRACTION of the tank
+    unless given. The part of it the trip burns is charged at the cheapest
+    price reachable on it (ESTIMATE_PRICE_PER_GALLON when no station is),
+    which is what greedy charges for its first leg. total_cost therefore
+    covers the fuel for the whole trip, as calculate_fuel_cost does, and
+    the two strategies compare like for like.
+
+    Pass a prebuilt corridor to skip rebuilding the station arrays.
+
+    Returns {"stops", "total_cost", "start_fuel_cost", "total_gallons",
+    "feasible"}; each stop is the station dict plus "gallons" and "cost".
+    total_cost includes start_fuel_cost.
+    """
+    if start_fuel_gallons is None:
+        start_fuel_gallons = tank_capacity_gallons * DEFAULT_START_FUEL_FRACTION
+
+    corridor = corridor or FuelCorridor(stations, total_miles)
+    stations, positions, prices, next_cheaper = corridor.stations, corridor.positions, corridor.prices, corridor.next_cheaper
+
+    usable_capacity = tank_capacity_gallons - reserve_gallons
+    max_leg = usable_capacity * mpg
+    fuel = start_fuel_gallons - reserve_gallons
+    destination = len(stations)
+
+    stops = []
+    total_cost = 0.0
+    window = deque()
+    right = 0
+    feasible = fuel >= 0
+
+    # Origin: only the start fuel is available, at no cost.
+    if feasible and positions[destination] <= fuel * mpg:
+        current = destination
+    else:
+        current = -1
+        reach = max(fuel, 0) * mpg
+
+    while feasible and current != destination:
+        here = positions[current] if current >= 0 else 0.0
+        if current < 0:
+            limit = reach
+        else:
+            limit = here + max_leg
+
+        while right < destination and positions[right] <= limit:
+            while window and prices[window[-1]] >= prices[right]:
+                window.pop()
+            window.append(right)
+            right += 1
+        while window and window[0] <= current:
+            window.popleft()
+
+        if current < 0:
+            if not window:
+                feasible = False
+                break
+            target = window[0]
+            fuel -= positions[target] / mpg
+            current = target
+            continue
+
+        target = next_cheaper[current]
+        needed = (positions[target] - here) / mpg
+        if needed <= usable_capacity:
+            bought = max(0.0, needed - fuel)
+        else:
+            if not window:
+                feasible = False
+                break
+            target = window[0]
+            needed = (positions[target] - here) / mpg
+            bought = usable_capacity - fuel
+
+        if bought > 1e-9:
+            cost = bought * prices[current]
+            total_cost += cost
+            stops.append({**stations[current], "gallons": round(bought, 2), "cost": round(cost, 2)})
+
+        fuel = fuel + bought - needed
+        current = target
+
+    # Fuel is fungible: whatever the trip burns beyond its purchases came from the tank.
+    start_burned = min(max(start_fuel_gallons - reserve_gallons, 0.0), total_miles / mpg)
+    start_fuel_cost = start_burned * _start_fuel_price(corridor, (start_fuel_gallons - reserve_gallons) * mpg)
+
+    return {
+        "stops": stops,
+        "total_cost": round(total_cost + start_fuel_cost, 2),
+        "start_fuel_cost": round(start_fuel_cost, 2),
+        "total_gallons": round(sum(s["gallons"] for s in stops), 2),
+        "feasible": feasible,
+    }
+
+
+def _start_fuel_price(corridor: FuelCorridor, reach_miles: float) -> float:
+    reachable = bisect.bisect_right(corridor.positions, reach_miles, 0, len(corridor.stations))
+    return min(corridor.prices[:reachable], default=ESTIMATE_PRICE_PER_GALLON)
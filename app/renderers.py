@@ -0,0 +1,32 @@
+from django.http import HttpResponse, JsonResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson for the large float-heavy route payloads.
+    Falls back to DRF's encoder when orjson is not installed or the data
+    contains types orjson cannot serialize.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data, option=_ORJSON_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def json_response(payload, status=200):
+    """HttpResponse with an orjson-encoded body, for plain Django views."""
+    if orjson is None:
+        return JsonResponse(payload, status=status, safe=False)
+    return HttpResponse(orjson.dumps(payload, option=_ORJSON_OPTIONS), status=status, content_type="application/json")
@@ -0,0 +1,312 @@
+"""
+Routing backends behind fetch_route/afetch_route.
+
+Every backend returns {"polyline": [[lng, lat], ...], "distance_miles": float}
+for a route, None when the engine says no route exists, and raises
+RoutingUnavailable when it cannot answer right now (so the miss is not
+cached as "no route").
+"""
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+
+from .constants import (
+    OSRM_BASE_URL,
+    OSRM_TIMEOUT,
+    ROAD_GRAPH_MAX_SNAP_M,
+    ROAD_GRAPH_PATH,
+    ROUTING_BACKEND,
+    ROUTING_BREAKER_FAILURES,
+    ROUTING_BREAKER_RESET_SECONDS,
+    ROUTING_MAX_RETRIES,
+    ROUTING_POOL_SIZE,
+    ROUTING_RETRY_BACKOFF,
+)
+from .deadlines import DeadlineExceeded, current_deadline, hedged, stage_timeout
+from .geo import METERS_PER_MILE
+from .graph_routing import RoadGraph
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .metrics import count_upstream
+from .stubs import stub_route
+
+
+class RoutingUnavailable(Exception):
+    pass
+
+
+# The only OSRM codes that mean "no route exists"; cached as a negative.
+_DEFINITIVE_MISSES = ("NoRoute", "NoSegment")
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failures` errors in a row it opens
+    and rejects calls for `reset_seconds`. After that a single trial call
+    is let through (half-open): success closes it, failure re-opens it.
+    """
+
+    def __init__(self, failures: int = ROUTING_BREAKER_FAILURES, reset_seconds: float = ROUTING_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._errors = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._errors = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._errors += 1
+            self._trial = False
+            if self._opened_at is not None or self._errors >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: uniform over [0, base * 2^attempt], so retrying workers spread out.
+    return random.uniform(0, ROUTING_RETRY_BACKOFF * 2 ** attempt)
+
+
+def _sleep_within_deadline(seconds: float) -> float:
+    deadline = current_deadline()
+    if deadline is not None:
+        seconds = min(seconds, max(0.0, deadline.remaining()))
+    return seconds
+
+
+class RoutingBackend:
+    name = "base"
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        raise NotImplementedError
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng, client=None):
+        return await sync_to_async(self.route)(start_lat, start_lng, end_lat, end_lng)
+
+
+class OSRMBackend(RoutingBackend):
+    """OSRM HTTP API over a pooled keep-alive session, with retries and a circuit breaker."""
+
+    name = "osrm"
+
+    def __init__(
+            self,
+            base_url: str = OSRM_BASE_URL,
+            timeout: float = OSRM_TIMEOUT,
+            max_retries: int = ROUTING_MAX_RETRIES,
+            breaker: CircuitBreaker = None,
+        ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ROUTING_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _url(self, start_lat, start_lng, end_lat, end_lng):
+        return f"{self.base_url}/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}"
+
+    @staticmethod
+    def _parse(status_code, data):
+        """Route dict, None when OSRM says no route exists; anything else raises RoutingUnavailable."""
+        if status_code == 429 or status_code >= 500:
+            raise RoutingUnavailable(f"OSRM returned HTTP {status_code}")
+        code = data.get("code") if isinstance(data, dict) else None
+        if code in _DEFINITIVE_MISSES:
+            return None
+        if code != "Ok" or not data.get("routes"):
+            raise RoutingUnavailable(f"OSRM returned {code or 'an unexpected body'} (HTTP {status_code})")
+        route = data["routes"][0]
+        return {
+            "polyline": route["geometry"]["coordinates"],
+            "distance_miles": route["distance"] / METERS_PER_MILE,
+        }
+
+    def _get(self, url, timeout):
+        resp = self.session.get(url, params={"overview": "full", "geometries": "geojson"}, timeout=timeout)
+        return self._parse(resp.status_code, resp.json())
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        url = self._url(start_lat, start_lng, end_lat, end_lng)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                count_upstream("osrm", "rejected")
+                raise RoutingUnavailable("OSRM circuit breaker is open")
+            try:
+                result = hedged(lambda timeout: self._get(url, timeout), stage_timeout(self.timeout, "route"))
+                self.breaker.record_success()
+                count_upstream("osrm", "ok" if result is not None else "empty")
+                return result
+            except DeadlineExceeded:
+                count_upstream("osrm", "timeout")
+                raise
+            except (requests.RequestException, ValueError, RoutingUnavailable) as e:
+                self.breaker.record_failure()
+                count_upstream("osrm", "timeout" if isinstance(e, requests.Timeout) else "error")
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(_sleep_within_deadline(_backoff(attempt)))
+        raise RoutingUnavailable(f"OSRM failed after {self.max_retries + 1} attempts: {error}")
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng, client=None):
+        if client is None:
+            # Callers without a pooled client (one-off scripts, tests) get a short-lived one.
+            async with httpx.AsyncClient() as own:
+                return await self.aroute(start_lat, start_lng, end_lat, end_lng, client=own)
+
+        url = self._url(start_lat, start_lng, end_lat, end_lng)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                count_upstream("osrm", "rejected")
+                raise RoutingUnavailable("OSRM circuit breaker is open")
+            try:
+                resp = await client.get(
+                    url,
+                    params={"overview": "full", "geometries": "geojson"},
+                    timeout=stage_timeout(self.timeout, "route"),
+                )
+                result = self._parse(resp.status_code, resp.json())
+                self.breaker.record_success()
+                count_upstream("osrm", "ok" if result is not None else "empty")
+                return result
+            except DeadlineExceeded:
+                count_upstream("osrm", "timeout")
+                raise
+            except (httpx.HTTPError, ValueError, RoutingUnavailable) as e:
+                self.breaker.record_failure()
+                count_upstream("osrm", "timeout" if isinstance(e, httpx.TimeoutException) else "error")
+                error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(_sleep_within_deadline(_backoff(attempt)))
+        raise RoutingUnavailable(f"OSRM failed after {self.max_retries + 1} attempts: {error}")
+
+
+class StubBackend(RoutingBackend):
+    """
+    Deterministic straight-line routes computed in-process (see stubs.stub_route).
+    For load tests and CI: no network, and identical input always gives the same output.
+    """
+
+    name = "stub"
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        data = stub_route(start_lng, start_lat, end_lng, end_lat)
+        return OSRMBackend._parse(200, data)
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng, client=None):
+        return self.route(start_lat, start_lng, end_lat, end_lng)
+
+
+class GraphBackend(RoutingBackend):
+    """
+    Shortest paths over an in-process RoadGraph (see graph_routing). The graph
+    is loaded on first use. Routes whose ends are off the network (further
+    than max_snap_m) or unconnected in it are passed to the fallback, so a
+    regional extract still answers everything.
+    """
+
+    name = "graph"
+
+    def __init__(self, path: str = ROAD_GRAPH_PATH, max_snap_m: float = ROAD_GRAPH_MAX_SNAP_M, fallback: RoutingBackend = None, graph: RoadGraph = None):
+        self.path = path
+        self.max_snap_m = max_snap_m
+        self.fallback = fallback if fallback is not None else OSRMBackend()
+        self._graph = graph
+        self._load_failed = False
+        self._lock = threading.Lock()
+
+    def _get_graph(self):
+        if self._graph is None and not self._load_failed:
+            with self._lock:
+                if self._graph is None and not self._load_failed:
+                    try:
+                        start = time.perf_counter()
+                        self._graph = RoadGraph.load(self.path)
+                        handle_info_log(
+                            f"Road graph loaded: {len(self._graph)} nodes, {self._graph.edge_count} edges "
+                            f"in {time.perf_counter() - start:.2f}s",
+                            view_name="GraphBackend",
+                            app_name=APP_NAME,
+                        )
+                    except Exception as e:
+                        self._load_failed = True
+                        handle_error_log(e, view_name="GraphBackend", app_name=APP_NAME)
+        return self._graph
+
+    def route(self, start_lat, start_lng, end_lat, end_lng):
+        graph = self._get_graph()
+        if graph is not None:
+            result = graph.route(start_lat, start_lng, end_lat, end_lng, self.max_snap_m)
+            if result is not None:
+                return result
+        return self.fallback.route(start_lat, start_lng, end_lat, end_lng)
+
+    async def aroute(self, start_lat, start_lng, end_lat, end_lng, client=None):
+        graph = self._get_graph()
+        if graph is not None:
+            result = await sync_to_async(graph.route)(start_lat, start_lng, end_lat, end_lng, self.max_snap_m)
+            if result is not None:
+                return result
+        return await self.fallback.aroute(start_lat, start_lng, end_lat, end_lng, client=client)
+
+
+_BACKENDS = {
+    "osrm": OSRMBackend,
+    "stub": StubBackend,
+    "graph": GraphBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_routing_backend() -> RoutingBackend:
+    """Process-wide backend selected by ROUTING_BACKEND; built once so the pool and breaker are shared."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    _backend = _BACKENDS[ROUTING_BACKEND]()
+                except KeyError:
+                    handle_error_log(
+                        f"Unknown ROUTING_BACKEND {ROUTING_BACKEND!r}, using osrm",
+                        view_name="get_routing_backend",
+                        app_name=APP_NAME,
+                    )
+                    _backend = OSRMBackend()
+    return _backend
@@ -1,5 +1,53 @@
 from rest_framework import serializers
+from app.constants import FUEL_STRATEGY, BATCH_MAX_PAIRS, SWEEP_MAX_PROFILES, VEHICLE_FIELDS
+
+FUEL_STRATEGIES = ("optimal", "greedy")
+RESPONSE_FORMATS = ("geojson", "polyline", "lite")
 
 class RouteRequestSerializer(serializers.Serializer):
     start = serializers.CharField()
-    end = serializers.CharField()
\ No newline at end of file
+    end = serializers.CharField()
+    strategy = serializers.ChoiceField(choices=FUEL_STRATEGIES, default=FUEL_STRATEGY)
+    response_format = serializers.ChoiceField(choices=RESPONSE_FORMATS, default="geojson")
+    start_fuel_gallons = serializers.FloatField(required=False, min_value=0)
+    tank_capacity_gallons = serializers.FloatField(required=False, min_value=1)
+    reserve_gallons = serializers.FloatField(required=False, min_value=0)
+    mpg = serializers.FloatField(required=False, min_value=0.5, max_value=100)
+
+    def validate(self, attrs):
+        return validate_vehicle(attrs)
+
+    def vehicle_options(self):
+        return {k: self.validated_data[k] for k in VEHICLE_FIELDS if k in self.validated_data}
+
+
+def validate_vehicle(attrs):
+    tank = attrs.get("tank_capacity_gallons")
+    if tank is not None:
+        if attrs.get("reserve_gallons", 0) >= tank:
+            raise serializers.ValidationError("reserve_gallons must be below tank_capacity_gallons")
+        if attrs.get("start_fuel_gallons", 0) > tank:
+            raise serializers.ValidationError("start_fuel_gallons cannot exceed tank_capacity_gallons")
+    return attrs
+
+
+class RouteBatchRequestSerializer(serializers.Serializer):
+    pairs = RouteRequestSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_PAIRS)
+
+
+class VehicleProfileSerializer(serializers.Serializer):
+    name = serializers.CharField(required=False, max_length=100)
+    start_fuel_gallons = serializers.FloatField(required=False, min_value=0)
+    tank_capacity_gallons = serializers.FloatField(required=False, min_value=1)
+    reserve_gallons = serializers.FloatField(required=False, min_value=0)
+    mpg = serializers.FloatField(required=False, min_value=0.5, max_value=100)
+
+    def validate(self, attrs):
+        return validate_vehicle(attrs)
+
+
+class RouteSweepRequestSerializer(serializers.Serializer):
+    start = serializers.CharField()
+    end = serializers.CharField()
+    strategy = serializers.ChoiceField(choices=FUEL_STRATEGIES, default=FUEL_STRATEGY)
+    profiles = VehicleProfileSerializer(many=True, allow_empty=False, max_length=SWEEP_MAX_PROFILES)
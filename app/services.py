@@ -1,13 +1,36 @@
 import bisect
+import concurrent.futures
+import contextlib
+import contextvars
 import hashlib
-from urllib import response
+import struct
 import requests
 import numpy as np
+from django.contrib.gis.geos import GEOSGeometry, LineString
 from django.core.cache import cache
-from django.contrib.gis.geos import LineString
 from django.db import connection
 from .helper import APP_NAME, handle_error_log, handle_info_log
-from .constants import GEOCODE_URL, GEOCODE_API_KEY, CACHE_TTL, TRUCK_RANGE_MILES, MPG, GEOCODE_URL, GEOCODE_API_KEY
+from .constants import GEOCODE_URL, GEOCODE_API_KEY, CACHE_TTL, TRUCK_RANGE_MILES, MPG
+from .constants import CORRIDOR_RADIUS_METERS, STATION_LOOKUP_ENGINE, FUEL_STRATEGY, GEOCODE_CACHE_TTL
+from .constants import GEOCODE_MAX_WORKERS, GEOCODE_TIMEOUT, NEGATIVE_CACHE_TTL, ROUTE_PLAN_CACHE_TTL, ROUTE_PLAN_STALE_TTL
+from .constants import SINGLE_FLIGHT_LOCK_TTL, TANK_CAPACITY_GALLONS, RESERVE_GALLONS, ESTIMATE_PRICE_PER_GALLON
+from .constants import ROUTE_SIMPLIFY_MODE, ROUTE_SIMPLIFY_TOLERANCE_M, ROUTE_SAMPLE_POINTS
+from .geo import METERS_PER_MILE, RouteProjector, encode_polyline, simplify_polyline
+from .planner import plan_optimal_fuel_stops
+from .station_index import stations_near_route_in_memory
+from .h3_corridor import stations_near_route_h3
+from .station_data import get_station_data_generation, record_hot_corridor
+from .cache_keys import corridor_fingerprint, snap_route_endpoints
+from .gazetteer import gazetteer_geocode, normalize_address
+from .tiered_cache import MISS, geocode_cache, plan_cache, route_cache, stations_cache
+from .single_flight import single_flight
+from .deadlines import DeadlineExceeded, current_deadline, hedged, raise_if_expired, stage_timeout
+from .metrics import count_upstream, timed
+from .routing import RoutingUnavailable, get_routing_backend
+
+
+class GeocodingUnavailable(Exception):
+    """The geocoder could not answer right now (error, timeout or throttling); nothing is cached."""
 
 
 def _cache_key(prefix: str, *args) -> str:
@@ -15,101 +38,215 @@ def _cache_key(prefix: str, *args) -> str:
     return hashlib.md5(raw.encode()).hexdigest()
 
 session = requests.Session()
+geocode_executor = concurrent.futures.ThreadPoolExecutor(max_workers=GEOCODE_MAX_WORKERS)
 
 def geocode_address(address: str):
+    """
+    (lat, lng) for address, or None when the geocoder has no match (cached
+    as a negative). Raises GeocodingUnavailable when it cannot answer.
+    """
     if not address:
         return None
 
-    cache_key = f"geo:{address.lower().strip()}"
-    cached = cache.get(cache_key)
-    if cached:
+    local = gazetteer_geocode(address)
+    if local:
+        return local
+
+    cache_key = f"geo:{normalize_address(address)}"
+    cached = geocode_cache.get(cache_key)
+    if cached is not MISS:
         return cached
 
+    return single_flight(
+        cache_key,
+        compute=lambda: _geocode_remote(address, cache_key),
+        read=lambda: geocode_cache.get(cache_key),
+    )
+
+
+def _geocode_remote(address: str, cache_key: str):
     try:
-        response = session.get(
-            GEOCODE_URL,
-            params={
-                "q": f"{address}, USA",
-                "api_key": GEOCODE_API_KEY,
-                "limit": 1,
-            },
-            timeout=10
+        response = hedged(
+            lambda timeout: session.get(
+                GEOCODE_URL,
+                params={
+                    "q": f"{address}, USA",
+                    "api_key": GEOCODE_API_KEY,
+                    "limit": 1,
+                },
+                timeout=timeout
+            ),
+            stage_timeout(GEOCODE_TIMEOUT, "geocode"),
         )
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GeocodingUnavailable(f"Geocoder returned HTTP {response.status_code}")
 
         try:
             data = response.json()
-        except ValueError:
-            print("Invalid JSON response:", response.text)
+        except ValueError as e:
+            handle_error_log(e, view_name="geocode_address", app_name=APP_NAME, extra_values={"response": response.text[:500]})
             data = None
 
-
         if not data:
+            count_upstream("geocode", "empty")
+            geocode_cache.set_negative(cache_key)
             return None
 
+        count_upstream("geocode", "ok")
         lat = float(data[0]["lat"])
         lng = float(data[0]["lon"])
         handle_info_log(f"Geocode API called for: {address} lat={data[0]['lat'] if data else 'None'}, lng={data[0]['lon'] if data else 'None'}", view_name="geocode_address", app_name=APP_NAME)
 
-        cache.set(cache_key, (lat, lng), 604800)
+        geocode_cache.set(cache_key, (lat, lng), GEOCODE_CACHE_TTL)
         return lat, lng
 
     except Exception as e:
+        count_upstream("geocode", "timeout" if isinstance(e, (DeadlineExceeded, requests.Timeout)) else "error")
+        raise_if_expired("geocode")
         handle_error_log(e, view_name="geocode_address", app_name=APP_NAME)
-        return None
+        if isinstance(e, GeocodingUnavailable):
+            raise
+        raise GeocodingUnavailable(str(e)) from e
 
 
 def fetch_route(start_lat, start_lng, end_lat, end_lng):
+    """Route dict, or None when no route exists (cached as a negative). Raises RoutingUnavailable when routing is down."""
+    start_lat, start_lng, end_lat, end_lng = snap_route_endpoints(start_lat, start_lng, end_lat, end_lng)
     key = _cache_key("route", start_lat, start_lng, end_lat, end_lng)
-    cached = cache.get(key)
-    if cached:
+    cached = route_cache.get(key)
+    if cached is not MISS:
         return cached
 
+    return single_flight(
+        key,
+        compute=lambda: _fetch_route_remote(key, start_lat, start_lng, end_lat, end_lng),
+        read=lambda: route_cache.get(key),
+    )
+
+
+def _fetch_route_remote(key, start_lat, start_lng, end_lat, end_lng):
     try:
-        url = f"https://router.project-osrm.org/route/v1/driving/{start_lng},{start_lat};{end_lng},{end_lat}"
-        resp = requests.get(
-            url,
-            params={"overview": "full", "geometries": "geojson"},
-            timeout=15
-        )
-        data = resp.json()
-        route = data["routes"][0]
-        result = {
-            "polyline": route["geometry"]["coordinates"],
-            "distance_miles": route["distance"] / 1609.34
-        }
-        cache.set(key, result, CACHE_TTL)
+        result = get_routing_backend().route(start_lat, start_lng, end_lat, end_lng)
+        if result is None:
+            route_cache.set_negative(key)
+            return None
+
+        result = with_simplified_polyline(result)
+        route_cache.set(key, result, CACHE_TTL)
         return result
     except Exception as e:
+        raise_if_expired("route")
         handle_error_log(e, view_name="fetch_route", app_name=APP_NAME)
-        return None
+        if isinstance(e, RoutingUnavailable):
+            raise
+        raise RoutingUnavailable(str(e)) from e
+
+def simplify_route(coords: list) -> list:
+    if ROUTE_SIMPLIFY_MODE == "rdp":
+        return simplify_polyline(coords, ROUTE_SIMPLIFY_TOLERANCE_M)
 
-def build_route_line(coords: list) -> LineString:
     arr = np.array(coords)
-    if len(arr) > 200:
-        idx = np.linspace(0, len(arr) - 1, 200, dtype=int)
+    if len(arr) > ROUTE_SAMPLE_POINTS:
+        idx = np.linspace(0, len(arr) - 1, ROUTE_SAMPLE_POINTS, dtype=int)
         arr = arr[idx]
-    return LineString(arr.tolist(), srid=4326)
+    return arr.tolist()
+
+def with_simplified_polyline(route: dict) -> dict:
+    """The route plus its simplified polyline, cached with it so no request simplifies it again."""
+    return {**route, "simplified": simplify_route(route["polyline"])}
+
+def simplified_polyline(route: dict) -> list:
+    # Routes cached before "simplified" was stored with them are simplified here.
+    simplified = route.get("simplified")
+    return simplified if simplified is not None else simplify_route(route["polyline"])
+
+def build_route_line(coords: list, simplified: bool = False) -> LineString:
+    if not simplified:
+        coords = simplify_route(coords)
+    # Packed as WKB in one go: LineString(list) copies point by point into GEOS (~30x slower).
+    points = np.ascontiguousarray(coords, dtype="<f8")
+    wkb = struct.pack("<BII", 1, 2, len(points)) + points.tobytes()
+    return GEOSGeometry(memoryview(wkb), srid=4326)
+
+@contextlib.contextmanager
+def _statement_budget(cursor, stage):
+    """Caps the queries in the block at the request's remaining budget (no-op without a deadline)."""
+    deadline = current_deadline()
+    if deadline is None:
+        yield
+        return
+
+    cursor.execute("SET statement_timeout = %s", [max(1, int(deadline.timeout(3600, stage) * 1000))])
+    try:
+        yield
+    finally:
+        cursor.execute("RESET statement_timeout")
+
+
+def locate_stations(stations: list, polyline: list, distance_miles: float) -> list:
+    """
+    Places corridor stations on the route: "mile_marker" is the distance
+    along polyline to the station's nearest point, scaled to the routed
+    distance, and "detour_miles" is the round trip from that point to the
+    station. Pass the full OSRM geometry; the corridor search only needs
+    the simplified line, but markers measured on it drift on long routes.
+    Returns new dicts sorted by mile marker.
+    """
+    if not stations or len(polyline) < 2:
+        return []
+
+    projector = RouteProjector(polyline)
+    along_m, offset_m = projector.project([s["lat"] for s in stations], [s["lng"] for s in stations])
+    scale = distance_miles / projector.total_m if projector.total_m > 0 else 0.0
+    mile_markers = along_m * scale
+    detours = offset_m * (2 / METERS_PER_MILE)
+
+    return [
+        {**stations[j], "mile_marker": float(mile_markers[j]), "detour_miles": float(detours[j])}
+        for j in np.argsort(mile_markers, kind="stable")
+    ]
+
 
-def get_stations_near_route(route_line: LineString, osrm_distance_miles: float) -> list:
-    key = _cache_key("stations", route_line.wkt[:100], round(osrm_distance_miles, 1))
-    cached = cache.get(key)
-    if cached:
+def get_stations_near_route(route_line: LineString, osrm_distance_miles: float, track: bool = True, polyline: list = None) -> list:
+    """
+    Priced stations within CORRIDOR_RADIUS_METERS of route_line, located on
+    polyline (route_line itself when not given) by locate_stations.
+    """
+    stations = _corridor_stations(route_line, osrm_distance_miles, track)
+    with timed("locate"):
+        return locate_stations(stations, route_line.coords if polyline is None else polyline, osrm_distance_miles)
+
+
+def _corridor_stations(route_line: LineString, osrm_distance_miles: float, track: bool) -> list:
+    if STATION_LOOKUP_ENGINE == "memory":
+        stations = stations_near_route_in_memory(route_line.coords, osrm_distance_miles)
+        if stations is not None:
+            return stations
+
+    fingerprint = corridor_fingerprint(route_line.coords, osrm_distance_miles)
+    if track:
+        record_hot_corridor(fingerprint, route_line.wkt, osrm_distance_miles)
+
+    if STATION_LOOKUP_ENGINE == "h3":
+        stations = stations_near_route_h3(route_line.coords, osrm_distance_miles)
+        if stations is not None:
+            return stations
+
+    key = f"stations:{get_station_data_generation()}:{fingerprint}"
+    cached = stations_cache.get(key)
+    if cached is not MISS:
         handle_info_log("Stations cache HIT", view_name="get_stations_near_route", app_name=APP_NAME)
         return cached
 
     route_wkt = route_line.wkt
 
     try:
-        with connection.cursor() as cursor:
+        with connection.cursor() as cursor, _statement_budget(cursor, "stations"), timed("postgis"):
             cursor.execute("""
                 SELECT
                     fs.id,
                     fs.truckstop_name,
                     fs.retail_price,
-                    ST_LineLocatePoint(
-                        ST_GeomFromText(%s, 4326),
-                        fs.location::geometry
-                    ) * %s AS mile_marker,
                     ST_Y(fs.location::geometry) AS lat,
                     ST_X(fs.location::geometry) AS lng
                 FROM fuel_stations fs
@@ -119,10 +256,9 @@ def get_stations_near_route(route_line: LineString, osrm_distance_miles: float)
                     AND ST_DWithin(
                         fs.location,
                         ST_GeogFromText(%s),
-                        8046
+                        %s
                     )
-                ORDER BY mile_marker ASC
-            """, [route_wkt, osrm_distance_miles, route_wkt])
+            """, [route_wkt, CORRIDOR_RADIUS_METERS])
 
             rows = cursor.fetchall()
 
@@ -131,24 +267,22 @@ def get_stations_near_route(route_line: LineString, osrm_distance_miles: float)
                 "id": row[0],
                 "truckstop_name": row[1],
                 "retail_price": float(row[2]),
-                "mile_marker": float(row[3]),
-                "lat": float(row[4]),
-                "lng": float(row[5]),
+                "lat": float(row[3]),
+                "lng": float(row[4]),
             }
             for row in rows
-            if row[3] is not None
-            and 0 <= float(row[3]) <= osrm_distance_miles
         ]
 
-        cache.set(key, stations, CACHE_TTL)
+        stations_cache.set(key, stations, CACHE_TTL)
         handle_info_log( f"Found {len(stations)} stations",view_name="get_stations_near_route", app_name=APP_NAME)
         return stations
 
     except Exception as e:
+        raise_if_expired("stations")
         handle_error_log(e, view_name="get_stations_near_route", app_name=APP_NAME)
         return []
 
-def optimize_fuel_stops(stations: list, total_miles: float) -> list:
+def optimize_fuel_stops(stations: list, total_miles: float, range_miles: float = TRUCK_RANGE_MILES) -> list:
     if not stations:
         return []
 
@@ -158,7 +292,7 @@ def optimize_fuel_stops(stations: list, total_miles: float) -> list:
 
     while current < total_miles:
         remaining = total_miles - current
-        window_end = current + TRUCK_RANGE_MILES
+        window_end = current + range_miles
 
         left = bisect.bisect_right(mile_markers, current)
         right = bisect.bisect_right(mile_markers, window_end)
@@ -179,29 +313,64 @@ def optimize_fuel_stops(stations: list, total_miles: float) -> list:
         optimized.append(best)
         current = best["mile_marker"]
 
-        if optimized and remaining <= TRUCK_RANGE_MILES:
+        if optimized and remaining <= range_miles:
             break
 
     return optimized
 
-def calculate_fuel_cost(stops: list, total_miles: float) -> float:
+def estimate_fuel_cost(total_miles: float, mpg: float = MPG) -> float:
+    """Whole-trip estimate at ESTIMATE_PRICE_PER_GALLON, quoted when there is no feasible plan."""
+    return round((total_miles / mpg) * ESTIMATE_PRICE_PER_GALLON, 2)
+
+def calculate_fuel_cost(stops: list, total_miles: float, mpg: float = MPG) -> float:
     if not stops:
-        return round((total_miles / MPG) * 3.5, 2) 
+        return estimate_fuel_cost(total_miles, mpg)
 
     total = 0.0
     prev = 0.0
 
     for stop in stops:
         segment = stop["mile_marker"] - prev
-        total += (segment / MPG) * stop["retail_price"]
+        total += (segment / mpg) * stop["retail_price"]
         prev = stop["mile_marker"]
 
     remaining = total_miles - prev
     if remaining > 0:
-        total += (remaining / MPG) * stops[-1]["retail_price"]
+        total += (remaining / mpg) * stops[-1]["retail_price"]
 
     return round(total, 2)
 
+def plan_fuel_stops(stations: list, total_miles: float, strategy: str = FUEL_STRATEGY, corridor=None, **vehicle) -> tuple:
+    """
+    Returns (stops, total_cost, feasible) using the requested strategy.
+    Vehicle options are start_fuel_gallons, tank_capacity_gallons,
+    reserve_gallons and mpg; the greedy planner only uses its range,
+    (tank - reserve) * mpg. When the corridor's stations cannot cover the
+    trip, the stops are the partial plan and total_cost is
+    estimate_fuel_cost for the whole trip. corridor is an optional
+    planner.FuelCorridor for these stations, shared across vehicles.
+    """
+    mpg = vehicle.get("mpg", MPG)
+    if strategy == "greedy":
+        range_miles = (vehicle.get("tank_capacity_gallons", TANK_CAPACITY_GALLONS) - vehicle.get("reserve_gallons", RESERVE_GALLONS)) * mpg
+        stops = optimize_fuel_stops(stations, total_miles, range_miles)
+        # Greedy has no fuel model; a plan is feasible when no leg is longer than the range.
+        markers = [0.0] + [s["mile_marker"] for s in stops] + [total_miles]
+        feasible = all(b - a <= range_miles + 1e-9 for a, b in zip(markers, markers[1:]))
+        cost = calculate_fuel_cost(stops, total_miles, mpg)
+    else:
+        plan = plan_optimal_fuel_stops(stations, total_miles, corridor=corridor, **vehicle)
+        stops, cost, feasible = plan["stops"], plan["total_cost"], plan["feasible"]
+
+    if not feasible:
+        handle_info_log(
+            f"No feasible fuel plan for {round(total_miles, 1)} miles with {len(stations)} stations",
+            view_name="plan_fuel_stops",
+            app_name=APP_NAME,
+        )
+        cost = estimate_fuel_cost(total_miles, mpg)
+    return stops, cost, feasible
+
 def build_geojson(
         polyline: list,
         stops: list,
@@ -239,7 +408,179 @@ def build_geojson(
                 "name": stop["truckstop_name"],
                 "price_per_gallon": stop["retail_price"],
                 "mile_marker": round(stop["mile_marker"], 1),
+                "detour_miles": round(stop.get("detour_miles", 0.0), 2),
             }
         })
 
-    return {"type": "FeatureCollection", "features": features}
\ No newline at end of file
+    return {"type": "FeatureCollection", "features": features}
+
+def build_route_plan(
+        route: dict,
+        start_geo: tuple,
+        end_geo: tuple,
+        start_address: str,
+        end_address: str,
+        strategy: str = FUEL_STRATEGY,
+        vehicle: dict = None,
+        stations: list = None,
+        response_format: str = "geojson",
+    ) -> dict:
+    """
+    Runs stations -> fuel plan -> map for a fetched route and returns the API payload.
+
+    response_format picks the map encoding: "geojson" (FeatureCollection),
+    "polyline" (Google encoded polyline, about a tenth of the size) or
+    "lite" (no geometry at all).
+    """
+    polyline = simplified_polyline(route)
+    total_miles = route["distance_miles"]
+
+    if stations is None:
+        with timed("stations"):
+            stations = get_stations_near_route(
+                build_route_line(polyline, simplified=True), total_miles, polyline=route["polyline"]
+            )
+
+    with timed("optimize"):
+        stops, cost, feasible = plan_fuel_stops(stations, total_miles, strategy, **(vehicle or {}))
+
+    payload = {
+        "start": start_address,
+        "end": end_address,
+        "total_distance_miles": round(total_miles, 2),
+        "total_fuel_cost_usd": cost,
+        "feasible": feasible,
+        "fuel_strategy": strategy,
+        "optimized_stops": stops,
+    }
+
+    with timed("map"):
+        if response_format == "geojson":
+            payload["map"] = build_geojson(polyline, stops, start_geo, end_geo, start_address, end_address)
+        elif response_format == "polyline":
+            payload["route_polyline"] = encode_polyline(polyline)
+            payload["start_point"] = [start_geo[1], start_geo[0]]
+            payload["end_point"] = [end_geo[1], end_geo[0]]
+
+    return payload
+
+
+UPSTREAM_UNAVAILABLE_ERROR = "Geocoding or routing is temporarily unavailable; please retry."
+
+
+def _plan_key(start_address, end_address, strategy, vehicle, response_format):
+    return _cache_key(
+        "plan",
+        get_station_data_generation(),
+        start_address.strip(),
+        end_address.strip(),
+        strategy,
+        sorted(vehicle.items()),
+        response_format,
+    )
+
+
+def compute_route_plan(start_address, end_address, strategy, vehicle, response_format, key=None):
+    """
+    Runs the full pipeline and returns (payload, status); used inline and by
+    the refresh task. Plans and definitive misses (no geocode match, no
+    route) are cached; a 503 for an upstream outage is not.
+    """
+    key = key or _plan_key(start_address, end_address, strategy, vehicle, response_format)
+
+    try:
+        with timed("geocode"):
+            f_start = geocode_executor.submit(contextvars.copy_context().run, geocode_address, start_address)
+            f_end = geocode_executor.submit(contextvars.copy_context().run, geocode_address, end_address)
+            start_geo = f_start.result()
+            end_geo = f_end.result()
+
+        route = None
+        if start_geo and end_geo:
+            with timed("route"):
+                route = fetch_route(start_geo[0], start_geo[1], end_geo[0], end_geo[1])
+    except (GeocodingUnavailable, RoutingUnavailable):
+        # Transient: not cached, so the next request tries the upstream again.
+        return {"error": UPSTREAM_UNAVAILABLE_ERROR}, 503
+
+    if not start_geo:
+        result = ({"error": f"Could not geocode: {start_address}"}, 400)
+    elif not end_geo:
+        result = ({"error": f"Could not geocode: {end_address}"}, 400)
+    elif not route:
+        result = ({"error": "Route not found"}, 404)
+    else:
+        raise_if_expired("stations")
+        payload = build_route_plan(
+            route,
+            start_geo,
+            end_geo,
+            start_address,
+            end_address,
+            strategy=strategy,
+            vehicle=vehicle,
+            response_format=response_format,
+        )
+        result = (payload, 200)
+
+    plan_cache.set_with_soft_ttl(key, result, *_plan_cache_ttls(result))
+    return result
+
+
+def _plan_cache_ttls(result):
+    """(soft_ttl, hard_ttl) for a (payload, status) plan result."""
+    payload, status = result
+    if status == 200 and payload["feasible"]:
+        return ROUTE_PLAN_CACHE_TTL, ROUTE_PLAN_STALE_TTL
+    # Misses, and infeasible plans (often an empty corridor from a failed station lookup): retry soon.
+    return NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_TTL
+
+
+def _schedule_plan_refresh(key, start_address, end_address, strategy, vehicle, response_format):
+    # One refresh per key at a time, however many requests see the stale entry.
+    if not cache.add(f"refresh:{key}", 1, SINGLE_FLIGHT_LOCK_TTL):
+        return
+    try:
+        from app.tasks.tasks import refresh_route_plan
+        refresh_route_plan.delay(start_address, end_address, strategy, vehicle, response_format)
+    except Exception as e:
+        cache.delete(f"refresh:{key}")
+        handle_error_log(e, view_name="_schedule_plan_refresh", app_name=APP_NAME)
+
+
+def _fresh_plan(key):
+    cached = plan_cache.get_with_staleness(key)
+    return cached if cached is MISS else cached[0]
+
+
+def optimize_route(
+        start_address: str,
+        end_address: str,
+        strategy: str = FUEL_STRATEGY,
+        vehicle: dict = None,
+        response_format: str = "geojson",
+    ):
+    """
+    Geocode -> route -> stations -> plan for one request; returns (payload, status).
+
+    Identical requests share one computation across every worker: the
+    first one computes under a single-flight lock and the rest wait for its
+    cached result. The key includes the station data generation, so a
+    price upload never serves an older plan. Past ROUTE_PLAN_CACHE_TTL a
+    plan is still returned immediately while a Celery task recomputes it.
+    """
+    vehicle = vehicle or {}
+    key = _plan_key(start_address, end_address, strategy, vehicle, response_format)
+
+    cached = plan_cache.get_with_staleness(key)
+    if cached is not MISS:
+        result, stale = cached
+        if stale:
+            _schedule_plan_refresh(key, start_address, end_address, strategy, vehicle, response_format)
+        return result
+
+    return single_flight(
+        key,
+        compute=lambda: compute_route_plan(start_address, end_address, strategy, vehicle, response_format, key=key),
+        read=lambda: _fresh_plan(key),
+    )
@@ -0,0 +1,135 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .constants import SINGLE_FLIGHT_LOCK_TTL, SINGLE_FLIGHT_WAIT_SECONDS
+from .deadlines import current_deadline
+from .helper import APP_NAME, handle_error_log
+from .tiered_cache import MISS
+
+_POLL_START = 0.02
+_POLL_MAX = 0.25
+
+# Delete the lock only if it still holds our token, in one step: a leader
+# that outlived lock_ttl must not delete the next leader's lock.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _redis():
+    # Compare-and-delete needs Lua; other cache backends fall back to get-then-delete.
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+def single_flight(key: str, compute, read, lock_ttl: int = SINGLE_FLIGHT_LOCK_TTL, wait: float = SINGLE_FLIGHT_WAIT_SECONDS):
+    """
+    Runs compute() in at most one process at a time for a given key.
+
+    The first caller takes a Redis lock (SET NX with lock_ttl) and computes.
+    compute() is expected to write its result to the cache. Every other
+    caller polls read() until that result appears. read() returns MISS
+    while nothing is cached.
+
+    If the leader's lock disappears without a result (the leader failed),
+    the waiters race for the lock again. Once wait seconds have passed,
+    a caller computes for itself, so a stuck leader never blocks requests
+    for longer than that. The wait is also capped by the request deadline.
+    """
+    lock_key = f"sf:{key}"
+    token = uuid.uuid4().hex
+    budget = current_deadline()
+    if budget is not None:
+        wait = min(wait, budget.remaining())
+    deadline = time.monotonic() + wait
+
+    while time.monotonic() < deadline:
+        try:
+            acquired = cache.add(lock_key, token, lock_ttl)
+        except Exception as e:
+            handle_error_log(e, view_name="single_flight", app_name=APP_NAME)
+            break
+
+        if acquired:
+            try:
+                # Another leader may have finished between our cache miss and the lock.
+                value = read()
+                return value if value is not MISS else compute()
+            finally:
+                _release(lock_key, token)
+
+        delay = _POLL_START
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = read()
+            if value is not MISS:
+                return value
+            if cache.get(lock_key) is None:
+                # Leader finished without caching anything; contend for the lock again.
+                break
+            delay = min(delay * 2, _POLL_MAX)
+
+    return compute()
+
+
+async def asingle_flight(key: str, compute, read, lock_ttl: int = SINGLE_FLIGHT_LOCK_TTL, wait: float = SINGLE_FLIGHT_WAIT_SECONDS):
+    """
+    single_flight for coroutines: compute and read are async callables and
+    waiting yields to the event loop. It uses the same lock keys, so sync
+    and async callers of one key share a leader.
+    """
+    lock_key = f"sf:{key}"
+    token = uuid.uuid4().hex
+    budget = current_deadline()
+    if budget is not None:
+        wait = min(wait, budget.remaining())
+    deadline = time.monotonic() + wait
+
+    while time.monotonic() < deadline:
+        try:
+            acquired = await cache.aadd(lock_key, token, lock_ttl)
+        except Exception as e:
+            handle_error_log(e, view_name="asingle_flight", app_name=APP_NAME)
+            break
+
+        if acquired:
+            try:
+                value = await read()
+                return value if value is not MISS else await compute()
+            finally:
+                await sync_to_async(_release)(lock_key, token)
+
+        delay = _POLL_START
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            value = await read()
+            if value is not MISS:
+                return value
+            if await cache.aget(lock_key) is None:
+                break
+            delay = min(delay * 2, _POLL_MAX)
+
+    return await compute()
+
+
+def _release(lock_key, token):
+    try:
+        conn = _redis()
+        if conn is not None:
+            # Same key and value encoding django-redis used for the cache.add.
+            conn.eval(_RELEASE_LUA, 1, cache.client.make_key(lock_key), cache.client.encode(token))
+            return
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    except Exception as e:
+        handle_error_log(e, view_name="single_flight", app_name=APP_NAME)
@@ -0,0 +1,76 @@
+import json
+
+from django.core.cache import cache
+
+from .helper import APP_NAME, handle_error_log
+from .constants import (
+    HOT_CORRIDOR_ROUTES_KEY,
+    HOT_CORRIDOR_TRACK_MAX,
+    HOT_CORRIDORS_KEY,
+    STATION_DATA_GENERATION_KEY,
+)
+
+
+def get_station_data_generation() -> int:
+    return cache.get(STATION_DATA_GENERATION_KEY, 0)
+
+
+def bump_station_data_generation():
+    """
+    Starts a new station data generation. Call after ingestion or geocoding
+    has committed: corridor cache entries from older generations stop
+    matching and in-memory station indexes rebuild on their next check.
+    """
+    try:
+        cache.add(STATION_DATA_GENERATION_KEY, 0, None)
+        return cache.incr(STATION_DATA_GENERATION_KEY)
+    except Exception as e:
+        handle_error_log(e, view_name="bump_station_data_generation", app_name=APP_NAME)
+        return None
+
+
+def _redis():
+    # Hot-corridor ranking needs a sorted set; other cache backends skip it.
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+def record_hot_corridor(fingerprint: str, route_wkt: str, distance_miles: float):
+    client = _redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zincrby(HOT_CORRIDORS_KEY, 1, fingerprint)
+        pipe.hsetnx(HOT_CORRIDOR_ROUTES_KEY, fingerprint, json.dumps([route_wkt, distance_miles]))
+        pipe.execute()
+    except Exception as e:
+        handle_error_log(e, view_name="record_hot_corridor", app_name=APP_NAME)
+
+
+def hot_corridors(limit: int) -> list:
+    """
+    Returns [(route_wkt, distance_miles)] for the most requested corridors.
+    Halves every score and drops the tail beyond HOT_CORRIDOR_TRACK_MAX, so
+    the ranking follows current traffic rather than all-time totals.
+    """
+    client = _redis()
+    if client is None:
+        return []
+    try:
+        fingerprints = client.zrevrange(HOT_CORRIDORS_KEY, 0, limit - 1)
+        routes = client.hmget(HOT_CORRIDOR_ROUTES_KEY, fingerprints) if fingerprints else []
+
+        client.zunionstore(HOT_CORRIDORS_KEY, {HOT_CORRIDORS_KEY: 0.5})
+        stale = client.zrange(HOT_CORRIDORS_KEY, 0, -(HOT_CORRIDOR_TRACK_MAX + 1))
+        if stale:
+            client.zrem(HOT_CORRIDORS_KEY, *stale)
+            client.hdel(HOT_CORRIDOR_ROUTES_KEY, *stale)
+
+        return [tuple(json.loads(r)) for r in routes if r]
+    except Exception as e:
+        handle_error_log(e, view_name="hot_corridors", app_name=APP_NAME)
+        return []
@@ -0,0 +1,231 @@
+"""
+Station geocoding pipeline.
+
+Pending city/state pairs (stations without a location) are read in
+(state, city) order, a batch at a time. Each batch is geocoded on a
+bounded thread pool; lookups the offline gazetteer or the geocode cache
+can answer skip the upstream entirely, and the rest take a token from a
+bucket shared by every worker, so the whole fleet stays under
+GEOCODE_RATE_PER_SECOND. A batch's results land in one
+UPDATE ... FROM (VALUES ...), then the last pair is saved as a
+checkpoint: a run that crashes resumes after the last committed batch.
+"""
+import concurrent.futures
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .constants import (
+    GEOCODE_BUCKET_KEY,
+    GEOCODE_CHECKPOINT_KEY,
+    GEOCODE_PIPELINE_BATCH,
+    GEOCODE_PIPELINE_MAX_SECONDS,
+    GEOCODE_PIPELINE_WORKERS,
+    GEOCODE_RATE_BURST,
+    GEOCODE_RATE_PER_SECOND,
+    STATION_GEOCODE_NEGATIVE_TTL,
+)
+from .gazetteer import gazetteer_geocode, normalize_address
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .metrics import METRICS_ENABLED, registry, timed
+from .models import FuelStation
+from .services import geocode_address
+from .tiered_cache import MISS, geocode_cache
+
+# Refill and take one token atomically; returns seconds to wait ("0" when a
+# token was taken). Uses the Redis clock so workers on different hosts agree.
+_TAKE_TOKEN_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+_BULK_UPDATE_SQL = """
+    UPDATE fuel_stations AS fs
+    SET location = ST_SetSRID(ST_MakePoint(v.lng, v.lat), 4326)::geography,
+        geocoded_at = now()
+    FROM (VALUES {values}) AS v(city, state, lat, lng)
+    WHERE fs.city = v.city
+        AND fs.state = v.state
+        AND fs.location IS NULL
+"""
+
+
+def _redis():
+    # The bucket is shared through Redis; other cache backends get a per-process bucket.
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+class TokenBucket:
+    """
+    rate tokens per second with bursts of up to capacity. acquire() blocks
+    until a token is available.
+    """
+
+    def __init__(self, rate=GEOCODE_RATE_PER_SECOND, capacity=GEOCODE_RATE_BURST, key=GEOCODE_BUCKET_KEY,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.key = key
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = float(self.capacity)
+        self._ts = clock()
+        self._lock = threading.Lock()
+
+    def _take_local(self) -> float:
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def _take(self) -> float:
+        conn = _redis()
+        if conn is not None:
+            try:
+                return float(conn.eval(_TAKE_TOKEN_LUA, 1, self.key, self.rate, self.capacity))
+            except Exception as e:
+                handle_error_log(e, view_name="TokenBucket._take", app_name=APP_NAME)
+        return self._take_local()
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return
+            self.sleep(wait)
+
+
+def pending_city_states(after=None, limit=GEOCODE_PIPELINE_BATCH) -> list:
+    """Distinct (state, city) pairs without a location, in order, strictly after the `after` pair."""
+    qs = FuelStation.objects.filter(location__isnull=True)
+    if after:
+        qs = qs.filter(Q(state__gt=after[0]) | Q(state=after[0], city__gt=after[1]))
+    return list(qs.order_by("state", "city").values_list("state", "city").distinct()[:limit])
+
+
+def bulk_update_locations(rows: list) -> int:
+    """Sets the location of every unlocated station in each (city, state, lat, lng) row, in one statement."""
+    if not rows:
+        return 0
+    values = ", ".join(["(%s, %s, %s::float8, %s::float8)"] * len(rows))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_BULK_UPDATE_SQL.format(values=values), [v for row in rows for v in row])
+        return cursor.rowcount
+
+
+def geocode_city(state, city, bucket):
+    """
+    Returns ((lat, lng) or None, whether the upstream geocoder was called).
+    A definitive miss is remembered for STATION_GEOCODE_NEGATIVE_TTL; an
+    upstream error is not, so the next pass retries it.
+    """
+    address = f"{city}, {state}"
+    try:
+        local = gazetteer_geocode(address)
+        if local:
+            return local, False
+        # Same key geocode_address reads; a hit (or a remembered miss) must not spend a token.
+        cache_key = f"geo:{normalize_address(address)}"
+        cached = geocode_cache.get(cache_key)
+        if cached is not MISS:
+            return cached, False
+
+        bucket.acquire()
+        with timed("station_geocode"):
+            geo = geocode_address(address)
+        if geo is None:
+            geocode_cache.set_negative(cache_key, STATION_GEOCODE_NEGATIVE_TTL)
+        return geo, True
+    except Exception as e:
+        handle_error_log(e, view_name="geocode_city", app_name=APP_NAME, extra_values={"address": address})
+        return None, True
+
+
+def run_geocode_pipeline(batch_size=GEOCODE_PIPELINE_BATCH, max_workers=GEOCODE_PIPELINE_WORKERS,
+                         max_seconds=GEOCODE_PIPELINE_MAX_SECONDS, bucket=None) -> dict:
+    """
+    Geocodes pending stations until none are left or max_seconds have
+    passed, resuming from the saved checkpoint. Returns this run's counts
+    and throughput; "finished" is False when pending pairs remain.
+    """
+    bucket = bucket or TokenBucket()
+    checkpoint = cache.get(GEOCODE_CHECKPOINT_KEY)
+    after = tuple(checkpoint["after"]) if checkpoint else None
+
+    stats = {"pairs": 0, "resolved": 0, "unresolved": 0, "upstream_calls": 0, "stations_updated": 0}
+    finished = False
+    start = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            pairs = pending_city_states(after, batch_size)
+            if not pairs:
+                finished = True
+                break
+
+            results = list(pool.map(lambda pair: geocode_city(pair[0], pair[1], bucket), pairs))
+            rows = [(city, state, geo[0], geo[1]) for (state, city), (geo, _) in zip(pairs, results) if geo]
+            with timed("station_geocode_update"):
+                stats["stations_updated"] += bulk_update_locations(rows)
+
+            stats["pairs"] += len(pairs)
+            stats["resolved"] += len(rows)
+            stats["unresolved"] += len(pairs) - len(rows)
+            stats["upstream_calls"] += sum(1 for _, called in results if called)
+            if METRICS_ENABLED:
+                registry.inc("spotter_station_geocodes_total", len(rows), outcome="resolved")
+                registry.inc("spotter_station_geocodes_total", len(pairs) - len(rows), outcome="unresolved")
+
+            # Only after the batch's update has committed.
+            after = pairs[-1]
+            cache.set(GEOCODE_CHECKPOINT_KEY, {"after": list(after)}, None)
+
+            if time.monotonic() - start >= max_seconds:
+                break
+
+    if finished:
+        # A full pass is done; the next one starts from the top and retries unresolved pairs.
+        cache.delete(GEOCODE_CHECKPOINT_KEY)
+
+    elapsed = time.monotonic() - start
+    stats.update({
+        "finished": finished,
+        "elapsed_s": round(elapsed, 2),
+        "pairs_per_second": round(stats["pairs"] / elapsed, 2) if elapsed else 0.0,
+        "upstream_calls_per_second": round(stats["upstream_calls"] / elapsed, 2) if elapsed else 0.0,
+    })
+    handle_info_log(
+        f"Geocoded {stats['resolved']}/{stats['pairs']} city/state pairs, {stats['stations_updated']} stations "
+        f"in {stats['elapsed_s']}s ({stats['pairs_per_second']} pairs/s, "
+        f"{stats['upstream_calls_per_second']} upstream calls/s)",
+        view_name="run_geocode_pipeline",
+        app_name=APP_NAME,
+        extra_values=stats,
+    )
+    return stats
@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.db import connection
+
+from .geo import densify_polyline, project_points
+from .helper import APP_NAME, handle_error_log, handle_info_log
+from .station_data import get_station_data_generation
+from .constants import (
+    CORRIDOR_RADIUS_METERS,
+    STATION_INDEX_CELL_DEG,
+    STATION_INDEX_CHECK_SECONDS,
+)
+
+def _grid_cols(cell_deg):
+    return int(math.ceil(360 / cell_deg)) + 1
+
+
+def _cell_keys(lats, lngs, cell_deg):
+    ix = np.floor((np.asarray(lngs) + 180.0) / cell_deg).astype(np.int64)
+    iy = np.floor((np.asarray(lats) + 90.0) / cell_deg).astype(np.int64)
+    return iy * _grid_cols(cell_deg) + ix
+
+
+class StationIndex:
+    """
+    Packed-array grid over priced, geocoded stations.
+
+    Stations are sorted by grid cell so a cell's members are one contiguous
+    slice of the arrays; a corridor lookup gathers the cells around the
+    route and projects only those candidates onto the line.
+    """
+
+    def __init__(self, ids, names, prices, lats, lngs, cell_deg=STATION_INDEX_CELL_DEG):
+        self.cell_deg = cell_deg
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        keys = _cell_keys(lats, lngs, cell_deg)
+        order = np.argsort(keys, kind="stable")
+
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.names = [names[i] for i in order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+        self.lats = lats[order]
+        self.lngs = lngs[order]
+
+        self.cells, self.cell_start, self.cell_count = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_db(cls):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT
+                    fs.id,
+                    fs.truckstop_name,
+                    fs.retail_price,
+                    ST_Y(fs.location::geometry) AS lat,
+                    ST_X(fs.location::geometry) AS lng
+                FROM fuel_stations fs
+                WHERE fs.location IS NOT NULL AND fs.retail_price > 0
+            """)
+            rows = cursor.fetchall()
+
+        return cls(
+            ids=[r[0] for r in rows],
+            names=[r[1] for r in rows],
+            prices=[float(r[2]) for r in rows],
+            lats=[float(r[3]) for r in rows],
+            lngs=[float(r[4]) for r in rows],
+        )
+
+    def _candidates(self, coords, radius_m):
+        # Densify so every point of the route lies within a quarter cell of a vertex.
+        dense = densify_polyline(coords, self.cell_deg / 2)
+
+        max_lat = min(89.0, float(np.abs(dense[:, 1]).max()))
+        radius_deg = radius_m / (111320.0 * math.cos(math.radians(max_lat)))
+        ring = int(math.ceil((radius_deg + self.cell_deg / 4) / self.cell_deg))
+
+        base = np.unique(_cell_keys(dense[:, 1], dense[:, 0], self.cell_deg))
+        cols = _grid_cols(self.cell_deg)
+        offsets = np.array(
+            [dy * cols + dx for dy in range(-ring, ring + 1) for dx in range(-ring, ring + 1)],
+            dtype=np.int64,
+        )
+        wanted = np.unique((base[:, None] + offsets).ravel())
+
+        pos = np.searchsorted(self.cells, wanted)
+        inside = pos < len(self.cells)
+        pos = pos[inside]
+        pos = pos[self.cells[pos] == wanted[inside]]
+        if not len(pos):
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate([
+            np.arange(self.cell_start[p], self.cell_start[p] + self.cell_count[p])
+            for p in pos
+        ])
+
+    def near_route(self, coords, distance_miles, radius_m=CORRIDOR_RADIUS_METERS):
+        if len(self) == 0 or len(coords) < 2:
+            return []
+
+        idx = self._candidates(coords, radius_m)
+        if not len(idx):
+            return []
+
+        along_m, offset_m, total_m = project_points(coords, self.lats[idx], self.lngs[idx])
+        keep = offset_m <= radius_m
+        idx = idx[keep]
+        fraction = along_m[keep] / total_m if total_m > 0 else np.zeros(int(keep.sum()))
+        mile_markers = fraction * distance_miles
+
+        stations = []
+        for j in np.argsort(mile_markers, kind="stable"):
+            i = idx[j]
+            stations.append({
+                "id": int(self.ids[i]),
+                "truckstop_name": self.names[i],
+                "retail_price": float(self.prices[i]),
+                "mile_marker": float(mile_markers[j]),
+                "lat": float(self.lats[i]),
+                "lng": float(self.lngs[i]),
+            })
+        return stations
+
+
+_index = None
+_index_generation = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_station_index():
+    """
+    Returns this process's station index, rebuilding it when the station
+    data generation has moved. The generation is polled at most every
+    STATION_INDEX_CHECK_SECONDS so lookups stay off the network.
+    """
+    global _index, _index_generation, _index_checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < STATION_INDEX_CHECK_SECONDS:
+        return _index
+
+    with _index_lock:
+        if _index is not None and now - _index_checked_at < STATION_INDEX_CHECK_SECONDS:
+            return _index
+
+        generation = get_station_data_generation()
+        if _index is None or generation != _index_generation:
+            started = time.perf_counter()
+            _index = StationIndex.from_db()
+            _index_generation = generation
+            handle_info_log(
+                f"Station index built: {len(_index)} stations in "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms (generation {generation})",
+                view_name="get_station_index",
+                app_name=APP_NAME,
+            )
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+def stations_near_route_in_memory(coords, distance_miles):
+    """Corridor lookup against the in-memory index; None means use PostGIS."""
+    try:
+        index = get_station_index()
+        if not len(index):
+            return None
+        return index.near_route(coords, distance_miles)
+    except Exception as e:
+        handle_error_log(e, view_name="stations_near_route_in_memory", app_name=APP_NAME)
+        return None
@@ -0,0 +1,128 @@
+"""
+Local stand-ins for geocode.maps.co and OSRM, used by tests and by the
+"stub" routing backend.
+
+Both servers answer deterministically from the request itself, so no
+fixture data is needed: the geocoder hashes the query to a point inside
+the continental US and OSRM returns a straight polyline between the two
+coordinates with a road-like distance. Latency and failures can be
+injected to rehearse a slow or flaky upstream (see loadtest).
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .geo import EARTH_RADIUS_M
+
+_ROUTE_PATH = re.compile(r"^/route/v1/driving/(-?[\d.]+),(-?[\d.]+);(-?[\d.]+),(-?[\d.]+)$")
+
+
+def stub_geocode(query: str):
+    digest = hashlib.sha1(query.lower().encode()).digest()
+    lat = 30.0 + digest[0] / 255 * 15.0
+    lng = -120.0 + digest[1] / 255 * 45.0
+    return round(lat, 6), round(lng, 6)
+
+
+def stub_route(start_lng, start_lat, end_lng, end_lat, points=50):
+    coords = [
+        [start_lng + (end_lng - start_lng) * i / (points - 1), start_lat + (end_lat - start_lat) * i / (points - 1)]
+        for i in range(points)
+    ]
+    p1, p2 = math.radians(start_lat), math.radians(end_lat)
+    dp, dl = p2 - p1, math.radians(end_lng - start_lng)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    meters = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a)) * 1.2
+    return {"code": "Ok", "routes": [{"geometry": {"type": "LineString", "coordinates": coords}, "distance": meters}]}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests += 1
+        url = urlsplit(self.path)
+
+        server = self.server
+        delay = server.latency + (server.rng.uniform(0, server.jitter) if server.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if server.failure_rate and server.rng.random() < server.failure_rate:
+            server.failures += 1
+            return self._send_json(503, {"error": "injected failure"})
+
+        if url.path == "/search":
+            query = parse_qs(url.query).get("q", [""])[0]
+            if not query or "nowhere" in query.lower():
+                return self._send_json(200, [])
+            lat, lng = stub_geocode(query)
+            return self._send_json(200, [{"lat": str(lat), "lon": str(lng), "display_name": query}])
+
+        match = _ROUTE_PATH.match(url.path)
+        if match:
+            return self._send_json(200, stub_route(*map(float, match.groups())))
+
+        self._send_json(404, {"error": "not found"})
+
+
+class StubServer:
+    """
+    Runs the geocoder/OSRM stub on a background thread; use as a context manager.
+
+    Each request waits latency seconds plus a uniform [0, jitter] extra, then
+    fails with HTTP 503 with probability failure_rate. Pass seed to make
+    the jitter and failures repeatable.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.requests = 0
+        self.httpd.failures = 0
+        self.httpd.latency = latency
+        self.httpd.jitter = jitter
+        self.httpd.failure_rate = failure_rate
+        self.httpd.rng = random.Random(seed)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def failures(self):
+        return self.httpd.failures
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
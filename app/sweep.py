@@ -0,0 +1,144 @@
+"""
+Vehicle-profile sweeps: one route and station corridor, many trucks.
+
+The route, corridor lookup and the planner's station arrays (positions,
+prices and the next-cheaper index, which do not depend on the vehicle)
+are built once. Each profile (mpg, tank size, reserve, start fuel) is then
+planned by plan_fuel_stops over that shared FuelCorridor, so a profile
+costs one planner pass instead of a fresh request and gets exactly the
+plan /api/route-optimize/ would return.
+"""
+import contextvars
+
+from .constants import (
+    DEFAULT_START_FUEL_FRACTION,
+    FUEL_STRATEGY,
+    MPG,
+    RESERVE_GALLONS,
+    TANK_CAPACITY_GALLONS,
+)
+from .deadlines import raise_if_expired
+from .helper import APP_NAME, handle_info_log
+from .metrics import timed
+from .planner import FuelCorridor
+from .routing import RoutingUnavailable
+from .services import (
+    UPSTREAM_UNAVAILABLE_ERROR,
+    GeocodingUnavailable,
+    build_route_line,
+    fetch_route,
+    geocode_address,
+    geocode_executor,
+    get_stations_near_route,
+    plan_fuel_stops,
+    simplified_polyline,
+)
+
+
+def sweep_profiles(stations: list, total_miles: float, profiles: list, strategy: str = FUEL_STRATEGY) -> list:
+    """
+    Plans every vehicle profile against one corridor and returns the cost
+    table, one row per profile in input order. A profile may set name, mpg,
+    tank_capacity_gallons, reserve_gallons and start_fuel_gallons; missing
+    values fall back to the defaults in app.constants.
+    """
+    corridor = FuelCorridor(stations, total_miles) if strategy != "greedy" else None
+    rows = []
+
+    for i, profile in enumerate(profiles):
+        mpg = profile.get("mpg", MPG)
+        tank = profile.get("tank_capacity_gallons", TANK_CAPACITY_GALLONS)
+        reserve = profile.get("reserve_gallons", RESERVE_GALLONS)
+        start_fuel = profile.get("start_fuel_gallons", tank * DEFAULT_START_FUEL_FRACTION)
+        row = {
+            "name": profile.get("name") or f"profile-{i + 1}",
+            "mpg": mpg,
+            "tank_capacity_gallons": tank,
+            "reserve_gallons": reserve,
+            "start_fuel_gallons": start_fuel,
+            "range_miles": round((tank - reserve) * mpg, 1),
+        }
+
+        stops, cost, feasible = plan_fuel_stops(
+            stations,
+            total_miles,
+            strategy,
+            corridor=corridor,
+            mpg=mpg,
+            tank_capacity_gallons=tank,
+            reserve_gallons=reserve,
+            start_fuel_gallons=start_fuel,
+        )
+        if strategy == "greedy":
+            stops = [_stop_row(s) for s in stops]
+            row["total_gallons"] = round(total_miles / mpg, 2)
+        else:
+            stops = [{**_stop_row(s), "gallons": s["gallons"], "cost": s["cost"]} for s in stops]
+            row["total_gallons"] = round(sum(s["gallons"] for s in stops), 2)
+
+        row.update({
+            "feasible": feasible,
+            "total_fuel_cost_usd": cost,
+            "stop_count": len(stops),
+            "stops": stops,
+        })
+        rows.append(row)
+
+    return rows
+
+
+def _stop_row(station):
+    return {
+        "id": station["id"],
+        "truckstop_name": station["truckstop_name"],
+        "retail_price": station["retail_price"],
+        "mile_marker": round(station["mile_marker"], 1),
+    }
+
+
+def sweep_route(start_address: str, end_address: str, profiles: list, strategy: str = FUEL_STRATEGY):
+    """
+    Geocode -> route -> stations once, then every profile; returns (payload, status).
+    """
+    try:
+        with timed("geocode"):
+            f_start = geocode_executor.submit(contextvars.copy_context().run, geocode_address, start_address)
+            f_end = geocode_executor.submit(contextvars.copy_context().run, geocode_address, end_address)
+            start_geo = f_start.result()
+            end_geo = f_end.result()
+
+        if not start_geo:
+            return {"error": f"Could not geocode: {start_address}"}, 400
+        if not end_geo:
+            return {"error": f"Could not geocode: {end_address}"}, 400
+
+        with timed("route"):
+            route = fetch_route(start_geo[0], start_geo[1], end_geo[0], end_geo[1])
+    except (GeocodingUnavailable, RoutingUnavailable):
+        return {"error": UPSTREAM_UNAVAILABLE_ERROR}, 503
+    if not route:
+        return {"error": "Route not found"}, 404
+
+    raise_if_expired("stations")
+    total_miles = route["distance_miles"]
+    with timed("stations"):
+        stations = get_stations_near_route(
+            build_route_line(simplified_polyline(route), simplified=True), total_miles, polyline=route["polyline"]
+        )
+
+    with timed("sweep"):
+        rows = sweep_profiles(stations, total_miles, profiles, strategy)
+
+    handle_info_log(
+        f"Swept {len(profiles)} vehicle profiles over {len(stations)} stations",
+        view_name="sweep_route",
+        app_name=APP_NAME,
+    )
+    return {
+        "start": start_address,
+        "end": end_address,
+        "total_distance_miles": round(total_miles, 2),
+        "fuel_strategy": strategy,
+        "stations_in_corridor": len(stations),
+        "profiles": rows,
+    }, 200
@@ -1,66 +1,86 @@
-import pandas as pd
 from celery import shared_task
-from django.db import transaction
+from celery.signals import task_postrun
+from django.core.cache import cache
 from django.utils import timezone
-from django.contrib.gis.geos import Point
-
-from app.models import FuelStation, FuelPriceUpload
-from app.services import geocode_address
+from django.contrib.gis.geos import GEOSGeometry
+
+from app.models import FuelPriceUpload
+from app.constants import GEOCODE_PIPELINE_BATCH, GEOCODE_PIPELINE_LOCK_KEY, GEOCODE_PIPELINE_LOCK_TTL, HOT_CORRIDOR_WARM_COUNT
+from app.services import compute_route_plan, get_stations_near_route
+from app.station_geocoding import run_geocode_pipeline
+from app.ingest import ingest_fuel_prices
+from app.jobs import run_route_job
+from app.station_data import bump_station_data_generation, hot_corridors
 from app.helper import APP_NAME, handle_error_log, handle_info_log
+from app.metrics import registry, timed
 
-REQUIRED_COLUMNS = [
-    "OPIS Truckstop ID",
-    "Truckstop Name",
-    "Address",
-    "City",
-    "State",
-    "Rack ID",
-    "Retail Price",
-]
 
+@task_postrun.connect
+def flush_task_metrics(**kwargs):
+    registry.flush()
+
+
+def station_data_changed():
+    """Call once station writes have committed: new generation, then re-warm hot corridors."""
+    bump_station_data_generation()
+    warm_station_corridors.delay()
+
+
+@shared_task(queue="maintenance", ignore_result=True)
+def refresh_route_plan(start_address, end_address, strategy, vehicle, response_format):
+    """Recomputes a plan that was served stale, outside of any request's deadline."""
+    try:
+        compute_route_plan(start_address, end_address, strategy, vehicle, response_format)
+    except Exception as e:
+        handle_error_log(e, view_name="refresh_route_plan", app_name=APP_NAME)
 
-@shared_task(
-    queue="maintenance",
-    rate_limit="1/s",
-)
-def geocode_stations(batch_size=100):
-    """
-    Runs periodically via Celery Beat.
-    Processes limited batch each time.
-    """
 
-    city_states = list(
-        FuelStation.objects
-        .filter(location__isnull=True)
-        .values_list("city", "state")
-        .distinct()[:batch_size]
-    )
+@shared_task(queue="route_processing", ignore_result=True)
+def process_route_job(job_id):
+    """Plans a queued RouteJob; status, progress and results live on the job row."""
+    with timed("route_job"):
+        run_route_job(job_id)
 
-    if not city_states:
-        return "NO_PENDING_RECORDS"
 
-    for city, state in city_states:
+@shared_task(queue="maintenance")
+def warm_station_corridors(limit=HOT_CORRIDOR_WARM_COUNT):
+    """
+    Recomputes the most requested corridors under the current station data
+    generation so the first request after a price upload is still a cache hit.
+    """
+    warmed = 0
+    for route_wkt, distance_miles in hot_corridors(limit):
         try:
-            lat_lng = geocode_address(f"{city}, {state}")
+            with timed("warm_corridor"):
+                get_stations_near_route(GEOSGeometry(route_wkt, srid=4326), distance_miles, track=False)
+            warmed += 1
+        except Exception as e:
+            handle_error_log(e, view_name="warm_station_corridors", app_name=APP_NAME)
+
+    return f"Warmed {warmed} corridors"
 
-            if not lat_lng:
-                continue
 
-            lat, lng = lat_lng
+@shared_task(queue="maintenance")
+def geocode_stations(batch_size=GEOCODE_PIPELINE_BATCH):
+    """
+    Geocodes every station without a location (see app.station_geocoding).
+    Queued when an upload adds stations; Celery Beat runs it as a safety
+    net. A run that hits its time budget re-queues itself.
+    """
+    if not cache.add(GEOCODE_PIPELINE_LOCK_KEY, 1, GEOCODE_PIPELINE_LOCK_TTL):
+        return "ALREADY_RUNNING"
 
-            FuelStation.objects.filter(
-                city=city,
-                state=state,
-                location__isnull=True
-            ).update(
-                location=Point(lng, lat, srid=4326),
-                geocoded_at=timezone.now()
-            )
+    try:
+        stats = run_geocode_pipeline(batch_size)
+    finally:
+        cache.delete(GEOCODE_PIPELINE_LOCK_KEY)
 
-        except Exception:
-            continue
+    if stats["stations_updated"]:
+        station_data_changed()
+    if not stats["finished"]:
+        geocode_stations.delay(batch_size)
 
-    return f"Processed {len(city_states)} city batches"
+    return stats
 
 
 
@@ -77,44 +97,29 @@ def process_fuel_upload(self, upload_id):
     upload.save(update_fields=["status"])
 
     try:
-        file_path = upload.file.path
-        df = pd.read_csv(file_path) if file_path.endswith(".csv") else pd.read_excel(file_path)
-
-        for col in REQUIRED_COLUMNS:
-            if col not in df.columns:
-                raise ValueError(f"Missing column: {col}")
-
-        upload.total_records = len(df)
-        upload.save(update_fields=["total_records"])
-
-        stations = [
-            FuelStation(
-                opis_id=row["OPIS Truckstop ID"],
-                truckstop_name=row["Truckstop Name"],
-                address=row["Address"],
-                city=row["City"],
-                state=row["State"],
-                rack_id=row.get("Rack ID"),
-                retail_price=row["Retail Price"],
-            )
-            for _, row in df.iterrows()
-        ]
-
-        with transaction.atomic():
-            created = FuelStation.objects.bulk_create(
-                stations,
-                ignore_conflicts=True,
-                batch_size=1000
-            )
-
-        after_count = FuelStation.objects.count()
-        upload.inserted_records = after_count - upload.total_records 
+        with timed("ingest"):
+            counts = ingest_fuel_prices(upload.file.path)
+
+        upload.total_records = counts["total"]
+        upload.inserted_records = counts["inserted"]
+        upload.updated_records = counts["updated"]
+        upload.unchanged_records = counts["unchanged"]
+        upload.skipped_records = counts["skipped"]
 
         upload.status = FuelPriceUpload.Status.COMPLETED
         upload.processed_at = timezone.now()
         upload.save()
 
-        geocode_stations.delay()
+        handle_info_log(
+            f"Upload {upload_id}: {counts}",
+            view_name="process_fuel_upload",
+            app_name=APP_NAME,
+        )
+
+        if counts["inserted"] or counts["updated"]:
+            station_data_changed()
+        if counts["inserted"]:
+            geocode_stations.delay()
 
     except Exception as e:
         upload.status = FuelPriceUpload.Status.FAILED
@@ -0,0 +1,1820 @@
+import asyncio
+import concurrent.futures
+import functools
+import gzip
+import heapq
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
+
+import brotli
+import h3
+import numpy as np
+import requests
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.gis.geos import LineString
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from app import async_services
+from app.consumers import websocket_urlpatterns
+from app.jobs import JobProgress, job_group, publish, run_route_job
+from app.benchmarks import STAGES, compare_to_baseline, load_results, run_benchmarks, synthetic_route, synthetic_stations
+from app.cache_keys import corridor_fingerprint, quantize_coords
+from app.constants import BENCHMARK_BASELINE_PATH, CORRIDOR_KEY_GRID_DEG, CORRIDOR_RADIUS_METERS, REQUIRED_COLUMNS
+from app.geo import METERS_PER_MILE, RouteProjector, _offsets_to_chord, encode_polyline, project_points, simplify_polyline
+from app.graph_routing import RoadGraph, _haversine_m
+from app.gazetteer import Gazetteer, gazetteer_geocode, get_gazetteer, normalize_address, parse_city_state
+from app import helper
+from app.h3_corridor import corridor_cells, stations_near_route_h3
+from app.ingest import _COPY_SQL, _CREATE_STAGING_SQL, _MERGE_SQL, _chunk_to_csv, ingest_fuel_prices, iter_upload_chunks
+from app.loadtest import replay, summarize, synthetic_fuel_csv, synthetic_traffic
+from app.metrics import BUCKETS, MetricsRegistry, ServerTimingMiddleware, metrics_view, registry, render_prometheus, timed
+from app.middleware import CompressionMiddleware, RequestStatsMiddleware
+from app.renderers import ORJSONRenderer
+from app.deadlines import DeadlineExceeded, deadline_scope, hedged, stage_timeout
+from app.routing import CircuitBreaker, GraphBackend, OSRMBackend, RoutingUnavailable, StubBackend
+from app.batch import optimize_route_batch
+from app.services import GeocodingUnavailable, _plan_key, build_route_plan, compute_route_plan, fetch_route, get_stations_near_route, locate_stations, optimize_route
+from app.services import simplify_route, with_simplified_polyline
+from app.planner import next_cheaper_indices, plan_optimal_fuel_stops
+from app.services import plan_fuel_stops
+from app.single_flight import _RELEASE_LUA, _release, single_flight
+from app.station_data import bump_station_data_generation
+from app.station_geocoding import TokenBucket, bulk_update_locations, run_geocode_pipeline
+from app.station_index import StationIndex
+from app.stubs import StubServer, stub_geocode, stub_route
+from app.sweep import sweep_profiles
+from app.views import RouteBatchOptimizeAPI, RouteSweepAPI
+from app.tasks.tasks import (
+    geocode_stations,
+    process_fuel_upload,
+    process_route_job,
+    refresh_route_plan,
+    warm_station_corridors,
+)
+from app.tiered_cache import MISS, TieredCache, geocode_cache, plan_cache, route_cache, stations_cache
+from spotter.celery import app as celery_app
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+MEMORY_CHANNEL_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AsyncRoutePipelineTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.stub = StubServer().start()
+        cls.patches = [
+            mock.patch.object(async_services, "GEOCODE_URL", f"{cls.stub.url}/search"),
+            mock.patch("app.routing._backend", OSRMBackend(base_url=cls.stub.url)),
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for patch in cls.patches:
+            patch.stop()
+        cls.stub.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        for tier in (geocode_cache, route_cache, stations_cache, plan_cache):
+            tier.clear_local()
+
+    async def test_geocode_hits_stub_once_then_cache(self):
+        before = self.stub.requests
+        first = await async_services.ageocode_address("Smallville, KS")
+        second = await async_services.ageocode_address("  smallville, ks ")
+        await async_services.close_clients()
+
+        self.assertEqual(first, stub_geocode("Smallville, KS, USA"))
+        self.assertEqual(second, first)
+        self.assertEqual(self.stub.requests - before, 1)
+
+    async def test_geocode_miss_returns_none_and_is_cached(self):
+        before = self.stub.requests
+        first = await async_services.ageocode_address("Nowhere")
+        second = await async_services.ageocode_address("Nowhere")
+        await async_services.close_clients()
+
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(self.stub.requests - before, 1)
+
+    async def test_fetch_route_returns_polyline_and_miles(self):
+        route = await async_services.afetch_route(32.77, -96.79, 39.74, -104.99)
+        await async_services.close_clients()
+
+        self.assertEqual(route["polyline"][0], [-96.79, 32.77])
+        self.assertEqual(route["polyline"][-1], [-104.99, 39.74])
+        self.assertGreater(route["distance_miles"], 600)
+
+    def test_sync_fetch_route_uses_configured_backend(self):
+        before = self.stub.requests
+        route = fetch_route(32.77, -96.79, 35.47, -97.52)
+        again = fetch_route(32.77, -96.79, 35.47, -97.52)
+
+        self.assertEqual(route["polyline"][-1], [-97.52, 35.47])
+        self.assertEqual(route["simplified"][-1], [-97.52, 35.47])
+        self.assertEqual(again, route)
+        self.assertEqual(self.stub.requests - before, 1)
+
+    async def _replay_route_hit_rate(self, grid_deg):
+        rng = np.random.default_rng(6)
+        places = [(32.7767, -96.797), (39.7392, -104.9903), (35.4676, -97.5164), (29.7604, -95.3698)]
+        before_requests = self.stub.requests
+        before = route_cache.stats()
+
+        with mock.patch("app.cache_keys.ROUTE_SNAP_GRID_DEG", grid_deg):
+            for _ in range(60):
+                (a_lat, a_lng), (b_lat, b_lng) = (places[i] for i in rng.choice(len(places), 2, replace=False))
+                # Geocoders return slightly different points for "Dallas, TX" vs "dallas tx".
+                jitter = rng.uniform(-2e-4, 2e-4, 4)
+                await async_services.afetch_route(a_lat + jitter[0], a_lng + jitter[1], b_lat + jitter[2], b_lng + jitter[3])
+        await async_services.close_clients()
+
+        after = route_cache.stats()
+        # Per request: a single-flight leader re-reads the cache once after taking the lock.
+        return (after["local_hits"] - before["local_hits"]) / 60, self.stub.requests - before_requests
+
+    async def test_snapping_raises_route_cache_hit_rate(self):
+        unsnapped_rate, unsnapped_calls = await self._replay_route_hit_rate(0)
+        snapped_rate, snapped_calls = await self._replay_route_hit_rate(0.001)
+
+        self.assertEqual(unsnapped_rate, 0.0)
+        self.assertEqual(unsnapped_calls, 60)
+        self.assertGreater(snapped_rate, 0.5)
+        self.assertLessEqual(snapped_calls, 60 - 30)
+
+    async def test_optimize_route_end_to_end(self):
+        stations = [
+            {"id": 1, "truckstop_name": "A", "retail_price": 3.5, "mile_marker": 300.0, "lat": 0.0, "lng": 0.0},
+            {"id": 2, "truckstop_name": "B", "retail_price": 3.1, "mile_marker": 450.0, "lat": 0.0, "lng": 0.0},
+        ]
+        with mock.patch("app.services.get_stations_near_route", return_value=stations):
+            payload, status = await async_services.aoptimize_route("Dallas, TX", "Denver, CO", "optimal")
+        await async_services.close_clients()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["fuel_strategy"], "optimal")
+        self.assertEqual(payload["map"]["type"], "FeatureCollection")
+
+    async def test_optimize_route_shares_plan_cache_with_sync_path(self):
+        with mock.patch("app.services.get_stations_near_route", return_value=[]):
+            payload, status = await async_services.aoptimize_route("Dallas, TX", "Denver, CO", "optimal")
+            before = self.stub.requests
+            again = await async_services.aoptimize_route("Dallas, TX", "Denver, CO", "optimal")
+            sync_result = await sync_to_async(optimize_route)("Dallas, TX", "Denver, CO", "optimal")
+        await async_services.close_clients()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(again, (payload, 200))
+        self.assertEqual(sync_result, (payload, 200))
+        self.assertEqual(self.stub.requests, before)
+
+    async def test_stale_plan_is_served_while_refreshing(self):
+        key = await sync_to_async(_plan_key)("Dallas, TX", "Tulsa, OK", "optimal", {}, "geojson")
+        await plan_cache.aset_with_soft_ttl(key, ({"cached": True}, 200), -1, 60)
+
+        with mock.patch("app.async_services._schedule_plan_refresh") as refresh:
+            result = await async_services.aoptimize_route("Dallas, TX", "Tulsa, OK", "optimal")
+
+        self.assertEqual(result, ({"cached": True}, 200))
+        refresh.assert_called_once()
+
+    async def test_geocoder_outage_returns_503_and_is_not_cached(self):
+        with mock.patch.object(self.stub.httpd, "failure_rate", 1.0):
+            payload, status = await async_services.aoptimize_route("Smallville, KS", "Denver, CO", "optimal")
+        await async_services.close_clients()
+
+        self.assertEqual(status, 503)
+        self.assertIs(await geocode_cache.aget(f"geo:{normalize_address('Smallville, KS')}"), MISS)
+        key = await sync_to_async(_plan_key)("Smallville, KS", "Denver, CO", "optimal", {}, "geojson")
+        self.assertIs(await plan_cache.aget_with_staleness(key), MISS)
+
+    async def test_osrm_aroute_without_a_client(self):
+        route = await OSRMBackend(base_url=self.stub.url).aroute(32.77, -96.79, 35.47, -97.52)
+
+        self.assertEqual(route["polyline"][-1], [-97.52, 35.47])
+
+    async def test_async_view(self):
+        with mock.patch("app.services.get_stations_near_route", return_value=[]):
+            response = await self.async_client.get(
+                "/api/route-optimize/async/", {"start": "Dallas, TX", "end": "Tulsa, OK"}
+            )
+        await async_services.close_clients()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["start"], "Dallas, TX")
+
+    async def test_async_view_returns_504_when_budget_runs_out(self):
+        async def slow_route(*args):
+            await asyncio.sleep(1)
+
+        with mock.patch("app.views.ROUTE_REQUEST_BUDGET_SECONDS", 0.2), \
+                mock.patch("app.async_services.afetch_route", side_effect=slow_route):
+            started = time.monotonic()
+            response = await self.async_client.get(
+                "/api/route-optimize/async/", {"start": "Dallas, TX", "end": "Tulsa, OK"}
+            )
+        await async_services.close_clients()
+
+        self.assertEqual(response.status_code, 504)
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    async def test_async_view_rejects_ungeocodable_address(self):
+        response = await self.async_client.get(
+            "/api/route-optimize/async/", {"start": "Nowhere", "end": "Tulsa, OK"}
+        )
+        await async_services.close_clients()
+
+        self.assertEqual(response.status_code, 400)
+
+
+class GazetteerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gazetteer = Gazetteer()
+        self.gazetteer.add("Kansas City", "MO", 39.0997, -94.5786)
+        self.gazetteer.add("Kansas City", "KS", 39.1142, -94.6275)
+        self.gazetteer.add("St. Louis", "MO", 38.6270, -90.1994)
+        self.gazetteer.add("Amarillo", "TX", 35.2220, -101.8313)
+
+    def test_parses_state_names_and_abbreviations(self):
+        self.assertEqual(parse_city_state("Amarillo, Texas"), ("amarillo", "TX"))
+        self.assertEqual(parse_city_state("amarillo tx 79101"), ("amarillo", "TX"))
+        self.assertEqual(parse_city_state("Saint Louis, MO, USA"), ("st louis", "MO"))
+        self.assertIsNone(parse_city_state("123 Main St, Amarillo, TX"))
+
+    def test_lookup_exact_and_fuzzy(self):
+        self.assertEqual(self.gazetteer.lookup("amarillo", "TX"), (35.2220, -101.8313))
+        self.assertIsNone(self.gazetteer.lookup("amarilo", "TX"))
+        self.assertIsNone(self.gazetteer.lookup("amarillo", "NM"))
+
+        self.gazetteer.fuzzy = True
+        self.assertEqual(self.gazetteer.lookup("amarilo", "TX"), (35.2220, -101.8313))
+        self.assertEqual(self.gazetteer.lookup("kansas cty", "KS"), (39.1142, -94.6275))
+
+    def test_fuzzy_match_must_be_unique(self):
+        self.gazetteer.fuzzy = True
+        self.gazetteer.add("Austin", "TX", 30.2672, -97.7431)
+        self.gazetteer.add("Dustin", "TX", 30.0, -97.0)
+        self.assertIsNone(self.gazetteer.lookup("justin", "TX"))
+
+    def test_address_normalization(self):
+        self.assertEqual(normalize_address("Dallas, TX"), "dallas, tx")
+        self.assertEqual(normalize_address("  dallas tx "), "dallas, tx")
+        self.assertEqual(normalize_address("Dallas, Texas, USA"), "dallas, tx")
+        self.assertEqual(
+            normalize_address("1200 North Main Street, Dallas, TX 75201, USA"),
+            normalize_address("1200 n. main st dallas tx 75201"),
+        )
+
+    def test_ambiguous_city_without_state_is_left_to_http(self):
+        self.assertIsNone(self.gazetteer.lookup("kansas city"))
+        self.assertEqual(self.gazetteer.lookup("amarillo"), (35.2220, -101.8313))
+
+    def test_bundled_file_answers_city_queries(self):
+        self.assertIsNotNone(gazetteer_geocode("Dallas, TX"))
+        self.assertIsNone(gazetteer_geocode("Smallville, KS"))
+        # A town missing from the bundled list must not resolve to a similarly spelled one (Austin).
+        self.assertIsNone(gazetteer_geocode("Justin, TX"))
+
+    CENSUS_PLACES = (
+        "USPS\tGEOID\tANSICODE\tNAME\tALAND\tAWATER\tINTPTLAT\tINTPTLONG                   \n"
+        "TX\t4838632\t02410829\tJustin city\t6904462\t0\t33.084929\t-97.301288\n"
+        "TN\t4752006\t02405092\tNashville-Davidson metropolitan government (balance)\t1230001396\t56231149\t36.171800\t-86.785002\n"
+    )
+
+    def test_loads_national_census_zip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "places.zip")
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr("2023_Gaz_place_national.txt", self.CENSUS_PLACES)
+            gazetteer = Gazetteer.from_file(path)
+
+        self.assertEqual(gazetteer.size, 2)
+        self.assertEqual(gazetteer.lookup("justin", "TX"), (33.084929, -97.301288))
+        self.assertEqual(gazetteer.lookup("nashville", "TN"), (36.1718, -86.785002))
+
+    def test_missing_national_file_falls_back_to_bundled_list(self):
+        with mock.patch("app.gazetteer._gazetteer", None), \
+                mock.patch("app.gazetteer.GAZETTEER_PATH", "/nonexistent/places.zip"):
+            self.assertIsNotNone(get_gazetteer().lookup("dallas", "TX"))
+
+    def test_fetch_keeps_current_file_when_download_is_not_a_places_file(self):
+        page = mock.MagicMock()
+        page.__enter__.return_value = page
+        page.iter_content.return_value = [b"<html>Service Unavailable</html>"]
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch("app.management.commands.fetch_gazetteer.requests.get", return_value=page):
+            output = os.path.join(tmp, "places.zip")
+            with self.assertRaises(CommandError):
+                call_command("fetch_gazetteer", output=output)
+            self.assertEqual(os.listdir(tmp), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TieredCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tier = TieredCache("test", max_entries=2, max_bytes=1024 * 1024, local_ttl=60)
+
+    def test_miss_then_local_hit(self):
+        self.assertIs(self.tier.get("a"), MISS)
+        self.tier.set("a", [1, 2], 60)
+        self.assertEqual(self.tier.get("a"), [1, 2])
+
+        stats = self.tier.stats()
+        self.assertEqual(stats["local_hits"], 1)
+        self.assertEqual(stats["redis_misses"], 1)
+
+    def test_redis_hit_populates_local_tier(self):
+        cache.set("b", {"x": 1}, 60)
+        self.assertEqual(self.tier.get("b"), {"x": 1})
+        self.assertEqual(self.tier.get("b"), {"x": 1})
+
+        stats = self.tier.stats()
+        self.assertEqual(stats["redis_hits"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+
+    def test_negative_results_are_cached(self):
+        self.tier.set_negative("gone")
+        self.assertIsNone(self.tier.get("gone"))
+        self.assertEqual(self.tier.stats()["negative_hits"], 1)
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        for key in ("a", "b", "c"):
+            self.tier.set(key, key, 60)
+        self.assertEqual(self.tier.stats()["local_entries"], 2)
+        self.assertEqual(self.tier.stats()["local_evictions"], 1)
+
+        small = TieredCache("small", max_entries=100, max_bytes=400, local_ttl=60)
+        for key in range(5):
+            small.set(str(key), "x" * 80, 60)
+        self.assertLessEqual(small.stats()["local_bytes"], 400)
+
+
+class SimplifyPolylineTests(SimpleTestCase):
+
+    def test_dropped_vertices_stay_within_tolerance(self):
+        lng = np.linspace(-118.0, -74.0, 5000)
+        lat = 34.0 + 6.0 * np.sin(np.linspace(0.0, 9.0, 5000))
+        coords = np.column_stack([lng, lat])
+
+        simplified = simplify_polyline(coords, 50.0)
+        _, offsets, _ = project_points(simplified, lat, lng)
+
+        self.assertLess(len(simplified), len(coords) // 5)
+        self.assertEqual(simplified[0], coords[0].tolist())
+        self.assertEqual(simplified[-1], coords[-1].tolist())
+        self.assertLessEqual(offsets.max(), 50.0 + 1e-6)
+
+    def test_level_by_level_matches_split_by_split(self):
+        def reference(coords, tolerance_m):
+            rad = np.radians(coords)
+            keep = {0, len(coords) - 1}
+            stack = [(0, len(coords) - 1)]
+            while stack:
+                start, end = stack.pop()
+                if end - start < 2:
+                    continue
+                offsets = _offsets_to_chord(rad[start + 1:end], rad[start], rad[end])
+                worst = int(np.argmax(offsets))
+                if offsets[worst] > tolerance_m:
+                    keep.add(start + 1 + worst)
+                    stack += [(start, start + 1 + worst), (start + 1 + worst, end)]
+            return coords[sorted(keep)].tolist()
+
+        rng = np.random.default_rng(7)
+        for n in (3, 50, 4000):
+            coords = np.column_stack([
+                np.linspace(-100.0, -95.0, n) + rng.normal(0, 3e-4, n),
+                35.0 + np.sin(np.linspace(0.0, 6.0, n)) + rng.normal(0, 3e-4, n),
+            ])
+            for tolerance in (5.0, 50.0, 500.0):
+                self.assertEqual(simplify_polyline(coords, tolerance), reference(coords, tolerance))
+
+    def test_straight_line_collapses_to_endpoints(self):
+        coords = [[-100.0, 35.0 + i * 1e-4] for i in range(100)]
+        self.assertEqual(simplify_polyline(coords, 10.0), [coords[0], coords[-1]])
+
+
+class StationIndexTests(SimpleTestCase):
+
+    @staticmethod
+    def _brute_force(coords, lats, lngs, radius_m):
+        _, offset_m, _ = project_points(coords, lats, lngs)
+        return set(np.nonzero(offset_m <= radius_m)[0].tolist())
+
+    def test_corridor_matches_brute_force_across_cell_sizes(self):
+        rng = np.random.default_rng(3)
+        # A diagonal, then a zig-zag hugging grid lines, so the route crosses many cell boundaries.
+        routes = [
+            [[-100.0, 35.0], [-97.3, 37.6], [-95.1, 38.05]],
+            [[-98.0 + 0.3 * i, 36.0 + (0.249 if i % 2 else 0.001)] for i in range(12)],
+        ]
+        for coords in routes:
+            line = np.asarray(coords)
+            t = rng.integers(0, len(line) - 1, size=3000)
+            f = rng.random(3000)[:, None]
+            points = line[t] + f * (line[t + 1] - line[t]) + rng.normal(0, 0.08, size=(3000, 2))
+            lngs, lats = points[:, 0], points[:, 1]
+            expected = self._brute_force(coords, lats, lngs, CORRIDOR_RADIUS_METERS)
+            self.assertGreater(len(expected), 100)
+
+            for cell_deg in (0.05, 0.25, 1.0):
+                index = StationIndex(list(range(3000)), [f"S{i}" for i in range(3000)], [3.5] * 3000, lats, lngs, cell_deg=cell_deg)
+                found = index.near_route(coords, 300.0)
+                self.assertEqual({s["id"] for s in found}, expected, cell_deg)
+                markers = [s["mile_marker"] for s in found]
+                self.assertEqual(markers, sorted(markers))
+
+    def test_empty_index_and_degenerate_route(self):
+        self.assertEqual(StationIndex([], [], [], [], []).near_route([[-97.0, 35.0], [-96.0, 35.0]], 60.0), [])
+        index = StationIndex([1], ["A"], [3.5], [35.0], [-97.0])
+        self.assertEqual(index.near_route([[-97.0, 35.0]], 0.0), [])
+
+
+class RouteProjectorTests(SimpleTestCase):
+
+    def test_matches_brute_force_projection(self):
+        coords, _ = synthetic_route(seed=3, miles=300)
+        _, _, _, lats, lngs = synthetic_stations(500, seed=3, routes=[coords])
+
+        projector = RouteProjector(coords)
+        along, offset = projector.project(lats, lngs)
+        brute_along, brute_offset, brute_total = project_points(coords, lats, lngs)
+
+        np.testing.assert_allclose(offset, brute_offset, atol=1e-6)
+        near = brute_offset < 8046
+        np.testing.assert_allclose(along[near], (brute_along * projector.total_m / brute_total)[near], atol=1e-3)
+
+    def test_locate_stations_measures_on_full_polyline(self):
+        # Due north for 1 degree, with a station 0.01 degrees east of the midpoint.
+        polyline = [[-100.0, 35.0 + i / 1000] for i in range(1001)]
+        stations = [
+            {"id": 1, "retail_price": 3.0, "lat": 35.9, "lng": -100.0},
+            {"id": 2, "retail_price": 3.0, "lat": 35.5, "lng": -99.99},
+            {"id": 3, "retail_price": 3.0, "lat": 34.0, "lng": -100.0},
+        ]
+
+        located = locate_stations(stations, polyline, 70.0)
+
+        self.assertEqual([s["id"] for s in located], [3, 2, 1])
+        self.assertEqual(located[0]["mile_marker"], 0.0)
+        self.assertAlmostEqual(located[1]["mile_marker"], 35.0, places=3)
+        self.assertAlmostEqual(located[2]["mile_marker"], 63.0, places=3)
+        detour = 2 * 0.01 * 111195 * np.cos(np.radians(35.5)) / METERS_PER_MILE
+        self.assertAlmostEqual(located[1]["detour_miles"], detour, places=2)
+        self.assertNotIn("mile_marker", stations[0])
+
+    def test_get_stations_near_route_locates_on_given_polyline(self):
+        # The simplified line cuts a bend that the full route follows.
+        full = [[-100.0, 35.0], [-99.0, 35.0], [-99.0, 36.0], [-100.0, 36.0]]
+        simplified = LineString([full[0], full[-1]], srid=4326)
+        candidates = [{"id": 1, "retail_price": 3.0, "lat": 36.0, "lng": -99.5}]
+
+        with mock.patch("app.services._corridor_stations", return_value=candidates):
+            on_full = get_stations_near_route(simplified, 300.0, polyline=full)
+            on_simplified = get_stations_near_route(simplified, 300.0)
+
+        self.assertGreater(on_full[0]["mile_marker"], 200.0)
+        self.assertEqual(on_simplified[0]["mile_marker"], 300.0)
+
+
+class CompactEncodingTests(SimpleTestCase):
+
+    def test_encode_polyline_matches_reference(self):
+        coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+        self.assertEqual(encode_polyline(coords), "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    def test_response_formats(self):
+        route = {"polyline": [[-96.79, 32.77], [-100.0, 35.0], [-104.99, 39.74]], "distance_miles": 700.0}
+        args = (route, (32.77, -96.79), (39.74, -104.99), "Dallas, TX", "Denver, CO")
+
+        full = build_route_plan(*args, stations=[])
+        compact = build_route_plan(*args, stations=[], response_format="polyline")
+        lite = build_route_plan(*args, stations=[], response_format="lite")
+
+        self.assertEqual(full["map"]["type"], "FeatureCollection")
+        self.assertNotIn("map", compact)
+        self.assertEqual(compact["start_point"], [-96.79, 32.77])
+        self.assertIsInstance(compact["route_polyline"], str)
+        self.assertNotIn("map", lite)
+        self.assertNotIn("route_polyline", lite)
+
+    def test_orjson_renderer_output_is_valid_json(self):
+        data = {"miles": np.float64(12.5), "stops": [{"name": "A", "price": 3.1}]}
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), {"miles": 12.5, "stops": [{"name": "A", "price": 3.1}]})
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def _response(self, accept_encoding, path="/api/route-optimize/", content_type="application/json", cookie=None):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        body = json.dumps({"polyline": [[-96.0 + i / 100, 32.0] for i in range(200)]})
+
+        def view(request):
+            response = HttpResponse(body, content_type=content_type)
+            if cookie:
+                response.set_cookie(cookie, "secret-value")
+            return response
+
+        return CompressionMiddleware(view)(request), body
+
+    def test_brotli_preferred_when_accepted(self):
+        response, body = self._response("gzip, deflate, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content).decode(), body)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_gzip_fallback(self):
+        response, body = self._response("gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content).decode(), body)
+
+    def test_only_cookie_free_api_json_is_compressed(self):
+        for kwargs in (
+            {"path": "/admin/login/"},
+            {"content_type": "text/html"},
+            {"cookie": "csrftoken"},
+            {"cookie": "sessionid"},
+        ):
+            with self.subTest(**kwargs):
+                response, body = self._response("gzip, br", **kwargs)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertEqual(response.content.decode(), body)
+
+
+class FuelIngestChunkTests(SimpleTestCase):
+
+    def _write_csv(self, text):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        handle.write(text)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def test_chunks_are_bounded_and_copy_ready(self):
+        header = "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price,Extra\n"
+        rows = "".join(f"{i},\"Stop, #{i}\",I-40 EXIT {i},Amarillo,TX,{'' if i % 2 else 100},3.1{i % 10}99,x\n" for i in range(7))
+        path = self._write_csv(header + rows + ",Broken,,,TX,,\n")
+
+        chunks = list(iter_upload_chunks(path, chunksize=3))
+        self.assertEqual([len(c) for c in chunks], [3, 3, 2])
+        self.assertEqual(list(chunks[0].columns), REQUIRED_COLUMNS)
+
+        buffer, read, written = _chunk_to_csv(chunks[-1])
+        self.assertEqual((read, written), (2, 1))
+        self.assertEqual(buffer.getvalue(), '6,"Stop, #6",I-40 EXIT 6,Amarillo,TX,100,3.1699\n')
+
+    def test_chunks_are_staged_then_merged_once(self):
+        header = "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n"
+        rows = "".join(f"{i % 5},Stop {i},I-40 EXIT {i},Amarillo,TX,100,3.{i}\n" for i in range(7))
+        path = self._write_csv(header + rows + ",Broken,,,TX,,\n")
+
+        copied = []
+        cursor = mock.MagicMock()
+        cursor.copy_expert.side_effect = lambda sql, buffer: copied.append(buffer.getvalue())
+        # 5 distinct opis_ids: 2 inserted, 1 updated, the other 2 unchanged.
+        cursor.fetchone.return_value = (5, 2, 1)
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with mock.patch("app.ingest.connection", connection), mock.patch("app.ingest.transaction.atomic"):
+            counts = ingest_fuel_prices(path, chunksize=3)
+
+        self.assertEqual(counts, {"total": 8, "skipped": 1, "duplicates": 2, "inserted": 2, "updated": 1, "unchanged": 2})
+        self.assertEqual(len(copied), 3)
+        self.assertEqual(sum(len(c.splitlines()) for c in copied), 7)
+
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertEqual(statements, [_CREATE_STAGING_SQL, _MERGE_SQL])
+        self.assertIn("DISTINCT ON (opis_id)", _MERGE_SQL)
+        self.assertIn("ON CONFLICT (opis_id) DO UPDATE", _MERGE_SQL)
+        self.assertIn("IS DISTINCT FROM", _MERGE_SQL)
+        self.assertIn("RETURNING (xmax = 0) AS inserted", _MERGE_SQL)
+
+    def test_blank_address_is_copied_as_empty_string(self):
+        header = "OPIS Truckstop ID,Truckstop Name,Address,City,State,Rack ID,Retail Price\n"
+        path = self._write_csv(header + "1,A,,,TX,,3.1\n")
+
+        copied = []
+        cursor = mock.MagicMock()
+        cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.getvalue()))
+        cursor.fetchone.return_value = (1, 1, 0)
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        with mock.patch("app.ingest.connection", connection), mock.patch("app.ingest.transaction.atomic"):
+            counts = ingest_fuel_prices(path)
+
+        self.assertEqual((counts["total"], counts["skipped"]), (1, 0))
+        sql, data = copied[0]
+        self.assertEqual(data, "1,A,,,TX,,3.1\n")
+        # Unquoted empty CSV fields are NULL to COPY; the NOT NULL text columns must read them as "".
+        self.assertEqual(sql, _COPY_SQL)
+        self.assertIn("FORCE_NOT_NULL (truckstop_name, address, city, state)", _COPY_SQL)
+
+    def test_missing_column_is_rejected(self):
+        path = self._write_csv("OPIS Truckstop ID,Truckstop Name\n1,A\n")
+        with self.assertRaisesMessage(ValueError, "Missing column: Address"):
+            next(iter_upload_chunks(path))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StationGenerationTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        stations_cache.clear_local()
+        self.line = LineString([(-96.79, 32.77), (-104.99, 39.74)], srid=4326)
+
+    def _lookup(self, price):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchall.return_value = [(1, "A", price, 100.0, 35.0, -100.0)]
+        with mock.patch("app.services.connection") as connection:
+            connection.cursor.return_value = cursor
+            stations = get_stations_near_route(self.line, 700.0)
+        return stations, connection.cursor.called
+
+    def test_bump_invalidates_cached_corridor(self):
+        first, queried = self._lookup(3.10)
+        self.assertTrue(queried)
+        cached, queried = self._lookup(2.90)
+        self.assertFalse(queried)
+        self.assertEqual(cached[0]["retail_price"], 3.10)
+
+        self.assertEqual(bump_station_data_generation(), 1)
+        fresh, queried = self._lookup(2.90)
+        self.assertTrue(queried)
+        self.assertEqual(fresh[0]["retail_price"], 2.90)
+
+
+class CorridorFingerprintTests(SimpleTestCase):
+
+    @staticmethod
+    def _legacy_key(coords, miles):
+        return LineString(coords, srid=4326).wkt[:100], round(miles, 1)
+
+    def _lanes(self, rng, count=40, points=60):
+        """Route pairs that share their first third and their length, like two exits off one interstate."""
+        lanes = []
+        for _ in range(count // 2):
+            trunk = np.column_stack([
+                np.linspace(-97.0, -100.0, points),
+                32.0 + np.cumsum(rng.normal(0.0, 0.01, points)),
+            ])
+            branch = trunk.copy()
+            branch[points // 3:, 1] += np.linspace(0.05, 0.8, points - points // 3)
+            miles = float(rng.uniform(200.0, 900.0))
+            lanes += [(trunk, miles), (branch, miles)]
+        return lanes
+
+    def test_shared_prefix_no_longer_collides(self):
+        trunk, branch = [lane for lane in self._lanes(np.random.default_rng(1), count=2)]
+
+        self.assertEqual(self._legacy_key(*trunk), self._legacy_key(*branch))
+        self.assertNotEqual(corridor_fingerprint(*trunk), corridor_fingerprint(*branch))
+
+    def test_float_noise_maps_to_same_key(self):
+        coords, miles = self._lanes(np.random.default_rng(2), count=2)[0]
+        coords = quantize_coords(coords) * CORRIDOR_KEY_GRID_DEG
+        noisy = coords + np.random.default_rng(3).uniform(-1e-6, 1e-6, coords.shape)
+
+        self.assertEqual(corridor_fingerprint(coords, miles), corridor_fingerprint(noisy, miles))
+        self.assertNotEqual(corridor_fingerprint(coords, miles), corridor_fingerprint(coords, miles + 0.2))
+
+    def test_replayed_traffic_hit_rate(self):
+        rng = np.random.default_rng(4)
+        lanes = self._lanes(rng)
+        weights = 1.0 / np.arange(1, len(lanes) + 1)
+        replay = rng.choice(len(lanes), size=2000, p=weights / weights.sum())
+        ideal = 1 - len(set(replay.tolist())) / len(replay)
+
+        def run(key_fn, noise):
+            cache, hits, wrong = {}, 0, 0
+            for lane in replay.tolist():
+                coords, miles = lanes[lane]
+                if noise:
+                    coords = coords + rng.uniform(-noise, noise, coords.shape)
+                key = key_fn(coords, miles)
+                if key in cache:
+                    hits += 1
+                    wrong += cache[key] != lane
+                else:
+                    cache[key] = lane
+            return hits / len(replay), wrong
+
+        legacy_rate, legacy_wrong = run(self._legacy_key, noise=0)
+        exact_rate, exact_wrong = run(corridor_fingerprint, noise=0)
+        noisy_rate, noisy_wrong = run(corridor_fingerprint, noise=1e-7)
+
+        self.assertGreater(legacy_wrong, 0)
+        self.assertGreater(legacy_rate, ideal)
+        self.assertEqual(exact_wrong, 0)
+        self.assertAlmostEqual(exact_rate, ideal)
+        self.assertEqual(noisy_wrong, 0)
+        self.assertGreater(noisy_rate, 0.9 * ideal)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class H3CorridorTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        stations_cache.clear_local()
+
+        rng = np.random.default_rng(5)
+        self.route = np.column_stack([np.linspace(-97.0, -103.0, 80), 33.0 + np.sin(np.linspace(0, 4, 80))])
+        picks = self.route[rng.integers(0, len(self.route), 3000)]
+        self.lngs = picks[:, 0] + rng.uniform(-0.2, 0.2, len(picks))
+        self.lats = picks[:, 1] + rng.uniform(-0.2, 0.2, len(picks))
+        self.index = StationIndex(
+            np.arange(len(picks)), [f"S{i}" for i in range(len(picks))], rng.uniform(3, 4, len(picks)), self.lats, self.lngs
+        )
+        self.fetched = []
+
+    def _fake_fetch(self, cells, resolution=5):
+        self.fetched.append(len(cells))
+        buckets = {cell: [] for cell in cells}
+        for i, (lat, lng) in enumerate(zip(self.lats.tolist(), self.lngs.tolist())):
+            cell = h3.latlng_to_cell(lat, lng, resolution)
+            if cell in buckets:
+                buckets[cell].append((i, f"S{i}", float(self.index.prices[self.index.ids == i][0]), lat, lng))
+        return buckets
+
+    def test_matches_exact_corridor_lookup(self):
+        with mock.patch("app.h3_corridor._fetch_cells", side_effect=self._fake_fetch):
+            stations = stations_near_route_h3(self.route, 400.0)
+
+        expected = self.index.near_route(self.route, 400.0)
+        self.assertGreater(len(expected), 100)
+        self.assertEqual([s["id"] for s in stations], [s["id"] for s in expected])
+        self.assertEqual(stations[5]["mile_marker"], expected[5]["mile_marker"])
+
+    def test_overlapping_route_only_fetches_new_cells(self):
+        detour = self.route.copy()
+        detour[50:, 1] += 1.0
+
+        with mock.patch("app.h3_corridor._fetch_cells", side_effect=self._fake_fetch):
+            stations_near_route_h3(self.route, 400.0)
+            again = stations_near_route_h3(self.route, 400.0)
+            stations_near_route_h3(detour, 420.0)
+
+        self.assertTrue(again)
+        self.assertEqual(len(self.fetched), 2)
+        self.assertLess(self.fetched[1], len(corridor_cells(detour)) / 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _run_concurrently(self, compute, callers=8):
+        def read():
+            return cache.get("sf-test:value", MISS)
+
+        with concurrent.futures.ThreadPoolExecutor(callers) as pool:
+            futures = [pool.submit(single_flight, "sf-test", compute, read, 10, 5.0) for _ in range(callers)]
+            return [f.result() for f in futures]
+
+    def test_concurrent_callers_share_one_computation(self):
+        def compute():
+            with self.lock:
+                self.calls += 1
+            time.sleep(0.2)
+            cache.set("sf-test:value", "plan", 60)
+            return "plan"
+
+        self.assertEqual(self._run_concurrently(compute), ["plan"] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_waiters_take_over_when_leader_fails(self):
+        def compute():
+            with self.lock:
+                self.calls += 1
+                first = self.calls == 1
+            time.sleep(0.1)
+            if first:
+                raise RuntimeError("upstream down")
+            cache.set("sf-test:value", "plan", 60)
+            return "plan"
+
+        with self.assertRaises(RuntimeError):
+            self._run_concurrently(compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(cache.get("sf-test:value"), "plan")
+
+    def test_release_is_one_compare_and_delete_on_redis(self):
+        conn = mock.Mock()
+        fake_cache = mock.Mock()
+        fake_cache.client.make_key.return_value = "spotter_cache:1:sf:k"
+        fake_cache.client.encode.return_value = b"encoded-token"
+
+        with mock.patch("app.single_flight._redis", return_value=conn), \
+                mock.patch("app.single_flight.cache", fake_cache):
+            _release("sf:k", "token")
+
+        conn.eval.assert_called_once_with(_RELEASE_LUA, 1, "spotter_cache:1:sf:k", b"encoded-token")
+        fake_cache.get.assert_not_called()
+        fake_cache.delete.assert_not_called()
+
+    def test_release_keeps_another_leaders_lock(self):
+        cache.set("sf:k", "next-leader", 10)
+        _release("sf:k", "expired-leader")
+        self.assertEqual(cache.get("sf:k"), "next-leader")
+
+        _release("sf:k", "next-leader")
+        self.assertIsNone(cache.get("sf:k"))
+
+
+class DeadlineTests(SimpleTestCase):
+
+    def test_stage_timeout_is_clipped_to_remaining_budget(self):
+        self.assertEqual(stage_timeout(10), 10)
+        with deadline_scope(0.5):
+            self.assertLessEqual(stage_timeout(10), 0.5)
+        with deadline_scope(-1):
+            with self.assertRaises(DeadlineExceeded):
+                stage_timeout(10, "route")
+
+    def test_hedged_call_returns_first_success(self):
+        calls = []
+
+        def call(timeout):
+            calls.append(timeout)
+            time.sleep(0.5 if len(calls) == 1 else 0.01)
+            return len(calls)
+
+        started = time.monotonic()
+        self.assertEqual(hedged(call, timeout=2.0, hedge_after=0.05), 2)
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(hedged(lambda timeout: "solo", timeout=2.0, hedge_after=0), "solo")
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StaleWhileRevalidateTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        plan_cache.clear_local()
+
+    def test_stale_plan_is_served_and_refreshed_in_background(self):
+        key = _plan_key("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+        plan_cache.set_with_soft_ttl(key, ({"total_fuel_cost_usd": 42.0}, 200), -1, 60)
+
+        with mock.patch("app.tasks.tasks.refresh_route_plan.delay") as delay, \
+                mock.patch("app.services.compute_route_plan") as compute:
+            first = optimize_route("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+            second = optimize_route("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+
+        self.assertEqual(first, ({"total_fuel_cost_usd": 42.0}, 200))
+        self.assertEqual(second, first)
+        compute.assert_not_called()
+        delay.assert_called_once_with("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+
+    def test_fresh_plan_does_not_refresh(self):
+        key = _plan_key("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+        plan_cache.set_with_soft_ttl(key, ({}, 200), 60, 120)
+
+        with mock.patch("app.tasks.tasks.refresh_route_plan.delay") as delay:
+            optimize_route("Dallas, TX", "Tulsa, OK", "optimal", {}, "lite")
+        delay.assert_not_called()
+
+    def test_refresh_task_is_routed_to_a_consumed_queue(self):
+        # docker-compose workers consume only "maintenance" and "route_processing".
+        for task in (refresh_route_plan, process_fuel_upload, geocode_stations, warm_station_corridors):
+            route = celery_app.amqp.router.route({}, task.name)
+            self.assertEqual(route["queue"].name, "maintenance", task.name)
+        route = celery_app.amqp.router.route({}, process_route_job.name)
+        self.assertEqual(route["queue"].name, "route_processing")
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class NegativeCacheTests(SimpleTestCase):
+    START = "100 Negative Ave, Springfield"
+    END = "200 Negative Ave, Springfield"
+
+    def setUp(self):
+        cache.clear()
+        for tier in (geocode_cache, route_cache, plan_cache):
+            tier.clear_local()
+        self.key = _plan_key(self.START, self.END, "optimal", {}, "lite")
+
+    def _plan(self):
+        return compute_route_plan(self.START, self.END, "optimal", {}, "lite", key=self.key)
+
+    def test_geocoder_outage_returns_503_and_is_not_cached(self):
+        with mock.patch("app.services.session.get", side_effect=requests.ConnectionError()):
+            self.assertEqual(self._plan()[1], 503)
+        self.assertIs(plan_cache.get_with_staleness(self.key), MISS)
+        self.assertIs(geocode_cache.get(f"geo:{normalize_address(self.START)}"), MISS)
+
+        throttled = mock.Mock(status_code=429)
+        with mock.patch("app.services.session.get", return_value=throttled):
+            self.assertEqual(self._plan()[1], 503)
+        self.assertIs(plan_cache.get_with_staleness(self.key), MISS)
+
+    def test_geocoder_no_match_is_cached(self):
+        empty = mock.Mock(status_code=200)
+        empty.json.return_value = []
+        with mock.patch("app.services.session.get", return_value=empty):
+            self.assertEqual(self._plan()[1], 400)
+        self.assertEqual(plan_cache.get_with_staleness(self.key)[0][1], 400)
+
+    def test_routing_outage_returns_503_and_is_not_cached(self):
+        backend = mock.Mock()
+        backend.route.side_effect = RoutingUnavailable("OSRM circuit breaker is open")
+        with mock.patch("app.services.geocode_address", side_effect=[(32.77, -96.79), (35.47, -97.52)]), \
+                mock.patch("app.routing._backend", backend):
+            self.assertEqual(self._plan()[1], 503)
+        self.assertIs(plan_cache.get_with_staleness(self.key), MISS)
+
+        backend.route.side_effect = None
+        backend.route.return_value = None
+        with mock.patch("app.services.geocode_address", side_effect=[(32.77, -96.79), (35.47, -97.52)]), \
+                mock.patch("app.routing._backend", backend):
+            self.assertEqual(self._plan()[1], 404)
+        self.assertEqual(plan_cache.get_with_staleness(self.key)[0][1], 404)
+
+
+class BatchRouteTests(SimpleTestCase):
+
+    GEOS = {
+        "dallas, tx": (32.77, -96.79),
+        "denver, co": (39.74, -104.99),
+        "tulsa, ok": (36.15, -95.99),
+        "el paso, tx": (31.76, -106.49),
+    }
+
+    @staticmethod
+    def _pair(start, end, **extra):
+        return {"start": start, "end": end, "strategy": "optimal", "response_format": "lite", **extra}
+
+    def _geocode(self, address):
+        self.geocoded.append(address)
+        key = normalize_address(address)
+        if key == "atlantis, ga":
+            return None
+        if key == "boston, ma":
+            raise GeocodingUnavailable("geocoder down")
+        return self.GEOS[key]
+
+    def _route(self, *coords):
+        self.routed.append(coords)
+        if coords[2:] == self.GEOS["el paso, tx"]:
+            return None
+        # As fetch_route returns it: simplified once, when the route is fetched.
+        return with_simplified_polyline({"polyline": [[coords[1], coords[0]], [coords[3], coords[2]]], "distance_miles": 400.0})
+
+    def _run(self, pairs, **kwargs):
+        self.geocoded, self.routed = [], []
+        with mock.patch("app.batch.geocode_address", side_effect=self._geocode), \
+                mock.patch("app.batch.fetch_route", side_effect=self._route), \
+                mock.patch("app.batch.get_stations_near_route", return_value=[]) as corridor:
+            results = optimize_route_batch(pairs, max_workers=4, **kwargs)
+        return results, corridor
+
+    def test_addresses_routes_and_corridors_are_deduplicated(self):
+        pairs = [
+            self._pair("Dallas, TX", "Denver, CO"),
+            self._pair("dallas tx", "Denver, Colorado"),
+            self._pair("Dallas, Texas, USA", "Denver, CO", strategy="greedy"),
+            self._pair("Tulsa, OK", "Denver, CO"),
+        ]
+        results, corridor = self._run(pairs)
+
+        self.assertEqual(len(self.geocoded), 3)
+        self.assertEqual(len(self.routed), 2)
+        self.assertEqual(corridor.call_count, 2)
+        self.assertEqual([r["index"] for r in results], [0, 1, 2, 3])
+        self.assertEqual([r["result"]["fuel_strategy"] for r in results], ["optimal", "optimal", "greedy", "optimal"])
+
+    def test_routes_are_simplified_once_when_fetched(self):
+        pairs = [self._pair("Dallas, TX", "Denver, CO"), self._pair("Tulsa, OK", "Denver, CO", response_format="geojson")]
+        with mock.patch("app.services.simplify_route", wraps=simplify_route) as simplify:
+            results, corridor = self._run(pairs)
+
+        self.assertEqual(simplify.call_count, len(self.routed))
+        line = corridor.call_args.args[0]
+        self.assertEqual(line.coords[-1], (-104.99, 39.74))
+        self.assertIn("map", results[1]["result"])
+
+    def test_failures_are_isolated_per_pair_and_order_is_kept(self):
+        pairs = [
+            self._pair("Dallas, TX", "Atlantis, GA"),
+            self._pair("Dallas, TX", "Denver, CO"),
+            self._pair("Boston, MA", "Denver, CO"),
+            self._pair("Tulsa, OK", "El Paso, TX"),
+            self._pair("Tulsa, OK", "Denver, CO", mpg=0),
+        ]
+        streamed = []
+        results, _ = self._run(pairs, on_result=streamed.append)
+
+        self.assertEqual([r["index"] for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual([r.get("status") for r in results], [400, None, 503, 404, 500])
+        self.assertIn("result", results[1])
+        self.assertEqual(streamed, results)
+
+    def test_corridor_failure_fails_only_that_routes_pairs(self):
+        def corridor(line, *args, **kwargs):
+            if line.coords[-1] == (-104.99, 39.74):
+                raise ValueError("bad corridor")
+            return []
+
+        pairs = [self._pair("Dallas, TX", "Denver, CO"), self._pair("Tulsa, OK", "Dallas, TX")]
+        self.geocoded, self.routed = [], []
+        with mock.patch("app.batch.geocode_address", side_effect=self._geocode), \
+                mock.patch("app.batch.fetch_route", side_effect=self._route), \
+                mock.patch("app.batch.get_stations_near_route", side_effect=corridor):
+            results = optimize_route_batch(pairs, max_workers=4)
+
+        self.assertEqual([r.get("status") for r in results], [500, None])
+        self.assertIn("result", results[1])
+
+        with mock.patch("app.batch.geocode_address", side_effect=self._geocode), \
+                mock.patch("app.batch.fetch_route", side_effect=self._route), \
+                mock.patch("app.batch.get_stations_near_route", side_effect=OperationalError("connection lost")):
+            with self.assertRaises(OperationalError):
+                optimize_route_batch(pairs, max_workers=4)
+
+    def test_large_batches_are_queued_as_route_jobs(self):
+        job = mock.Mock(id="6f1c2a8e-4b6d-4a1e-9a57-0c2f3b8d9e10", status="PENDING")
+        body = {"pairs": [{"start": "Dallas, TX", "end": "Denver, CO"}] * 3}
+        request = RequestFactory().post("/api/route-optimize/batch/", body, content_type="application/json")
+
+        with mock.patch("app.views.BATCH_SYNC_MAX_PAIRS", 2), \
+                mock.patch("app.views.RouteJob.objects.create", return_value=job) as create, \
+                mock.patch("app.views.process_route_job.delay") as delay, \
+                mock.patch("app.views.optimize_route_batch") as batch:
+            response = RouteBatchOptimizeAPI.as_view()(request)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["job_id"], job.id)
+        self.assertEqual(create.call_args.kwargs["total_pairs"], 3)
+        delay.assert_called_once_with(job.id)
+        batch.assert_not_called()
+
+
+class RoutingBackendTests(SimpleTestCase):
+
+    def test_breaker_opens_then_half_opens(self):
+        breaker = CircuitBreaker(failures=2, reset_seconds=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_osrm_backend_retries_transient_errors(self):
+        backend = OSRMBackend(base_url="http://osrm.test", max_retries=2)
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = stub_route(-96.79, 32.77, -97.52, 35.47)
+
+        with mock.patch.object(backend.session, "get", side_effect=[requests.ConnectionError(), ok]) as get, \
+                mock.patch("app.routing.time.sleep"):
+            route = backend.route(32.77, -96.79, 35.47, -97.52)
+
+        self.assertEqual(get.call_count, 2)
+        self.assertTrue(get.call_args.args[0].startswith("http://osrm.test/route/v1/driving/"))
+        self.assertGreater(route["distance_miles"], 100)
+        self.assertEqual(backend.breaker.state, "closed")
+
+    def test_open_breaker_fails_fast(self):
+        backend = OSRMBackend(base_url="http://osrm.test", max_retries=1, breaker=CircuitBreaker(failures=2))
+        with mock.patch.object(backend.session, "get", side_effect=requests.ConnectionError()) as get, \
+                mock.patch("app.routing.time.sleep"):
+            with self.assertRaises(RoutingUnavailable):
+                backend.route(32.77, -96.79, 35.47, -97.52)
+            with self.assertRaisesMessage(RoutingUnavailable, "circuit breaker is open"):
+                backend.route(32.77, -96.79, 35.47, -97.52)
+        self.assertEqual(get.call_count, 2)
+
+    def test_only_definitive_osrm_misses_return_none(self):
+        self.assertIsNone(OSRMBackend._parse(400, {"code": "NoRoute"}))
+        self.assertIsNone(OSRMBackend._parse(200, {"code": "NoSegment"}))
+        for status, body in ((429, {"message": "Too Many Requests"}), (400, {"code": "InvalidQuery"}),
+                             (400, {"code": "TooBig"}), (200, {"code": "Ok", "routes": []}), (200, [])):
+            with self.subTest(status=status, body=body), self.assertRaises(RoutingUnavailable):
+                OSRMBackend._parse(status, body)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_throttled_route_is_not_cached_as_missing(self):
+        cache.clear()
+        route_cache.clear_local()
+        backend = OSRMBackend(base_url="http://osrm.test", max_retries=0)
+        throttled = mock.Mock(status_code=429)
+        throttled.json.return_value = {"message": "Too Many Requests"}
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = stub_route(-96.79, 32.77, -97.52, 35.47)
+
+        with mock.patch("app.routing._backend", backend), \
+                mock.patch.object(backend.session, "get", side_effect=[throttled, ok]):
+            with self.assertRaises(RoutingUnavailable):
+                fetch_route(32.77, -96.79, 35.47, -97.52)
+            route = fetch_route(32.77, -96.79, 35.47, -97.52)
+
+        self.assertGreater(route["distance_miles"], 100)
+
+    def test_stub_backend_is_deterministic(self):
+        backend = StubBackend()
+        first = backend.route(32.77, -96.79, 39.74, -104.99)
+        self.assertEqual(first, backend.route(32.77, -96.79, 39.74, -104.99))
+        self.assertEqual(first["polyline"][0], [-96.79, 32.77])
+        self.assertGreater(first["distance_miles"], 600)
+
+
+def _grid_roads(n=12, step=0.01, oneway_row=None):
+    """n x n street grid near Dallas as a GeoJSON FeatureCollection, one feature per row and column."""
+    features = []
+    for i in range(n):
+        row = [[-96.8 + j * step, 32.7 + i * step] for j in range(n)]
+        col = [[-96.8 + i * step, 32.7 + j * step] for j in range(n)]
+        props = {"oneway": "yes"} if i == oneway_row else {}
+        features.append({"type": "Feature", "properties": props, "geometry": {"type": "LineString", "coordinates": row}})
+        features.append({"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": col}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _dijkstra(graph, source, target):
+    indptr, indices, weights = graph.fwd
+    dist, heap = {source: 0.0}, [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u == target:
+            return d
+        if d > dist[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v, nd = int(indices[k]), d + weights[k]
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return None
+
+
+class RoadGraphTests(SimpleTestCase):
+
+    def _graph(self, **kwargs):
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson", delete=False) as f:
+            json.dump(_grid_roads(**kwargs), f)
+        self.addCleanup(os.unlink, f.name)
+        return RoadGraph.from_geojson(f.name)
+
+    def test_shared_vertices_become_one_node(self):
+        graph = self._graph(n=12)
+        self.assertEqual(len(graph), 144)
+        self.assertEqual(graph.edge_count, 2 * 2 * 12 * 11)
+
+    def test_bidirectional_astar_matches_dijkstra(self):
+        graph = self._graph(n=12, oneway_row=5)
+        rng = np.random.default_rng(7)
+        for source, target in rng.integers(0, len(graph), size=(25, 2)).tolist():
+            found = graph.shortest_path(source, target)
+            self.assertAlmostEqual(found[0], _dijkstra(graph, source, target), places=6)
+            self.assertEqual(found[1][0], source)
+            self.assertEqual(found[1][-1], target)
+
+    def test_oneway_edges_are_directed(self):
+        graph = self._graph(n=3, oneway_row=0)
+        west, east = graph.nearest_node(32.7, -96.8, 100)[0], graph.nearest_node(32.7, -96.78, 100)[0]
+        forward, backward = graph.shortest_path(west, east)[0], graph.shortest_path(east, west)[0]
+        detour = 2 * _haversine_m(32.7, -96.8, 32.71, -96.8)
+        self.assertAlmostEqual(backward, forward + detour, delta=1.0)
+
+    def test_route_shape_and_save_load_roundtrip(self):
+        graph = self._graph(n=12)
+        route = graph.route(32.7001, -96.7999, 32.8099, -96.6901, max_snap_m=500)
+        self.assertEqual(route["polyline"][0], [-96.8, 32.7])
+        self.assertEqual(route["polyline"][-1], [-96.69, 32.81])
+        self.assertAlmostEqual(route["distance_miles"], 2 * 11 * 0.01 * 69, delta=2)
+        self.assertIsNone(graph.route(35.0, -100.0, 32.8, -96.7, max_snap_m=500))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.npz")
+            graph.save(path)
+            loaded = RoadGraph.load(path)
+        self.assertEqual(loaded.route(32.7001, -96.7999, 32.8099, -96.6901, max_snap_m=500), route)
+
+    def test_graph_backend_falls_back_off_network(self):
+        fallback = StubBackend()
+        backend = GraphBackend(graph=self._graph(n=4), fallback=fallback, max_snap_m=500)
+        self.assertEqual(len(backend.route(32.7, -96.8, 32.73, -96.77)["polyline"]), 7)
+        self.assertEqual(backend.route(32.77, -96.79, 39.74, -104.99), fallback.route(32.77, -96.79, 39.74, -104.99))
+
+
+def _brute_force_cost(markers, prices, total_miles, tank, start_fuel, mpg):
+    """Exhaustive minimum cost over whole-gallon purchases; exact when every leg burns whole gallons."""
+    points = markers + [total_miles]
+
+    @functools.lru_cache(maxsize=None)
+    def best(i, fuel):
+        if i == len(markers):
+            return 0.0
+        need = (points[i + 1] - points[i]) // mpg
+        options = [
+            buy * prices[i] + best(i + 1, fuel + buy - need)
+            for buy in range(tank - fuel + 1)
+            if fuel + buy >= need
+        ]
+        return min(options, default=float("inf"))
+
+    if not markers:
+        return 0.0 if start_fuel * mpg >= total_miles else float("inf")
+    arrival = start_fuel - markers[0] // mpg
+    return best(0, arrival) if arrival >= 0 else float("inf")
+
+
+class FuelPlannerTests(SimpleTestCase):
+
+    @staticmethod
+    def _stations(markers, prices):
+        return [
+            {"id": i, "truckstop_name": f"S{i}", "retail_price": p, "mile_marker": m, "lat": 0.0, "lng": 0.0}
+            for i, (m, p) in enumerate(zip(markers, prices))
+        ]
+
+    def test_matches_brute_force_optimum(self):
+        rng = np.random.default_rng(11)
+        checked = 0
+        for _ in range(300):
+            mpg = 10
+            tank = int(rng.integers(3, 9))
+            total = int(rng.integers(1, 40)) * mpg
+            markers = sorted(int(m) * mpg for m in rng.integers(0, total // mpg + 1, size=int(rng.integers(0, 7))))
+            prices = [round(float(p), 3) for p in rng.uniform(3.0, 5.0, size=len(markers))]
+            start = int(rng.integers(0, tank + 1))
+
+            plan = plan_optimal_fuel_stops(self._stations(markers, prices), total, start, tank, 0, mpg)
+            expected = _brute_force_cost(markers, prices, total, tank, start, mpg)
+            self.assertEqual(plan["feasible"], expected != float("inf"), (markers, prices, total, tank, start))
+            if plan["feasible"]:
+                checked += 1
+                # The brute force only counts purchases; the start fuel is charged on top.
+                self.assertAlmostEqual(plan["total_cost"] - plan["start_fuel_cost"], expected, delta=0.02)
+        self.assertGreater(checked, 50)
+
+    def test_partial_fill_buys_only_enough_to_reach_cheaper_station(self):
+        stations = self._stations([100, 300], [4.0, 3.0])
+        plan = plan_optimal_fuel_stops(stations, 600, start_fuel_gallons=15, tank_capacity_gallons=50, mpg=10)
+        self.assertTrue(plan["feasible"])
+        self.assertEqual([(s["id"], s["gallons"]) for s in plan["stops"]], [(0, 15.0), (1, 30.0)])
+        # 15 gallons bought at 4.0 and 30 at 3.0, plus the 15 start gallons at 4.0 (the only price reachable on them).
+        self.assertEqual(plan["start_fuel_cost"], 60.0)
+        self.assertEqual(plan["total_cost"], 210.0)
+
+    def test_start_fuel_is_charged_like_greedys_first_leg(self):
+        stations = self._stations([100, 250], [3.2, 3.0])
+        optimal = plan_fuel_stops(stations, 300, "optimal")
+        greedy = plan_fuel_stops(stations, 300, "greedy")
+        # Within one tank: no purchases, but the 30 gallons burned still cost 30 * 3.0.
+        self.assertEqual(optimal, ([], 90.0, True))
+        self.assertEqual(greedy[1:], (90.0, True))
+
+    def test_gap_longer_than_range_is_infeasible_and_quotes_an_estimate(self):
+        stations = self._stations([100, 700], [3.0, 3.0])
+        plan = plan_optimal_fuel_stops(stations, 800, tank_capacity_gallons=50, mpg=10)
+        self.assertFalse(plan["feasible"])
+
+        for strategy in ("optimal", "greedy"):
+            _, cost, feasible = plan_fuel_stops(stations, 800, strategy, tank_capacity_gallons=50, mpg=10)
+            self.assertFalse(feasible)
+            self.assertEqual(cost, 280.0)
+
+    def test_empty_corridor(self):
+        stops, cost, feasible = plan_fuel_stops([], 900)
+        self.assertEqual((stops, feasible, cost), ([], False, 315.0))
+
+        # Within one tank the default start fuel covers the trip; with no station to price it,
+        # it is charged at the estimate, as greedy charges a trip without stops.
+        self.assertEqual(plan_fuel_stops([], 300), ([], 105.0, True))
+        self.assertEqual(plan_fuel_stops([], 300, "greedy"), ([], 105.0, True))
+        self.assertFalse(plan_fuel_stops([], 300, start_fuel_gallons=10)[2])
+
+    def test_payload_reports_infeasible_plans(self):
+        route = {"polyline": [[-96.79, 32.77], [-104.99, 39.74]], "distance_miles": 900.0}
+        payload = build_route_plan(route, (32.77, -96.79), (39.74, -104.99), "Dallas, TX", "Denver, CO",
+                                   stations=[], response_format="lite")
+        self.assertFalse(payload["feasible"])
+        self.assertEqual(payload["total_fuel_cost_usd"], 315.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class VehicleSweepTests(SimpleTestCase):
+
+    PROFILES = [
+        {"name": "day cab", "mpg": 7.5, "tank_capacity_gallons": 100},
+        {"name": "sleeper", "mpg": 6.0, "tank_capacity_gallons": 150, "reserve_gallons": 15},
+        {"mpg": 9.0, "tank_capacity_gallons": 60, "start_fuel_gallons": 20},
+        {},
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        coords, cls.miles = synthetic_route(seed=5, miles=1200)
+        index = StationIndex(*synthetic_stations(2000, seed=5, routes=[coords]))
+        cls.stations = locate_stations(index.near_route(coords[::50], cls.miles), coords, cls.miles)
+        cls.route = {"polyline": coords, "distance_miles": cls.miles}
+
+    def test_rows_match_per_request_planners(self):
+        for strategy in ("optimal", "greedy"):
+            rows = sweep_profiles(self.stations, self.miles, self.PROFILES, strategy)
+
+            for profile, row in zip(self.PROFILES, rows):
+                vehicle = {k: v for k, v in profile.items() if k != "name"}
+                stops, cost, feasible = plan_fuel_stops(self.stations, self.miles, strategy, **vehicle)
+                self.assertEqual(row["total_fuel_cost_usd"], cost)
+                self.assertEqual(row["feasible"], feasible)
+                self.assertEqual([s["id"] for s in row["stops"]], [s["id"] for s in stops])
+            self.assertTrue(all(r["stops"] for r in rows))
+            self.assertEqual([r["name"] for r in rows], ["day cab", "sleeper", "profile-3", "profile-4"])
+            self.assertEqual(rows[3]["range_miles"], 500.0)
+
+    def test_corridor_arrays_are_built_once_per_sweep(self):
+        with mock.patch("app.planner.next_cheaper_indices", wraps=next_cheaper_indices) as built:
+            rows = sweep_profiles(self.stations, self.miles, self.PROFILES * 5, "optimal")
+
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(built.call_count, 1)
+
+    def test_api_computes_route_and_corridor_once(self):
+        view = RouteSweepAPI.as_view()
+        body = {"start": "Dallas, TX", "end": "Denver, CO", "profiles": self.PROFILES}
+
+        with mock.patch("app.sweep.geocode_address", return_value=(32.77, -96.79)), \
+                mock.patch("app.sweep.fetch_route", return_value=self.route) as route, \
+                mock.patch("app.sweep.get_stations_near_route", return_value=self.stations) as corridor:
+            response = view(RequestFactory().post("/api/route-optimize/sweep/", body, content_type="application/json"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(route.call_count, 1)
+        self.assertEqual(corridor.call_count, 1)
+        self.assertEqual(len(response.data["profiles"]), len(self.PROFILES))
+        self.assertEqual(response.data["stations_in_corridor"], len(self.stations))
+
+    def test_api_rejects_invalid_profile(self):
+        body = {"start": "A", "end": "B", "profiles": [{"tank_capacity_gallons": 50, "reserve_gallons": 50}]}
+        response = RouteSweepAPI.as_view()(RequestFactory().post("/", body, content_type="application/json"))
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS=MEMORY_CHANNEL_LAYER)
+class RouteJobTests(SimpleTestCase):
+
+    JOB_ID = "6f1c2a8e-4b6d-4a1e-9a57-0c2f3b8d9e10"
+
+    def _communicator(self):
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/route-jobs/{self.JOB_ID}/")
+
+    def test_progress_publishes_every_entry_and_throttles_saves(self):
+        layer = get_channel_layer()
+        channel = asyncio.run(layer.new_channel())
+        asyncio.run(layer.group_add(job_group(self.JOB_ID), channel))
+
+        saves = []
+        progress = JobProgress(
+            self.JOB_ID, 5, lambda completed, entries: saves.append((completed, [e["index"] for e in entries])), save_seconds=3600
+        )
+        for index in range(3):
+            progress({"index": index, "result": {}})
+
+        async def drain():
+            return [await layer.receive(channel) for _ in range(3)]
+
+        messages = asyncio.run(drain())
+        self.assertEqual([m["completed"] for m in messages], [1, 2, 3])
+        self.assertEqual(messages[-1]["entry"], {"index": 2, "result": {}})
+        self.assertEqual(saves, [])
+
+        progress.save_seconds = 0
+        progress({"index": 3, "result": {}})
+        progress({"index": 4, "result": {}})
+        progress.flush()
+        # Each save carries only the entries finished since the previous one.
+        self.assertEqual(saves, [(4, [0, 1, 2, 3]), (5, [4])])
+
+    def _run_job(self, batch):
+        job = mock.Mock(id=self.JOB_ID, status="PENDING", pairs=[{}] * 3, total_pairs=3, error_message=None)
+        saves = []
+        with mock.patch("app.jobs.RouteJob.objects.get", return_value=job), \
+                mock.patch("app.jobs.RouteJobResult.objects.filter"), \
+                mock.patch("app.jobs._append_results", side_effect=lambda job_id, completed, entries: saves.append(completed)), \
+                mock.patch("app.jobs.publish"), \
+                mock.patch("app.jobs.optimize_route_batch", side_effect=batch):
+            status = run_route_job(self.JOB_ID)
+        return status, job, saves
+
+    def test_failed_pairs_do_not_fail_the_job(self):
+        def batch(pairs, on_result):
+            on_result({"index": 0, "result": {}})
+            on_result({"index": 1, "error": "Route not found", "status": 404})
+            on_result({"index": 2, "error": "An error occurred while processing this pair.", "status": 500})
+
+        status, job, saves = self._run_job(batch)
+        self.assertEqual(status, "COMPLETED")
+        self.assertEqual((job.completed_pairs, saves), (3, [3]))
+        self.assertIsNone(job.error_message)
+
+    def test_infrastructure_error_fails_the_job_and_keeps_finished_pairs(self):
+        def batch(pairs, on_result):
+            on_result({"index": 0, "result": {}})
+            raise OperationalError("connection lost")
+
+        status, job, saves = self._run_job(batch)
+        self.assertEqual(status, "FAILED")
+        self.assertEqual(job.error_message, "connection lost")
+        self.assertEqual((job.completed_pairs, saves), (1, [1]))
+
+    def test_websocket_streams_snapshot_then_updates_until_done(self):
+        snapshot = {"job_id": self.JOB_ID, "status": "RUNNING", "completed": 1, "total": 2, "results": [], "error": None}
+
+        async def scenario():
+            communicator = self._communicator()
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            first = await communicator.receive_json_from()
+
+            await asyncio.to_thread(publish, self.JOB_ID, {"status": "COMPLETED", "completed": 2, "total": 2})
+            update = await communicator.receive_json_from()
+            closed = await communicator.receive_output()
+            await communicator.disconnect()
+            return first, update, closed
+
+        with mock.patch("app.consumers.load_job_snapshot", return_value=snapshot):
+            first, update, closed = asyncio.run(scenario())
+
+        self.assertEqual(first["event"], "snapshot")
+        self.assertEqual(first["completed"], 1)
+        self.assertEqual((update["event"], update["status"], update["completed"]), ("progress", "COMPLETED", 2))
+        self.assertEqual(closed["type"], "websocket.close")
+
+    def test_websocket_rejects_unknown_job(self):
+        async def scenario():
+            communicator = self._communicator()
+            connected, _ = await communicator.connect()
+            return connected
+
+        with mock.patch("app.consumers.load_job_snapshot", return_value=None):
+            self.assertFalse(asyncio.run(scenario()))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StationGeocodingTests(SimpleTestCase):
+
+    PAIRS = [("KS", f"Nowhere {i:02d}") for i in range(7)]
+
+    def setUp(self):
+        cache.clear()
+        geocode_cache.clear_local()
+
+    def _pending(self, after=None, limit=100):
+        return [p for p in self.PAIRS if after is None or p > tuple(after)][:limit]
+
+    def test_token_bucket_allows_burst_then_paces(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(round(seconds, 6))
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+
+        self.assertEqual(sleeps, [0.5, 0.5])
+
+    def test_pipeline_resumes_from_checkpoint_after_crash(self):
+        written = []
+
+        def update(rows):
+            if len(written) == 1:
+                raise RuntimeError("worker killed")
+            written.append(rows)
+            return len(rows) * 2
+
+        def geocode(address):
+            return None if address.startswith("Nowhere 03") else (38.0, -98.0)
+
+        bucket = TokenBucket(rate=1000.0, capacity=1000)
+        with mock.patch("app.station_geocoding.pending_city_states", side_effect=self._pending), \
+                mock.patch("app.station_geocoding.gazetteer_geocode", return_value=None), \
+                mock.patch("app.station_geocoding.geocode_address", side_effect=geocode) as upstream, \
+                mock.patch("app.station_geocoding.bulk_update_locations", side_effect=update):
+            with self.assertRaises(RuntimeError):
+                run_geocode_pipeline(batch_size=3, max_workers=4, bucket=bucket)
+            self.assertEqual(cache.get("spotter:geocode:checkpoint"), {"after": ["KS", "Nowhere 02"]})
+
+            written.append(None)  # let the remaining batches through
+            stats = run_geocode_pipeline(batch_size=3, max_workers=4, bucket=bucket)
+
+        self.assertTrue(stats["finished"])
+        self.assertEqual((stats["pairs"], stats["resolved"], stats["unresolved"]), (4, 3, 1))
+        self.assertEqual(stats["stations_updated"], 6)
+        # Batch 2 ran twice (before and after the crash), except its remembered miss;
+        # batch 1 was never geocoded again.
+        self.assertEqual(upstream.call_count, 3 + 3 + 2 + 1)
+        self.assertEqual([row[0] for row in written[0]], ["Nowhere 00", "Nowhere 01", "Nowhere 02"])
+        self.assertIsNone(cache.get("spotter:geocode:checkpoint"))
+
+    def test_misses_are_not_retried_by_the_next_pass(self):
+        def geocode(address):
+            if address.startswith("Nowhere 01"):
+                raise GeocodingUnavailable("Geocoder returned HTTP 503")
+            return None if address.startswith("Nowhere 00") else (38.0, -98.0)
+
+        def pending(after=None, limit=100):
+            # Nothing is ever located, so every pass sees the same two pairs.
+            return self.PAIRS[:2] if after is None else []
+
+        bucket = TokenBucket(rate=1000.0, capacity=1000)
+        with mock.patch("app.station_geocoding.pending_city_states", side_effect=pending), \
+                mock.patch("app.station_geocoding.gazetteer_geocode", return_value=None), \
+                mock.patch("app.station_geocoding.geocode_address", side_effect=geocode) as upstream, \
+                mock.patch("app.station_geocoding.bulk_update_locations", return_value=0):
+            first = run_geocode_pipeline(batch_size=2, max_workers=2, bucket=bucket)
+            second = run_geocode_pipeline(batch_size=2, max_workers=2, bucket=bucket)
+
+        self.assertEqual((first["upstream_calls"], second["upstream_calls"]), (2, 1))
+        self.assertEqual([c.args[0] for c in upstream.call_args_list].count("Nowhere 01, KS"), 2)
+
+    def test_bulk_update_is_one_statement(self):
+        cursor = mock.MagicMock(rowcount=5)
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+        rows = [("Dallas", "TX", 32.7, -96.8), ("Tulsa", "OK", 36.1, -95.9)]
+
+        with mock.patch("app.station_geocoding.connection", connection), \
+                mock.patch("app.station_geocoding.transaction.atomic"):
+            self.assertEqual(bulk_update_locations(rows), 5)
+
+        sql, params = cursor.execute.call_args.args
+        self.assertEqual(cursor.execute.call_count, 1)
+        self.assertIn("FROM (VALUES (%s, %s, %s::float8, %s::float8), (%s, %s, %s::float8, %s::float8))", sql)
+        self.assertEqual(params, ["Dallas", "TX", 32.7, -96.8, "Tulsa", "OK", 36.1, -95.9])
+
+
+class BenchmarkSuiteTests(SimpleTestCase):
+
+    def test_synthetic_data_is_seeded(self):
+        route, miles = synthetic_route(seed=3, miles=100)
+        self.assertEqual(route, synthetic_route(seed=3, miles=100)[0])
+        self.assertAlmostEqual(miles, 100, delta=0.1)
+        self.assertGreater(len(route), 1500)
+
+        stations = synthetic_stations(500, seed=3, routes=[route])
+        self.assertEqual(stations, synthetic_stations(500, seed=3, routes=[route]))
+        self.assertEqual(len(stations[0]), 500)
+        self.assertTrue(all(2.5 <= p <= 6.0 for p in stations[2]))
+
+    def test_run_benchmarks_reports_every_stage(self):
+        results = run_benchmarks(sizes=(300,), repeat=1, miles=60)
+        for stage in ("build_route_line", "get_stations_near_route", "optimize_fuel_stops", "plan_optimal_fuel_stops",
+                      "calculate_fuel_cost", "build_geojson", "end_to_end"):
+            self.assertIn("median_ms", results["results"][f"{stage}@300"])
+        self.assertGreater(results["results"]["stations_found@300"]["count"], 0)
+        self.assertEqual(results["meta"]["station_lookup"], "in-process StationIndex")
+
+    def test_compare_to_baseline_flags_slowdowns_only(self):
+        baseline = {"results": {"a@1": {"median_ms": 10.0}, "b@1": {"median_ms": 10.0}, "tiny@1": {"median_ms": 0.001}}}
+        current = {"results": {
+            "a@1": {"median_ms": 13.0},
+            "b@1": {"median_ms": 11.0},
+            "tiny@1": {"median_ms": 0.01},
+            "new@1": {"median_ms": 50.0},
+        }}
+        self.assertEqual(compare_to_baseline(current, baseline, threshold=0.25), [("a@1", 10.0, 13.0)])
+
+    def test_committed_baseline_covers_every_stage(self):
+        baseline = load_results(BENCHMARK_BASELINE_PATH)
+        for stage in STAGES:
+            for size in (1_000, 10_000, 100_000):
+                self.assertIn(f"{stage}@{size}", baseline["results"])
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+
+    def test_stub_injects_latency_and_failures(self):
+        with StubServer(latency=0.05, failure_rate=1.0, seed=1) as stub:
+            start = time.perf_counter()
+            resp = requests.get(f"{stub.url}/search", params={"q": "Dallas"}, timeout=5)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(stub.failures, 1)
+
+    def test_replay_is_open_loop_at_target_rate(self):
+        with StubServer(latency=0.02) as stub:
+            records, elapsed = asyncio.run(replay(stub.url, [{"start": "a", "end": "b"}], rps=50, duration=0.5))
+        summary = summarize(records, elapsed)
+
+        self.assertEqual(summary["requests"], 25)
+        self.assertEqual(summary["statuses"], {"404": 25})
+        self.assertAlmostEqual(elapsed, 0.5, delta=0.3)
+        self.assertGreaterEqual(summary["latency_ms"]["p50"], 20)
+        self.assertEqual(sum(b["count"] for b in summary["histogram"]), 25)
+        self.assertIsNone(summary["cache_hit_rate"])
+
+    def test_synthetic_inputs(self):
+        traffic = synthetic_traffic(pairs=20, distinct_addresses=5)
+        self.assertTrue(all(body["start"] != body["end"] for body in traffic))
+        rows = synthetic_fuel_csv(rows=3).decode().splitlines()
+        self.assertEqual(rows[0].split(","), REQUIRED_COLUMNS)
+        self.assertEqual(len(rows), 4)
+
+    def test_upload_scenario_needs_opt_in_for_a_live_target(self):
+        with mock.patch("app.management.commands.loadtest.replay") as replay_mock:
+            with self.assertRaisesMessage(CommandError, "--allow-writes"):
+                call_command("loadtest", scenario="upload", target="http://staging:8000")
+        replay_mock.assert_not_called()
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_request_stats_headers(self):
+        def view(request):
+            geocode_cache.get("geo:stats-test")
+            return HttpResponse("ok")
+
+        with mock.patch("app.middleware.LOADTEST_STATS", True):
+            response = RequestStatsMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(response["X-DB-Queries"], "0")
+        self.assertEqual(response["X-Cache-Hits"], "0")
+        self.assertEqual(response["X-Cache-Misses"], "1")
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_lists_stages_and_total(self):
+        def view(request):
+            with timed("geocode"):
+                time.sleep(0.01)
+            with timed("route"):
+                pass
+            return HttpResponse("ok")
+
+        response = ServerTimingMiddleware(view)(RequestFactory().get("/api/route-optimize/"))
+        entries = [e.split(";")[0] for e in response["Server-Timing"].split(", ")]
+        self.assertEqual(entries, ["geocode", "route", "total"])
+        self.assertGreaterEqual(float(response["Server-Timing"].split(", ")[0].split("dur=")[1]), 10)
+
+    def test_prometheus_histograms_are_cumulative(self):
+        local = MetricsRegistry(key="metrics:test")
+        local.observe("spotter_stage_duration_seconds", 0.003, stage="map")
+        local.observe("spotter_stage_duration_seconds", 0.2, stage="map")
+        local.inc("spotter_upstream_requests_total", upstream="osrm", outcome="error")
+        text = render_prometheus(local.totals())
+
+        self.assertIn("# TYPE spotter_stage_duration_seconds histogram", text)
+        self.assertIn('spotter_stage_duration_seconds_bucket{stage="map",le="0.005"} 1', text)
+        self.assertIn('spotter_stage_duration_seconds_bucket{stage="map",le="0.25"} 2', text)
+        self.assertIn('spotter_stage_duration_seconds_bucket{stage="map",le="+Inf"} 2', text)
+        self.assertIn('spotter_stage_duration_seconds_count{stage="map"} 2', text)
+        self.assertIn('spotter_upstream_requests_total{outcome="error",upstream="osrm"} 1', text)
+
+    def test_prometheus_buckets_follow_le_order(self):
+        local = MetricsRegistry(key="metrics:test")
+        for stage in ("route", "geocode"):
+            local.observe("spotter_stage_duration_seconds", 3.0, stage=stage)
+            local.observe("spotter_stage_duration_seconds", 12.0, stage=stage)
+        lines = render_prometheus(local.totals()).splitlines()
+
+        geocode = [line for line in lines if line.startswith('spotter_stage_duration_seconds_bucket{stage="geocode"')]
+        self.assertEqual([line.split('le="')[1].split('"')[0] for line in geocode], [str(b) for b in BUCKETS] + ["+Inf"])
+        counts = [float(line.rsplit(" ", 1)[1]) for line in geocode]
+        self.assertEqual(counts, sorted(counts))
+        # Each series is complete (buckets, count, sum) before the next begins.
+        series = [line.split("{")[1].split(",")[0].split("}")[0] for line in lines if not line.startswith("#")]
+        self.assertEqual(series, ['stage="geocode"'] * 15 + ['stage="route"'] * 15)
+
+    def test_metrics_endpoint_is_restricted(self):
+        factory = RequestFactory()
+        self.assertEqual(metrics_view(factory.get("/metrics")).status_code, 200)
+        self.assertEqual(metrics_view(factory.get("/metrics", REMOTE_ADDR="203.0.113.9")).status_code, 403)
+
+        with mock.patch("app.metrics.METRICS_TOKEN", "s3cret"):
+            remote = factory.get("/metrics", REMOTE_ADDR="203.0.113.9", HTTP_AUTHORIZATION="Bearer s3cret")
+            self.assertEqual(metrics_view(remote).status_code, 200)
+            wrong = factory.get("/metrics", REMOTE_ADDR="203.0.113.9", HTTP_AUTHORIZATION="Bearer nope")
+            self.assertEqual(metrics_view(wrong).status_code, 403)
+
+    def test_upstream_and_cache_counters(self):
+        backend = OSRMBackend(base_url="http://osrm.test", max_retries=1)
+        ok = mock.Mock(status_code=200)
+        ok.json.return_value = stub_route(-96.79, 32.77, -97.52, 35.47)
+        with mock.patch.object(backend.session, "get", side_effect=[requests.ConnectTimeout(), ok]), \
+                mock.patch("app.routing.time.sleep"):
+            backend.route(32.77, -96.79, 35.47, -97.52)
+
+        route_cache.get("metrics-test-missing")
+        totals = registry.totals()
+        self.assertEqual(totals["spotter_upstream_requests_total|outcome=timeout,upstream=osrm"], 1)
+        self.assertEqual(totals["spotter_upstream_requests_total|outcome=ok,upstream=osrm"], 1)
+        self.assertEqual(totals["spotter_cache_lookups_total|cache=route,result=miss,tier=redis"], 1)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+
+class StructuredLoggingTests(SimpleTestCase):
+
+    def _capture(self, name):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        log = logging.getLogger(name)
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+        return records
+
+    def test_info_log_uses_caller_module_logger_and_line(self):
+        records = self._capture("app.tests")
+        line = sys._getframe().f_lineno + 1
+        helper.handle_info_log("hello", view_name="v", app_name="app", extra_values={"n": 1})
+
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record.name, "app.tests")
+        self.assertEqual(record.caller_line, line)
+        self.assertEqual(record.caller_file, os.path.abspath(__file__))
+
+        payload = json.loads(helper.JsonFormatter().format(record))
+        self.assertEqual(payload["message"], "hello")
+        self.assertEqual(payload["view"], "v")
+        self.assertEqual(payload["extra_values"], {"n": 1})
+        self.assertEqual(payload["line"], line)
+
+    def test_error_log_carries_traceback(self):
+        records = self._capture("app.tests")
+        try:
+            raise ValueError("boom")
+        except ValueError as e:
+            helper.handle_error_log(e, view_name="v", app_name="app")
+        payload = json.loads(helper.JsonFormatter().format(records[0]))
+        self.assertEqual(payload["level"], "ERROR")
+        self.assertIn("ValueError: boom", payload["exc"])
+
+    def test_sampling_is_per_logger(self):
+        rates = helper._parse_sample_rates("app=0.5, app.tests=0 ,bad")
+        self.assertEqual(rates, {"app": 0.5, "app.tests": 0.0})
+
+        with mock.patch.object(helper, "_sample_rates", rates), mock.patch.object(helper, "_rate_cache", {}):
+            self.assertEqual(helper._sample_rate("app.tests"), 0.0)
+            self.assertEqual(helper._sample_rate("app.services"), 0.5)
+            self.assertEqual(helper._sample_rate("other"), 1.0)
+
+            records = self._capture("app.tests")
+            for _ in range(20):
+                helper.handle_info_log("dropped", view_name="v", app_name="app")
+        self.assertEqual(records, [])
+
+    def test_queue_handler_keeps_exception_for_the_writer(self):
+        log_queue = queue.Queue(maxsize=1)
+        handler = helper._DroppingQueueHandler(log_queue)
+        try:
+            raise KeyError("k")
+        except KeyError:
+            record = logging.LogRecord("app", logging.ERROR, __file__, 1, "failed %s", ("x",), sys.exc_info())
+        handler.emit(record)
+        handler.emit(record)  # queue full: dropped, not blocking
+
+        queued = log_queue.get_nowait()
+        self.assertEqual(queued.getMessage(), "failed x")
+        self.assertIsNotNone(queued.exc_info)
+        self.assertTrue(log_queue.empty())
@@ -0,0 +1,216 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from .constants import (
+    LOCAL_CACHE_MAX_BYTES,
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_CACHE_TTL,
+    NEGATIVE_CACHE_TTL,
+)
+from .metrics import count_cache
+
+MISS = object()
+NEGATIVE = "__spotter_negative__"
+
+_STAT_NAMES = (
+    "local_hits",
+    "local_misses",
+    "redis_hits",
+    "redis_misses",
+    "negative_hits",
+    "local_evictions",
+)
+
+
+def _is_negative(value):
+    return isinstance(value, str) and value == NEGATIVE
+
+
+class TieredCache:
+    """
+    Bounded per-process LRU/TTL layer in front of the shared Redis cache.
+
+    get() returns MISS when neither tier has the key and None for a cached
+    negative result (set with set_negative), so callers can tell "we asked
+    and there is nothing" apart from "we have not asked yet". Local entries
+    live at most LOCAL_CACHE_TTL seconds so other workers' writes show up.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_entries: int = LOCAL_CACHE_MAX_ENTRIES,
+            max_bytes: int = LOCAL_CACHE_MAX_BYTES,
+            local_ttl: int = LOCAL_CACHE_TTL,
+            negative_ttl: int = NEGATIVE_CACHE_TTL,
+        ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.local_ttl = local_ttl
+        self.negative_ttl = negative_ttl
+
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(_STAT_NAMES, 0)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _unwrap(self, value):
+        if _is_negative(value):
+            self._count("negative_hits")
+            return None
+        return value
+
+    def _get_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self._stats["local_hits"] += 1
+                    count_cache(self.name, "local", "hit")
+                    return value
+                del self._data[key]
+                self._bytes -= size
+            self._stats["local_misses"] += 1
+        return MISS
+
+    def _set_local(self, key, value, ttl):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes // 4:
+            return
+
+        expires_at = time.monotonic() + min(ttl or self.local_ttl, self.local_ttl)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["local_evictions"] += 1
+
+    def _from_redis(self, key, value):
+        if value is MISS:
+            self._count("redis_misses")
+            count_cache(self.name, "redis", "miss")
+            return MISS
+        self._count("redis_hits")
+        count_cache(self.name, "redis", "hit")
+        ttl = self.negative_ttl if _is_negative(value) else self.local_ttl
+        self._set_local(key, value, ttl)
+        return self._unwrap(value)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not MISS:
+            return self._unwrap(value)
+        return self._from_redis(key, cache.get(key, MISS))
+
+    async def aget(self, key):
+        value = self._get_local(key)
+        if value is not MISS:
+            return self._unwrap(value)
+        return self._from_redis(key, await cache.aget(key, MISS))
+
+    def get_many(self, keys) -> dict:
+        """Returns {key: value} for every key found in either tier (one Redis MGET for the rest)."""
+        found, remote = {}, []
+        for key in keys:
+            value = self._get_local(key)
+            if value is MISS:
+                remote.append(key)
+            else:
+                found[key] = self._unwrap(value)
+
+        if remote:
+            fetched = cache.get_many(remote)
+            for key in remote:
+                value = self._from_redis(key, fetched.get(key, MISS))
+                if value is not MISS:
+                    found[key] = value
+        return found
+
+    def set(self, key, value, ttl):
+        cache.set(key, value, ttl)
+        self._set_local(key, value, ttl)
+
+    def set_many(self, mapping: dict, ttl):
+        cache.set_many(mapping, ttl)
+        for key, value in mapping.items():
+            self._set_local(key, value, ttl)
+
+    async def aset(self, key, value, ttl):
+        await cache.aset(key, value, ttl)
+        self._set_local(key, value, ttl)
+
+    def get_with_staleness(self, key):
+        """
+        For entries written with set_with_soft_ttl: (value, is_stale), or MISS.
+        Entries are stale after their soft TTL and vanish after the hard TTL.
+        """
+        entry = self.get(key)
+        if entry is MISS or entry is None:
+            return MISS
+        fresh_until, value = entry
+        return value, time.time() > fresh_until
+
+    async def aget_with_staleness(self, key):
+        entry = await self.aget(key)
+        if entry is MISS or entry is None:
+            return MISS
+        fresh_until, value = entry
+        return value, time.time() > fresh_until
+
+    def set_with_soft_ttl(self, key, value, soft_ttl, hard_ttl):
+        # Wall-clock time: the soft deadline is compared in other processes.
+        self.set(key, (time.time() + soft_ttl, value), max(soft_ttl, hard_ttl))
+
+    async def aset_with_soft_ttl(self, key, value, soft_ttl, hard_ttl):
+        await self.aset(key, (time.time() + soft_ttl, value), max(soft_ttl, hard_ttl))
+
+    def set_negative(self, key, ttl=None):
+        self.set(key, NEGATIVE, ttl or self.negative_ttl)
+
+    async def aset_negative(self, key, ttl=None):
+        await self.aset(key, NEGATIVE, ttl or self.negative_ttl)
+
+    def clear_local(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["local_entries"] = len(self._data)
+            stats["local_bytes"] = self._bytes
+        lookups = stats["local_hits"] + stats["local_misses"]
+        stats["local_hit_rate"] = round(stats["local_hits"] / lookups, 4) if lookups else 0.0
+        redis_lookups = stats["redis_hits"] + stats["redis_misses"]
+        stats["redis_hit_rate"] = round(stats["redis_hits"] / redis_lookups, 4) if redis_lookups else 0.0
+        return stats
+
+
+geocode_cache = TieredCache("geocode", max_entries=20000, max_bytes=8 * 1024 * 1024)
+route_cache = TieredCache("route")
+stations_cache = TieredCache("stations")
+plan_cache = TieredCache("plan")
+
+
+def cache_stats() -> dict:
+    """Per-tier hit/miss counters for every shared cache in this process."""
+    return {c.name: c.stats() for c in (geocode_cache, route_cache, stations_cache, plan_cache)}
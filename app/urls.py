@@ -2,10 +2,16 @@ from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path
-from app.views import FuelUploadView, RouteOptimizeAPI
+from app.views import FuelUploadView, RouteOptimizeAPI, RouteBatchOptimizeAPI, RouteSweepAPI, AsyncRouteOptimizeView
+from app.views import RouteJobAPI, RouteJobStatusAPI
 
 urlpatterns = [
     path('upload-fuel-data/', FuelUploadView.as_view(), name='upload-fuel-data'),
     path('route-optimize/', RouteOptimizeAPI.as_view(), name='route-optimize'),
+    path('route-optimize/batch/', RouteBatchOptimizeAPI.as_view(), name='route-optimize-batch'),
+    path('route-optimize/sweep/', RouteSweepAPI.as_view(), name='route-optimize-sweep'),
+    path('route-jobs/', RouteJobAPI.as_view(), name='route-jobs'),
+    path('route-jobs/<uuid:job_id>/', RouteJobStatusAPI.as_view(), name='route-job-status'),
+    path('route-optimize/async/', AsyncRouteOptimizeView.as_view(), name='route-optimize-async'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) \
   + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
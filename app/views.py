@@ -1,18 +1,29 @@
 from rest_framework.response import Response
 from app.helper import handle_error_log, handle_info_log
+import asyncio
 import inspect
+import json
 import uuid
-import concurrent.futures
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
-from app.tasks.tasks import process_fuel_upload
-from app.models import FuelPriceUpload
-from app.constants import APP_NAME
-from app.serializers import RouteRequestSerializer
-from app.services import ( geocode_address, fetch_route, build_route_line, get_stations_near_route, 
-                          optimize_fuel_stops, calculate_fuel_cost, build_geojson,)
+from app.tasks.tasks import process_fuel_upload, process_route_job
+from app.models import FuelPriceUpload, RouteJob
+from app.jobs import load_job_snapshot
+from app.constants import APP_NAME, BATCH_SYNC_MAX_PAIRS, ROUTE_REQUEST_BUDGET_SECONDS
+from app.deadlines import DeadlineExceeded, deadline_scope
+from app.serializers import RouteRequestSerializer, RouteBatchRequestSerializer, RouteSweepRequestSerializer
+from app.services import optimize_route
+from app.batch import optimize_route_batch
+from app.sweep import sweep_route
+from app.async_services import aoptimize_route
+from app.renderers import ORJSONRenderer, json_response
 
 
 
@@ -44,6 +55,7 @@ class FuelUploadView(APIView):
 
 
 class RouteOptimizeAPI(APIView):
+    renderer_classes = [ORJSONRenderer]
 
     def get(self, request):
         view_name = inspect.currentframe().f_code.co_name
@@ -51,41 +63,176 @@ class RouteOptimizeAPI(APIView):
             serializer = RouteRequestSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
 
-            start_address = serializer.validated_data["start"]
-            end_address = serializer.validated_data["end"]
+            with deadline_scope(ROUTE_REQUEST_BUDGET_SECONDS):
+                payload, status_code = optimize_route(
+                    serializer.validated_data["start"],
+                    serializer.validated_data["end"],
+                    strategy=serializer.validated_data["strategy"],
+                    vehicle=serializer.vehicle_options(),
+                    response_format=serializer.validated_data["response_format"],
+                )
+            return Response(payload, status=status_code)
+        except DeadlineExceeded as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return Response({"error": "Upstream services are too slow; please retry."}, status=504)
+        except Exception as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return Response({"error": "An error occurred while processing the request."}, status=500)
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                f_start = executor.submit(geocode_address, start_address)
-                f_end = executor.submit(geocode_address, end_address)
-                start_geo = f_start.result()
-                end_geo = f_end.result()
 
-            if not start_geo:
-                return Response({"error": f"Could not geocode: {start_address}"}, status=400)
-            if not end_geo:
-                return Response({"error": f"Could not geocode: {end_address}"}, status=400)
 
-            route = fetch_route(start_geo[0], start_geo[1], end_geo[0], end_geo[1])
-            if not route:
-                return Response({"error": "Route not found"}, status=404)
+def _queue_route_job(request, pairs):
+    """Creates a RouteJob for pairs, queues it on route_processing and returns the 202 response."""
+    job = RouteJob.objects.create(pairs=pairs, total_pairs=len(pairs))
+    process_route_job.delay(str(job.id))
 
-            polyline = route["polyline"]
-            total_miles = route["distance_miles"]
+    return Response(
+        {
+            "job_id": str(job.id),
+            "status": job.status,
+            "status_url": request.build_absolute_uri(reverse("route-job-status", args=[job.id])),
+            "websocket_url": f"/ws/route-jobs/{job.id}/",
+        },
+        status=status.HTTP_202_ACCEPTED
+    )
 
-            route_line = build_route_line(polyline)
-            stations = get_stations_near_route(route_line, total_miles)
-            stops = optimize_fuel_stops(stations, total_miles)
-            cost = calculate_fuel_cost(stops, total_miles)
-            geojson = build_geojson(polyline, stops, start_geo, end_geo, start_address, end_address)
+
+class RouteBatchOptimizeAPI(APIView):
+    """
+    Plans up to BATCH_SYNC_MAX_PAIRS pairs inside the request. Larger
+    batches are queued as a route job and answered like /api/route-jobs/.
+    """
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request):
+        view_name = inspect.currentframe().f_code.co_name
+        serializer = RouteBatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            pairs = serializer.validated_data["pairs"]
+            if len(pairs) > BATCH_SYNC_MAX_PAIRS:
+                return _queue_route_job(request, pairs)
+
+            results = optimize_route_batch(pairs)
+            failed = sum(1 for r in results if "error" in r)
 
             return Response({
-                "start": start_address,
-                "end": end_address,
-                "total_distance_miles": round(total_miles, 2),
-                "total_fuel_cost_usd": cost,
-                "optimized_stops": stops,
-                "map": geojson
+                "count": len(results),
+                "succeeded": len(results) - failed,
+                "failed": failed,
+                "results": results,
             })
         except Exception as e:
             handle_error_log(str(e), view_name, app_name=APP_NAME)
             return Response({"error": "An error occurred while processing the request."}, status=500)
+
+
+
+class RouteJobAPI(APIView):
+    """
+    Queues a batch of pairs (same body as /api/route-optimize/batch/) for the
+    route_processing workers and returns at once. Progress is polled from
+    the status URL or streamed from the WebSocket URL.
+    """
+
+    def post(self, request):
+        view_name = inspect.currentframe().f_code.co_name
+        serializer = RouteBatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return _queue_route_job(request, serializer.validated_data["pairs"])
+        except Exception as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return Response({"error": "An error occurred while processing the request."}, status=500)
+
+
+class RouteJobStatusAPI(APIView):
+    renderer_classes = [ORJSONRenderer]
+
+    def get(self, request, job_id):
+        snapshot = load_job_snapshot(job_id)
+        if snapshot is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(snapshot)
+
+
+
+class RouteSweepAPI(APIView):
+    """
+    One route, many vehicle profiles: the route and station corridor are
+    computed once and every profile is planned against them.
+    """
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request):
+        view_name = inspect.currentframe().f_code.co_name
+        serializer = RouteSweepRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with deadline_scope(ROUTE_REQUEST_BUDGET_SECONDS):
+                payload, status_code = sweep_route(
+                    serializer.validated_data["start"],
+                    serializer.validated_data["end"],
+                    serializer.validated_data["profiles"],
+                    strategy=serializer.validated_data["strategy"],
+                )
+            return Response(payload, status=status_code)
+        except DeadlineExceeded as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return Response({"error": "Upstream services are too slow; please retry."}, status=504)
+        except Exception as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return Response({"error": "An error occurred while processing the request."}, status=500)
+
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncRouteOptimizeView(View):
+    """
+    Same contract as RouteOptimizeAPI, served natively under ASGI so one
+    worker can hold many slow geocoder/OSRM calls in flight.
+    """
+
+    async def get(self, request):
+        return await self._optimize(request)
+
+    async def post(self, request):
+        return await self._optimize(request)
+
+    async def _optimize(self, request):
+        view_name = inspect.currentframe().f_code.co_name
+        try:
+            if request.body:
+                data = json.loads(request.body)
+            else:
+                data = request.GET.dict()
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+        serializer = RouteRequestSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        try:
+            with deadline_scope(ROUTE_REQUEST_BUDGET_SECONDS):
+                async with asyncio.timeout(ROUTE_REQUEST_BUDGET_SECONDS):
+                    payload, status_code = await aoptimize_route(
+                        serializer.validated_data["start"],
+                        serializer.validated_data["end"],
+                        serializer.validated_data["strategy"],
+                        serializer.vehicle_options(),
+                        serializer.validated_data["response_format"],
+                    )
+            return json_response(payload, status=status_code)
+        except (DeadlineExceeded, TimeoutError) as e:
+            handle_error_log(str(e) or "Deadline exceeded", view_name, app_name=APP_NAME)
+            return JsonResponse({"error": "Upstream services are too slow; please retry."}, status=504)
+        except Exception as e:
+            handle_error_log(str(e), view_name, app_name=APP_NAME)
+            return JsonResponse({"error": "An error occurred while processing the request."}, status=500)
@@ -5,11 +5,18 @@ python manage.py wait_for_db
 
 
 echo " Applying migrations..."
-python manage.py makemigrations
 python manage.py migrate
 
+echo " Fetching the national places gazetteer..."
+python manage.py fetch_gazetteer --if-missing || echo " Gazetteer download failed; using the bundled places list"
+
 echo " Collecting static files..."
 python manage.py collectstatic --noinput
 
+if [ "$APP_SERVER" = "asgi" ]; then
+    echo "Starting Gunicorn server (ASGI, uvicorn workers)..."
+    exec gunicorn spotter.asgi:application -k uvicorn_worker.UvicornWorker --bind 0.0.0.0:8000
+fi
+
 echo "Starting Gunicorn server..."
 exec gunicorn spotter.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
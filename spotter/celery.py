@@ -23,21 +23,26 @@ app.conf.task_reject_on_worker_lost = True
 
 app.conf.task_queues = (
     Queue("celery"),
-    # Queue("route_processing"),
+    Queue("route_processing"),
     Queue("maintenance"),
 )
 app.conf.task_default_queue = "celery"
 
 app.autodiscover_tasks()
-CELERY_TASK_ROUTES = {
+app.conf.task_routes = {
     "app.tasks.tasks.process_fuel_upload": {"queue": "maintenance"},
+    "app.tasks.tasks.refresh_route_plan": {"queue": "maintenance"},
     "app.tasks.tasks.geocode_stations": {"queue": "maintenance"},
+    "app.tasks.tasks.warm_station_corridors": {"queue": "maintenance"},
+    "app.tasks.tasks.process_route_job": {"queue": "route_processing"},
 }
 
 app.conf.beat_schedule = {
-    "geocode-every-10-seconds": {
+    # Uploads queue geocoding as soon as they commit; this only catches
+    # stations left behind by a failed or interrupted run.
+    "geocode-pending-stations": {
         "task": "app.tasks.tasks.geocode_stations",
-        "schedule": 10.0,  # every 10 seconds
+        "schedule": 300.0,  # every 5 minutes
         "options": {"queue": "maintenance"},
     },
 }
\ No newline at end of file
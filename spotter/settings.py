@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CompressionMiddleware',
+    'app.middleware.RequestStatsMiddleware',
+    'app.metrics.ServerTimingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -188,7 +191,10 @@ LOGGING = {
         'standard': {
             'format': "[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s] [%(AppName)s] %(message)s",
             'datefmt': "%d-%b-%Y %H:%M:%S"
-        }
+        },
+        'json': {
+            '()': 'app.helper.JsonFormatter',
+        },
     },
     'filters': {
         'require_debug_false': {
@@ -202,7 +208,7 @@ LOGGING = {
             'filename': APP_LOG_FILENAME,
             'maxBytes': LOGFILE_SIZE,
             'backupCount': LOGFILE_COUNT,
-            'formatter': 'standard',
+            'formatter': 'json',
             'encoding': 'utf-8',
         },
         'errorlog': {
@@ -211,7 +217,7 @@ LOGGING = {
             'filename': ERROR_LOG_FILENAME,
             'maxBytes': LOGFILE_SIZE,
             'backupCount': LOGFILE_COUNT,
-            'formatter': 'standard',
+            'formatter': 'json',
             'encoding': 'utf-8',
         },
         'sensitivelog': {